@@ -0,0 +1,294 @@
+'''
+This file contains the benchmark harness. It times every metric per backend on synthetic
+version chains and on the bundled subsets, and appends one row per measurement (wall time,
+peak RSS, triples per second) to a CSV file, so runs before and after a change can be
+compared with compare().
+
+    python benchmark.py --triples 10000 100000 --versions 3 --churn 0.05
+'''
+
+#! Imports
+import argparse
+import multiprocessing
+import os
+import resource
+import subprocess
+import time
+from queue import Empty
+
+import numpy as np
+import pandas as pd
+
+import ntriples as nt
+import presence as pr
+import queries as que
+import snapshot as sn
+import tracing
+from executor import sparql_factory
+
+#-----------------------------------------------------------------------------
+
+#! Synthetic version chains
+
+def synthetic_chain(directory, triples= 10000, versions= 3, churn= 0.05, predicates= 50, literal_share= 0.3, seed= 0):
+
+    #Writes versions v0.nt ... and returns their paths. Every version removes and adds
+    #churn * triples triples of the one before; subjects and objects follow a Zipf-like
+    #distribution so there are hubs, as in the real dumps
+    rng = np.random.default_rng(seed)
+    os.makedirs(directory, exist_ok= True)
+
+    entities = max(triples // 5, 10)
+
+    def sample(n):
+        s = np.minimum(rng.zipf(1.5, n) - 1, entities - 1)
+        p = rng.integers(0, predicates, n)
+        o = np.minimum(rng.zipf(1.5, n) - 1, entities - 1)
+        literal = rng.random(n) < literal_share
+
+        #A triple is encoded as one integer, the lowest bit marks a literal object
+        return (s.astype(np.int64) * predicates + p) * entities * 2 + o * 2 + literal
+
+    def draw(n, exclude):
+
+        #n distinct triples that are not in exclude
+        keys = np.empty(0, dtype= np.int64)
+
+        while len(keys) < n:
+            keys = np.setdiff1d(np.union1d(keys, sample(2 * (n - len(keys)))), exclude)
+
+        return rng.choice(keys, size= n, replace= False)
+
+    def line(key):
+        key, literal = divmod(int(key), 2)
+        key, o = divmod(key, entities)
+        s, p = divmod(key, predicates)
+        obj = f'"value {o}"' if literal else f'<http://example.com/entity/{o}>'
+
+        return f'<http://example.com/entity/{s}> <http://example.com/property/{p}> {obj} .\n'
+
+    current = np.sort(draw(triples, np.empty(0, dtype= np.int64)))
+    paths = []
+
+    for v in range(versions):
+        path = os.path.join(directory, f'v{v}.nt')
+
+        with open(path, 'w') as dump:
+            for start in range(0, len(current), 100000):
+                dump.write(''.join(line(key) for key in current[start:start + 100000]))
+
+        paths.append(path)
+
+        changed = int(churn * len(current))
+        kept = np.sort(rng.choice(current, size= len(current) - changed, replace= False))
+        current = np.union1d(kept, draw(changed, current))
+
+    return paths
+
+#-----------------------------------------------------------------------------
+
+#! Measurements
+
+backends = {'ntriples': lambda: nt.NTriplesBackend(),
+            'ntriples_approx': lambda: nt.NTriplesBackend(approximate= True),
+            'snapshot': lambda: sn.SnapshotBackend()}
+
+def single_metrics(backend):
+
+    #Metrics of one graph, as functions of (backend, graph)
+    metrics = {'Density/KD/VocUni': lambda b, g: b.profile(g),
+               'top-k': lambda b, g: b.top_entities_all(g, 10)}
+
+    if type(backend).clustering is not que.Backend.clustering:
+        metrics['CC'] = lambda b, g: b.clustering(g)
+
+    return metrics
+
+def pair_metrics(backend):
+
+    #Metrics of a version pair, as functions of (backend, graph1, graph2)
+    return {'Vdyn': lambda b, g1, g2: que.vocab_dyna(b, g1, g2),
+            'ChangeRatio/Growth': lambda b, g1, g2: b.change_ratios(g1, g2)}
+
+def measure(run, queue):
+
+    #Runs in a forked process, so every measurement starts cold. The child inherits the
+    #parent's pages, so its ru_maxrss right after the fork is the baseline and the peak
+    #of this measurement alone is what it grows beyond that
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+
+    try:
+        run()
+        error = ''
+    except Exception as e:
+        error = f'{type(e).__name__}: {e}'
+
+    wall = time.perf_counter() - start
+    queue.put((wall, (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline) / 1024, error))
+
+def timed(run, timeout= None):
+
+    #(wall, peak RSS, error). A child that dies without a result (e.g. killed by the OOM
+    #killer) or runs longer than timeout seconds gives an error row instead of a hang
+    context = multiprocessing.get_context('fork')
+    queue = context.Queue()
+    process = context.Process(target= measure, args= (run, queue))
+    process.start()
+
+    deadline = None if timeout is None else time.monotonic() + timeout
+    result, error = None, ''
+
+    while result is None:
+        try:
+            result = queue.get(timeout= 1)
+        except Empty:
+            if not process.is_alive():
+
+                #The result may still be in the pipe when the child has just exited
+                try:
+                    result = queue.get(timeout= 1)
+                except Empty:
+                    process.join()
+                    error = f'Process exited with code {process.exitcode}'
+                    break
+
+            elif deadline is not None and time.monotonic() > deadline:
+                process.terminate()
+                error = f'Timed out after {timeout}s'
+                break
+
+    process.join()
+
+    if result is None:
+        return float('nan'), float('nan'), error
+
+    return result
+
+def count_lines(path):
+
+    with nt.open_dump(path) as dump:
+        return sum(1 for line in dump if line.strip() and not line.startswith('#'))
+
+def git_revision():
+
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output= True, text= True).stdout.strip()
+    except OSError:
+        return ''
+
+def bench_chain(dataset, paths, backend_names= None, run_id= None, timeout= None):
+
+    #One row per (backend, metric, graph or pair)
+    run_id = run_id or time.strftime('%Y%m%d-%H%M%S')
+    revision = git_revision()
+    sizes = {path: count_lines(path) for path in paths}
+    rows = []
+
+    def record(backend, metric, graphs, triples, result):
+        wall, rss, error = result
+        rows.append({'run': run_id, 'revision': revision, 'dataset': dataset, 'backend': backend,
+                     'metric': metric, 'graphs': ' '.join(os.path.basename(g) for g in graphs),
+                     'triples': triples, 'wall_s': wall, 'peak_rss_mb': rss,
+                     'triples_per_s': triples / wall if wall > 0 else None, 'error': error})
+        print(f'{dataset} {backend} {metric} {rows[-1]["graphs"]}: {wall:.3f}s {rss:.0f}MB {error}')
+
+    for name in backend_names or backends:
+        make = backends[name]
+
+        for metric, compute in single_metrics(make()).items():
+            for path in paths:
+                record(name, metric, [path], sizes[path], timed(lambda: compute(que.as_backend(make()), path), timeout))
+
+        for metric, compute in pair_metrics(make()).items():
+            for g1, g2 in zip(paths, paths[1:]):
+                record(name, metric, [g1, g2], sizes[g1] + sizes[g2], timed(lambda: compute(que.as_backend(make()), g1, g2), timeout))
+
+    return rows
+
+def bench_quality(endpoint, graph_list, ont_list, run_id= None, timeout= None):
+
+    #ICR/IPR/IMI need the graphs and ontologies loaded in a SPARQL endpoint
+    run_id = run_id or time.strftime('%Y%m%d-%H%M%S')
+    revision = git_revision()
+    wrapper = lambda: sparql_factory(endpoint)().wrapper
+    rows = []
+
+    for graph, ont in zip(graph_list, ont_list):
+        wall, rss, error = timed(lambda: que.quality_values(wrapper(), graph, ont), timeout)
+        rows.append({'run': run_id, 'revision': revision, 'dataset': endpoint, 'backend': 'sparql',
+                     'metric': 'ICR/IPR/IMI', 'graphs': graph, 'triples': None, 'wall_s': wall,
+                     'peak_rss_mb': rss, 'triples_per_s': None, 'error': error})
+
+    wall, rss, error = timed(lambda: pr.VersionPresence(wrapper(), graph_list, ont_list).metrics(), timeout)
+    rows.append({'run': run_id, 'revision': revision, 'dataset': endpoint, 'backend': 'sparql',
+                 'metric': 'presence matrix', 'graphs': ' '.join(graph_list), 'triples': None, 'wall_s': wall,
+                 'peak_rss_mb': rss, 'triples_per_s': None, 'error': error})
+
+    return rows
+
+def write_results(rows, file_name= 'benchmark_results.csv'):
+
+    #Appended, so one file collects every run
+    pd.DataFrame(rows).to_csv(file_name, mode= 'a', index= False, header= not os.path.exists(file_name))
+
+def compare(file_name, old_run, new_run):
+
+    #Wall time and peak RSS of two runs side by side, ratio < 1 means new_run is faster
+    results = pd.read_csv(file_name)
+    keys = ['dataset', 'backend', 'metric', 'graphs']
+
+    old = results[results['run'] == old_run].set_index(keys)[['wall_s', 'peak_rss_mb']]
+    new = results[results['run'] == new_run].set_index(keys)[['wall_s', 'peak_rss_mb']]
+
+    table = old.join(new, lsuffix= '_old', rsuffix= '_new', how= 'inner')
+    table['wall_ratio'] = table['wall_s_new'] / table['wall_s_old']
+
+    return table
+
+#-----------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description= 'Time every metric per backend')
+    parser.add_argument('--triples', type= int, nargs= '*', default= [10000], help= 'sizes of the synthetic chains')
+    parser.add_argument('--versions', type= int, default= 3)
+    parser.add_argument('--churn', type= float, default= 0.05)
+    parser.add_argument('--seed', type= int, default= 0)
+    parser.add_argument('--backends', nargs= '*', default= list(backends))
+    parser.add_argument('--directory', default= 'benchmark_data', help= 'where synthetic chains are written')
+    parser.add_argument('--output', default= 'benchmark_results.csv')
+    parser.add_argument('--no-subsets', action= 'store_true', help= 'skip subsets/35.nt and subsets/dims.nt')
+    parser.add_argument('--endpoint', help= 'SPARQL endpoint for ICR/IPR/IMI')
+    parser.add_argument('--graphs', nargs= '*', default= [], help= 'graph IRIs for ICR/IPR/IMI')
+    parser.add_argument('--onts', nargs= '*', default= [], help= 'ontology IRIs, one per graph')
+    parser.add_argument('--timeout', type= float, help= 'seconds after which a measurement is stopped')
+    parser.add_argument('--trace', help= 'trace file of every metric and request, see tracing.py')
+    args = parser.parse_args()
+
+    if args.trace:
+        tracing.start(args.trace)
+
+    run_id = time.strftime('%Y%m%d-%H%M%S')
+    rows = []
+
+    for triples in args.triples:
+        directory = os.path.join(args.directory, f'{triples}_{args.versions}_{args.churn}_{args.seed}')
+        paths = [os.path.join(directory, f'v{v}.nt') for v in range(args.versions)]
+
+        #The chain only depends on its parameters, so it is generated once
+        if not all(os.path.exists(path) for path in paths):
+            paths = synthetic_chain(directory, triples, args.versions, args.churn, seed= args.seed)
+
+        rows += bench_chain(f'synthetic_{triples}_{args.versions}_{args.churn}', paths, args.backends, run_id, args.timeout)
+
+    if not args.no_subsets:
+        rows += bench_chain('subsets', ['subsets/35.nt', 'subsets/dims.nt'], args.backends, run_id, args.timeout)
+
+    if args.endpoint:
+        rows += bench_quality(args.endpoint, args.graphs, args.onts, run_id, args.timeout)
+
+    write_results(rows, args.output)
+    print(f'Run {run_id} written to {args.output}')
+
+    if args.trace:
+        tracing.stop()
@@ -0,0 +1,104 @@
+'''
+This file contains the on-disk metric cache, so finished metrics are not recomputed on the
+next run. Results are keyed by graph, optional second graph, metric name and a hash of the
+query that produced them, so editing a query invalidates its old results automatically.
+'''
+
+#! Imports
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+#-----------------------------------------------------------------------------
+
+def query_hash(query):
+
+    if query is None:
+        return ''
+
+    return hashlib.sha1(query.encode('utf-8')).hexdigest()
+
+class MetricCache:
+    '''
+    SQLite table of metric values stored as JSON
+    '''
+
+    def __init__(self, path= 'metric_cache.sqlite'):
+        self.path = path
+        self.lock = threading.Lock()
+
+        #The connection is shared by worker threads, the lock serialises the access
+        self.connection = sqlite3.connect(path, check_same_thread= False)
+        self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS metrics (
+                graph TEXT NOT NULL,
+                graph2 TEXT NOT NULL,
+                metric TEXT NOT NULL,
+                query_hash TEXT NOT NULL,
+                value TEXT NOT NULL,
+                created REAL NOT NULL,
+                PRIMARY KEY (graph, graph2, metric, query_hash)
+            )
+        ''')
+        self.connection.commit()
+
+    def get(self, graph, metric, graph2= None, query= None):
+
+        #None when the metric has not been stored yet
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT value FROM metrics WHERE graph = ? AND graph2 = ? AND metric = ? AND query_hash = ?',
+                (graph, graph2 or '', metric, query_hash(query))).fetchone()
+
+        if row is None:
+            return None
+
+        return json.loads(row[0])
+
+    def put(self, graph, metric, value, graph2= None, query= None):
+
+        with self.lock:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO metrics VALUES (?, ?, ?, ?, ?, ?)',
+                (graph, graph2 or '', metric, query_hash(query), json.dumps(value), time.time()))
+            self.connection.commit()
+
+    def cached(self, graph, metric, compute, graph2= None, query= None):
+
+        value = self.get(graph, metric, graph2= graph2, query= query)
+
+        if value is None:
+            value = compute()
+            self.put(graph, metric, value, graph2= graph2, query= query)
+
+        return value
+
+    def invalidate(self, graph= None, metric= None, graph2= None):
+
+        #Deletes every row matching the given fields, everything when none are given.
+        #A graph matches in both positions, so pairs involving it are dropped as well
+        clauses = []
+        params = []
+
+        if graph is not None:
+            clauses.append('(graph = ? OR graph2 = ?)')
+            params += [graph, graph]
+        if graph2 is not None:
+            clauses.append('graph2 = ?')
+            params.append(graph2)
+        if metric is not None:
+            clauses.append('metric = ?')
+            params.append(metric)
+
+        where = ' WHERE ' + ' AND '.join(clauses) if clauses else ''
+
+        with self.lock:
+            deleted = self.connection.execute('DELETE FROM metrics' + where, params).rowcount
+            self.connection.commit()
+
+        return deleted
+
+    def close(self):
+        self.connection.close()
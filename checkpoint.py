@@ -0,0 +1,100 @@
+'''
+This file contains the run manifest that makes long runs resumable. Every finished
+(graph, metric) unit is appended to the manifest together with its value, and so is every
+row appended to an output file. A killed run started again with the same manifest takes
+finished units from it and continues at the first missing one.
+'''
+
+#! Imports
+import csv
+import json
+import os
+import threading
+
+#-----------------------------------------------------------------------------
+
+class RunManifest:
+    '''
+    Append-only JSON lines file of finished units, keyed by graph, optional second graph
+    and metric. One manifest belongs to one run of one driver; delete it to start over.
+    With path=None the units are only kept in memory.
+    '''
+
+    def __init__(self, path= None):
+        self.path = path
+        self.units = {}
+        self.lock = threading.Lock()
+
+        if path is not None and os.path.exists(path):
+            with open(path) as manifest:
+                for line in manifest:
+
+                    #A run killed while writing leaves a torn last line, that unit is redone
+                    try:
+                        unit = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+
+                    self.units[(unit['graph'], unit['graph2'], unit['metric'])] = unit['value']
+
+    def done(self, graph, metric, graph2= None):
+        return (graph, graph2 or '', metric) in self.units
+
+    def get(self, graph, metric, graph2= None):
+        return self.units[(graph, graph2 or '', metric)]
+
+    def record(self, graph, metric, value, graph2= None):
+
+        with self.lock:
+            self.units[(graph, graph2 or '', metric)] = value
+
+            if self.path is None:
+                return
+
+            with open(self.path, 'a') as manifest:
+                manifest.write(json.dumps({'graph': graph, 'graph2': graph2 or '', 'metric': metric, 'value': value}) + '\n')
+                manifest.flush()
+                os.fsync(manifest.fileno())
+
+    def unit(self, graph, metric, compute, graph2= None):
+
+        #The recorded value if the unit is finished, otherwise compute and record it
+        if self.done(graph, metric, graph2):
+            return self.get(graph, metric, graph2)
+
+        value = compute()
+        self.record(graph, metric, value, graph2)
+
+        return value
+
+    #-------------------------------------------------------------------------
+
+    #! Appended outputs
+
+    def open_output(self, file_name, header):
+
+        #Returns the number of rows the file already has. A resumed run cuts the file back
+        #to its last recorded row, dropping a row the killed run appended without
+        #recording it. A new run starts the file with the header
+        if self.done(file_name, 'output') and os.path.exists(file_name):
+            written = self.get(file_name, 'output')
+            os.truncate(file_name, written['offset'])
+
+            return written['rows']
+
+        with open(file_name, 'w') as output:
+            csv.writer(output).writerow(header)
+            self.record(file_name, 'output', {'offset': output.tell(), 'rows': 0})
+
+        return 0
+
+    def append_row(self, file_name, row):
+
+        #Row and offset are recorded together, so the file and the manifest always agree
+        rows = self.get(file_name, 'output')['rows']
+
+        with open(file_name, 'a') as output:
+            csv.writer(output).writerow(row)
+            output.flush()
+            os.fsync(output.fileno())
+            self.record(file_name, 'output', {'offset': output.tell(), 'rows': rows + 1})
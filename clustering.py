@@ -0,0 +1,164 @@
+'''
+This file contains the clustering coefficient computation outside the triple store.
+Resources are the nodes of an undirected simple graph with an edge between s and o for
+every triple whose object is not a literal (predicates and self loops are dropped). The
+coefficient is the global transitivity: 3 * triangles / connected triplets (wedges).
+'''
+
+#! Imports
+import math
+
+import numpy as np
+
+#-----------------------------------------------------------------------------
+
+#! Graph construction
+
+def resource_edges(snap):
+
+    #Subject-object pairs of a snapshot without literals and self loops
+    triples = snap.triples
+    keep = ~snap.terms.literal_mask()[triples[:, 2]]
+    keep &= triples[:, 0] != triples[:, 2]
+
+    return triples[keep, 0], triples[keep, 2]
+
+def degree_ordered(u, v):
+
+    #Relabels the nodes 0..n-1 by increasing degree and orients every edge from its lower
+    #to its higher label. The result is the sorted, duplicate free array of edge keys
+    #low * n + high, which is all the counting below needs
+    nodes, inverse = np.unique(np.concatenate([u, v]), return_inverse= True)
+    n = len(nodes)
+    u, v = inverse[:len(u)], inverse[len(u):]
+
+    #Degrees on duplicate free edges, so parallel triples with other predicates count once
+    low, high = np.minimum(u, v).astype(np.uint64), np.maximum(u, v).astype(np.uint64)
+    keys = np.unique(low * np.uint64(n) + high)
+    low, high = keys // np.uint64(n), keys % np.uint64(n)
+
+    degree = np.bincount(low.astype(np.int64), minlength= n) + np.bincount(high.astype(np.int64), minlength= n)
+
+    rank = np.empty(n, dtype= np.uint64)
+    rank[np.argsort(degree, kind= 'stable')] = np.arange(n, dtype= np.uint64)
+
+    a, b = rank[low.astype(np.int64)], rank[high.astype(np.int64)]
+    keys = np.sort(np.minimum(a, b) * np.uint64(n) + np.maximum(a, b))
+
+    return n, keys
+
+def csr(n, rows, cols):
+
+    #Compressed sparse rows of (rows, cols), column indices sorted within every row
+    order = np.lexsort((cols, rows))
+    indptr = np.zeros(n + 1, dtype= np.int64)
+    np.cumsum(np.bincount(rows, minlength= n), out= indptr[1:])
+
+    return indptr, cols[order]
+
+#-----------------------------------------------------------------------------
+
+#! Exact count with the forward algorithm
+
+def count_triangles(n, keys, budget= 10_000_000):
+
+    #Every triangle is found once, from its lowest ranked node: for each pair (v, w) of
+    #that node's higher ranked neighbours, look the edge v-w up in the sorted keys.
+    #Degree ordering keeps the number of such pairs at O(m^1.5); they are generated in
+    #vectorised batches of about `budget` pairs to bound the memory
+    low = (keys // np.uint64(n)).astype(np.int64)
+    high = (keys % np.uint64(n)).astype(np.int64)
+    indptr, indices = csr(n, low, high)
+
+    #For every slot of the adjacency array, the number of later slots in the same row
+    out_degree = np.diff(indptr)
+    remaining = np.repeat(indptr[1:], out_degree) - np.arange(len(indices)) - 1
+
+    slots = np.flatnonzero(remaining > 0)
+    counts = remaining[slots]
+    ends = np.cumsum(counts)
+
+    triangles = 0
+    start = 0
+
+    while start < len(slots):
+        done = ends[start - 1] if start > 0 else 0
+        stop = max(int(np.searchsorted(ends, done + budget, side= 'right')), start + 1)
+
+        first = np.repeat(slots[start:stop], counts[start:stop])
+        offset = np.arange(len(first)) - np.repeat(ends[start:stop] - counts[start:stop] - done, counts[start:stop]) + 1
+        second = first + offset
+
+        wanted = indices[first].astype(np.uint64) * np.uint64(n) + indices[second].astype(np.uint64)
+        position = np.minimum(np.searchsorted(keys, wanted), len(keys) - 1)
+        triangles += int(np.count_nonzero(keys[position] == wanted))
+
+        start = stop
+
+    return triangles
+
+#-----------------------------------------------------------------------------
+
+#! Approximate mode with wedge sampling
+
+def sample_transitivity(n, keys, samples, confidence= 0.95, seed= None):
+
+    #Draws wedges uniformly (centre proportional to deg * (deg - 1) / 2, then two distinct
+    #neighbours) and checks whether they are closed. By Hoeffding's inequality the
+    #fraction of closed wedges is within `error` of the true value with the given confidence
+    rng = np.random.default_rng(seed)
+
+    low = (keys // np.uint64(n)).astype(np.int64)
+    high = (keys % np.uint64(n)).astype(np.int64)
+    indptr, indices = csr(n, np.concatenate([low, high]), np.concatenate([high, low]))
+
+    degree = np.diff(indptr)
+    wedges = degree * (degree - 1) / 2
+
+    if wedges.sum() == 0:
+        return 0.0, 0.0
+
+    centre = rng.choice(n, size= samples, p= wedges / wedges.sum())
+    d = degree[centre]
+    i = rng.integers(0, d)
+    j = rng.integers(0, d - 1)
+    j += j >= i
+
+    v = indices[indptr[centre] + i].astype(np.uint64)
+    w = indices[indptr[centre] + j].astype(np.uint64)
+    wanted = np.minimum(v, w) * np.uint64(n) + np.maximum(v, w)
+
+    position = np.minimum(np.searchsorted(keys, wanted), len(keys) - 1)
+    closed = int(np.count_nonzero(keys[position] == wanted))
+
+    error = math.sqrt(math.log(2 / (1 - confidence)) / (2 * samples))
+
+    return closed / samples, error
+
+#-----------------------------------------------------------------------------
+
+def clustering_coefficient(snap, samples= None, confidence= 0.95, seed= None):
+
+    #Exact when samples is None, otherwise estimated from that many sampled wedges
+    u, v = resource_edges(snap)
+
+    if len(u) == 0:
+        return {'cc': 0.0, 'triangles': 0, 'wedges': 0, 'error': 0.0}
+
+    n, keys = degree_ordered(u, v)
+
+    degree = (np.bincount((keys // np.uint64(n)).astype(np.int64), minlength= n)
+              + np.bincount((keys % np.uint64(n)).astype(np.int64), minlength= n))
+    wedges = int((degree * (degree - 1) // 2).sum())
+
+    if wedges == 0:
+        return {'cc': 0.0, 'triangles': 0, 'wedges': 0, 'error': 0.0}
+
+    if samples is None:
+        triangles = count_triangles(n, keys)
+
+        return {'cc': 3 * triangles / wedges, 'triangles': triangles, 'wedges': wedges, 'error': 0.0}
+
+    cc, error = sample_transitivity(n, keys, samples, confidence= confidence, seed= seed)
+
+    return {'cc': cc, 'triangles': cc * wedges / 3, 'wedges': wedges, 'error': error, 'confidence': confidence}
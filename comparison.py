@@ -0,0 +1,93 @@
+'''
+This file contains the all-pairs comparison of the versions of a chain. ChangeRatio,
+AddCR, RemCR, Growth, Vdyn, AddVdyn and RemVdyn are computed for every ordered pair of
+versions, not only for consecutive ones, and written as one matrix CSV per ratio with
+the old version as row and the new one as column (see visualizer.comparison_heatmap).
+
+Each version is summarised once and the pairs are compared from the summaries:
+snapshots (exact, from snapshot.SnapshotBackend) or signatures (estimates, from an
+approximate ntriples.NTriplesBackend). Any other backend falls back to one diff and one
+vocab_diff per pair, which on Virtuoso are MINUS queries and vocabulary downloads.
+'''
+
+#! Imports
+import pandas as pd
+
+import ntriples as nt
+import queries as que
+import sketches as sk
+import snapshot as sn
+
+#-----------------------------------------------------------------------------
+
+ratio_names = ['ChangeRatio', 'AddCR', 'RemCR', 'Growth', 'Vdyn', 'AddVdyn', 'RemVdyn']
+
+def reverse_diff(diff):
+
+    #Backend.diff of (graph2, graph1) from that of (graph1, graph2)
+    return {'previous': diff['next'], 'next': diff['previous'], 'additions': diff['removals'],
+            'removals': diff['additions'], 'union': diff['union']}
+
+def reverse_vocab_diff(vdiff):
+    return {'removed': vdiff['added'], 'added': vdiff['removed'], 'union': vdiff['union']}
+
+def base_backend(backend):
+
+    #The backend under the cache and trace layers of queries.as_backend
+    while isinstance(backend, (que.CachedBackend, que.TracedBackend)):
+        backend = backend.backend
+
+    return backend
+
+def pair_functions(backend, graphs):
+
+    #(diff, vocab_diff) as functions of two indices into graphs. Summaries are made here,
+    #one pass per version, so the pairwise step only compares them
+    base = base_backend(backend)
+
+    if isinstance(base, sn.SnapshotBackend):
+
+        #Every snapshot is kept for the whole matrix. With a directory they are memory-mapped
+        snaps = [base.snapshot(graph) for graph in graphs]
+
+        return (lambda i, j: sn.diff_snapshots(snaps[i], snaps[j]),
+                lambda i, j: sn.vocab_diff_snapshots(snaps[i], snaps[j]))
+
+    if isinstance(base, nt.NTriplesBackend) and base.approximate:
+        triples = [base.triple_signature(graph) for graph in graphs]
+        vocab = [base.signature(graph) for graph in graphs]
+
+        return (lambda i, j: sk.diff_estimate(triples[i], triples[j]),
+                lambda i, j: sk.vocab_diff_estimate(vocab[i], vocab[j]))
+
+    return (lambda i, j: backend.diff(graphs[i], graphs[j]),
+            lambda i, j: backend.vocab_diff(graphs[i], graphs[j]))
+
+def comparison_matrix(wrapper, graphs, file_name= 'comparison_matrix', cache= None, labels= None):
+
+    #Writes <file_name>_<ratio>.csv for every ratio in ratio_names and returns the
+    #matrices as DataFrames. Every unordered pair is compared once, the other direction
+    #is the same comparison read the other way round
+    backend = que.as_backend(wrapper, cache)
+    diff, vocab_diff = pair_functions(backend, graphs)
+
+    labels = list(labels) if labels is not None else list(graphs)
+    matrices = {name: pd.DataFrame(0.0, index= labels, columns= labels) for name in ratio_names}
+
+    for i in range(len(graphs)):
+
+        #A version compared with itself has not changed and has grown by a factor of one
+        matrices['Growth'].iloc[i, i] = 1.0
+
+        for j in range(i + 1, len(graphs)):
+            pair_diff = diff(i, j)
+            pair_vdiff = vocab_diff(i, j)
+
+            for old, new, d, v in [(i, j, pair_diff, pair_vdiff), (j, i, reverse_diff(pair_diff), reverse_vocab_diff(pair_vdiff))]:
+                for name, value in zip(ratio_names, que.diff_ratios(d) + que.vocab_ratios(v)):
+                    matrices[name].iloc[old, new] = value
+
+    for name, matrix in matrices.items():
+        matrix.to_csv(f'{file_name}_{name}.csv')
+
+    return matrices
@@ -0,0 +1,214 @@
+'''
+This file contains the execution layer that sends independent metric queries in parallel:
+the single-graph metrics per graph and the comparisons per version pair. Results are put
+back in version order before the CSV files are written, so they match the serial drivers.
+'''
+
+#! Imports
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from SPARQLWrapper import SPARQLWrapper, JSON
+
+import queries as que
+from checkpoint import RunManifest
+
+#-----------------------------------------------------------------------------
+
+#! Backends per worker thread
+
+def sparql_factory(endpoint):
+
+    #Every call gives a new backend with its own SPARQLWrapper
+    def make():
+        sparql = SPARQLWrapper(endpoint)
+        sparql.setReturnFormat(JSON)
+
+        return que.SparqlBackend(sparql)
+
+    return make
+
+class BackendPool:
+    '''
+    Hands every worker thread a backend. A SPARQLWrapper keeps the current query as
+    state, so every thread gets its own SparqlBackend. Any other backend is made once and
+    shared by all threads: it keeps one term dictionary and encodes every dump once (see
+    snapshot.SnapshotBackend). `factory` is an endpoint URL or any callable returning a
+    backend (e.g. ntriples.NTriplesBackend).
+    '''
+
+    def __init__(self, factory):
+        if isinstance(factory, str):
+            factory = sparql_factory(factory)
+
+        self.factory = factory
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.common = None
+
+    def get(self):
+
+        backend = getattr(self.local, 'backend', None)
+
+        if backend is None:
+            with self.lock:
+                backend = self.common
+
+                if backend is None:
+                    backend = que.as_backend(self.factory())
+
+                    if not que.wraps(backend, que.SparqlBackend):
+                        self.common = backend
+
+            self.local.backend = backend
+
+        return backend
+
+    def shared(self):
+        #Whether all threads get the same backend
+        return self.get() is self.common
+
+def run_parallel(pool, tasks, workers= 4):
+
+    #tasks maps a key to a function of the worker's backend, the result maps the key to
+    #its return value. The first failing task raises once everything has been submitted
+    def run(task):
+        return task(pool.get())
+
+    with ThreadPoolExecutor(max_workers= workers) as executor:
+        futures = {key: executor.submit(run, task) for key, task in tasks.items()}
+
+        return {key: future.result() for key, future in futures.items()}
+
+#-----------------------------------------------------------------------------
+
+#! Parallel versions of the drivers in queries.py
+
+def structure_and_content_parallel(factory, graph_list, workers= 4, cache= None, file_name= 'structure_and_content.csv',
+                                   manifest= None):
+
+    #The units are those of queries.structure_and_content, so both resume from the same
+    #kind of checkpoint.RunManifest. Finished units are recorded as the workers finish them
+    pool = BackendPool(factory)
+    units = {}
+    chains = []
+
+    if manifest is None:
+        manifest = RunManifest()
+
+    #REQUIRES ORDERED LISTS, like queries.structure_and_content. A unit is
+    #(graph, metric, graph2, function of the worker's backend)
+    for list in graph_list:
+        start = len(units)
+
+        for i in range(len(list)):
+            units[('profile', list[i])] = (list[i], 'profile', None,
+                                           lambda b, g= list[i]: que.graph_profile(que.as_backend(b, cache), g))
+            units[('clustering', list[i])] = (list[i], 'clustering', None,
+                                              lambda b, g= list[i]: que.as_backend(b, cache).clustering(g))
+
+            if i > 0:
+                pair = (list[i-1], list[i])
+                units[('vocab',) + pair] = (pair[0], 'vocab_dyna', pair[1],
+                                            lambda b, p= pair: que.vocab_dyna(que.as_backend(b, cache), *p))
+                units[('change',) + pair] = (pair[0], 'change_ratios', pair[1],
+                                             lambda b, p= pair: que.as_backend(b, cache).change_ratios(*p))
+
+        #The keys of the chain in the order of the serial driver
+        chains.append([*units][start:])
+
+    #Only unfinished units go to the workers, each recorded as soon as it is done
+    results = {key: manifest.get(g, metric, g2) for key, (g, metric, g2, compute) in units.items()
+               if manifest.done(g, metric, g2)}
+
+    chains = [[key for key in chain if key not in results] for chain in chains]
+
+    if pool.shared():
+
+        #A local backend keeps the last versions of the chain it walks, so every chain
+        #goes to one worker in version order
+        groups = chains
+    else:
+
+        #Every request is a task of its own, except the vocabularies of a chain: they are
+        #compared in order on one worker, so each is downloaded once (SparqlBackend.last_vocab)
+        groups = [[key] for chain in chains for key in chain if key[0] != 'vocab']
+        groups += [[key for key in chain if key[0] == 'vocab'] for chain in chains]
+
+    def walk(backend, keys):
+        return {key: manifest.unit(units[key][0], units[key][1], lambda: units[key][3](backend), units[key][2])
+                for key in keys}
+
+    tasks = {i: lambda b, keys= keys: walk(b, keys) for i, keys in enumerate(groups) if keys}
+
+    for done in run_parallel(pool, tasks, workers).values():
+        results.update(done)
+
+    struct_cont_dict = que.struct_cont_table()
+    written = manifest.open_output(file_name, struct_cont_dict.keys())
+    rows = 0
+
+    for list in graph_list:
+        for i in range(len(list)):
+            if i == 0:
+                voc_res, change = None, None
+            else:
+                voc_res = results[('vocab', list[i-1], list[i])]
+                change = results[('change', list[i-1], list[i])]
+
+            que.struct_cont_row(struct_cont_dict, list[i], i, results[('profile', list[i])], voc_res, change,
+                                results[('clustering', list[i])])
+
+            if rows >= written:
+                manifest.append_row(file_name, [column[-1] for column in struct_cont_dict.values()])
+            rows += 1
+
+    return struct_cont_dict
+
+def quality_parallel(factory, graph_list, ont_list, workers= 4, cache= None, file_name= 'quality.csv'):
+
+    #The quality queries need an endpoint, so the factory has to give SparqlBackends
+    pool = BackendPool(factory)
+
+    tasks = {i: lambda b, g= graph_list[i], o= ont_list[i]: que.quality_values(b.wrapper, g, o, cache)
+             for i in range(len(graph_list))}
+
+    results = run_parallel(pool, tasks, workers)
+
+    qual_dict = que.quality_table()
+
+    for i in range(len(graph_list)):
+        que.quality_row(qual_dict, graph_list[i], i, *results[i])
+
+    que.write_table(file_name, qual_dict)
+
+    return qual_dict
+
+def top_entities_parallel(entity, factory, graph_list, file_name, workers= 4, cache= None, limit= 10):
+
+    pool = BackendPool(factory)
+
+    tasks = {graph: lambda b, g= graph: que.as_backend(b, cache).top_entities(g, entity, limit)
+             for names in graph_list for graph in names}
+
+    results = run_parallel(pool, tasks, workers)
+
+    common_dict = {'File':[],
+                   'Version':[],
+                   'Rank':[],
+                   'Name':[],
+                   'Count':[]
+                   }
+
+    for names in graph_list:
+        for v_num in range(len(names)):
+            for top, (name, count) in enumerate(results[names[v_num]], start= 1):
+                common_dict['File'].append(names[v_num])
+                common_dict['Version'].append(v_num)
+                common_dict['Rank'].append(top)
+                common_dict['Name'].append(name)
+                common_dict['Count'].append(count)
+
+    que.write_table(file_name, common_dict)
+
+    return common_dict
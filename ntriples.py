@@ -0,0 +1,413 @@
+'''
+This file contains a backend that computes the metrics straight from N-Triples dumps
+(.nt, .nt.gz or .nt.bz2), so a version does not have to be bulk loaded into Virtuoso first
+'''
+
+#! Imports
+import bz2
+import gzip
+import hashlib
+import os
+import re
+from array import array
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import queries as que
+import sketches as sk
+
+#-----------------------------------------------------------------------------
+
+#! Parsing of the dump files
+
+#An IRI, a blank node or a literal with an optional language tag or datatype
+TERM = r'<[^>]*>|_:\S+|"(?:[^"\\]|\\.)*"(?:@[A-Za-z0-9-]+|\^\^<[^>]*>)?'
+TRIPLE = re.compile(rf'\s*({TERM})\s+({TERM})\s+({TERM})\s*\.\s*$')
+
+def open_dump(path):
+
+    if str(path).endswith('.gz'):
+        return gzip.open(path, 'rt', encoding= 'utf-8')
+    if str(path).endswith('.bz2'):
+        return bz2.open(path, 'rt', encoding= 'utf-8')
+
+    return open(path, 'r', encoding= 'utf-8')
+
+def term_value(term):
+
+    #IRIs are reported without brackets, like the endpoint does. Literals keep quotes,
+    #language tag and datatype so they stay distinct from IRIs and from each other
+    if term.startswith('<'):
+        return term[1:-1]
+
+    return term
+
+def is_literal(term):
+    return term.startswith('"')
+
+def parse_line(line):
+
+    match = TRIPLE.match(line)
+
+    if match is None:
+        return None
+
+    return tuple(term_value(term) for term in match.groups())
+
+def stream_triples(path):
+
+    #One line at a time, so memory does not grow with the size of the file. Unparsable
+    #lines are skipped and counted, the count is reported once at the end
+    skipped = 0
+
+    with open_dump(path) as dump:
+        for line in dump:
+            if not line.strip() or line.lstrip().startswith('#'):
+                continue
+
+            triple = parse_line(line)
+
+            if triple is None:
+                skipped += 1
+                continue
+
+            yield triple
+
+    if skipped:
+        print(f'{path}: skipped {skipped} unparsable lines')
+
+def triple_key(triple):
+
+    #Exact set key of a triple: 128 bits, so distinct triples of a dump do not collide in
+    #practice, and unlike hash() the same in every process. Terms never contain a line
+    #break (N-Triples escapes it), so joining them with one is unambiguous
+    return hashlib.blake2b('\n'.join(triple).encode('utf-8'), digest_size= 16).digest()
+
+#-----------------------------------------------------------------------------
+
+#! Parallel encoding of the dump files. A dump is cut into chunks of whole lines, every
+#! chunk is parsed and dictionary encoded in a worker process, and the parent merges the
+#! small per-chunk dictionaries in file order (see snapshot.build_snapshot)
+
+chunk_size = 64 * 2**20
+
+def dump_chunks(path, chunk_size= chunk_size):
+
+    #Plain files are cut into byte ranges that end at a line break, which every worker
+    #reads itself. Compressed streams can not be entered at an offset, so they are
+    #decompressed here and handed out as blocks of whole lines
+    if str(path).endswith(('.gz', '.bz2')):
+        opener = gzip.open if str(path).endswith('.gz') else bz2.open
+
+        with opener(path, 'rb') as dump:
+            while True:
+                data = dump.read(chunk_size)
+
+                if not data:
+                    break
+
+                yield data + dump.readline()
+
+        return
+
+    size = os.path.getsize(path)
+
+    with open(path, 'rb') as dump:
+        start = 0
+
+        while start < size:
+            dump.seek(min(start + chunk_size, size))
+            dump.readline()
+            end = dump.tell()
+
+            yield (path, start, end)
+
+            start = end
+
+def encode_chunk(chunk):
+
+    #Distinct terms of the chunk in order of first occurrence, its triples as an N x 3
+    #array of indices into them and the number of unparsable lines. Workers do not print,
+    #the parent reports the total once
+    if isinstance(chunk, bytes):
+        data = chunk
+    else:
+        path, start, end = chunk
+
+        with open(path, 'rb') as dump:
+            dump.seek(start)
+            data = dump.read(end - start)
+
+    local = {}
+    ids = array('I')
+    skipped = 0
+
+    for line in data.decode('utf-8').split('\n'):
+        if not line.strip() or line.lstrip().startswith('#'):
+            continue
+
+        triple = parse_line(line)
+
+        if triple is None:
+            skipped += 1
+            continue
+
+        for term in triple:
+            ids.append(local.setdefault(term, len(local)))
+
+    return list(local), np.frombuffer(ids, dtype= np.uint32).reshape(-1, 3), skipped
+
+def encode_parallel(path, workers= 4, chunk_size= chunk_size):
+
+    #Yields encode_chunk of every chunk in file order. At most two chunks per worker are
+    #read and waiting at any time, so memory does not grow with the size of the dump
+    with ProcessPoolExecutor(max_workers= workers) as executor:
+        pending = deque()
+
+        for chunk in dump_chunks(path, chunk_size):
+            pending.append(executor.submit(encode_chunk, chunk))
+
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
+
+#-----------------------------------------------------------------------------
+
+#! The backend itself
+
+class NTriplesBackend(que.Backend):
+    '''
+    Streams dump files line by line. Graphs are file paths, or graph IRIs mapped to
+    file paths through `paths` so the same graph lists as for Virtuoso can be used.
+    The exact mode keeps every distinct term and a 16 byte key per distinct triple in
+    memory, so its memory grows with the dump. With approximate=True the profile is built
+    from HyperLogLog sketches in constant memory, vocabulary dynamicity is estimated from
+    per-version vocabulary signatures (HyperLogLog + MinHash), stored on disk with
+    signature_dir, and the top terms of all three positions come from bounded-memory heavy
+    hitter sketches.
+    '''
+
+    def __init__(self, paths= None, approximate= False, precision= 14, k= 1024, batch_size= 100000,
+                 signature_dir= None, capacity= 10000):
+        self.paths = dict(paths) if paths is not None else {}
+        self.approximate = approximate
+        self.precision = precision
+        self.k = k
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.signature_dir = signature_dir
+        self.signatures = {}
+        self.triple_signatures = {}
+
+        #State of the last version read, reused as the old side of the next pair in a
+        #version chain so every file is only scanned once per kind of state
+        self.last_vocab = (None, None)
+        self.last_keys = (None, None)
+
+    def path(self, graph):
+        return self.paths.get(graph, graph)
+
+    def query_text(self, metric, graph, graph2= None):
+
+        #Cached results of the exact and the approximate mode must not be mixed up
+        if self.approximate:
+            return f'NTriplesBackend approximate precision={self.precision} k={self.k} capacity={self.capacity}'
+
+        return 'NTriplesBackend exact'
+
+    def distinct_triples(self, graph):
+
+        #A dump may repeat lines, but a graph is a set of triples. Seen triples are
+        #kept as triple_key digests instead of strings
+        seen = set()
+
+        for triple in stream_triples(self.path(graph)):
+            key = triple_key(triple)
+
+            if key in seen:
+                continue
+            seen.add(key)
+
+            yield triple
+
+    def profile(self, graph):
+
+        if self.approximate:
+            return self.sketch_profile(graph)
+
+        subjects = set()
+        predicates = set()
+        objects = set()
+        uobjects = set()
+        triples = 0
+        literals = 0
+
+        #Everything is collected in the same pass over the file
+        for s, p, o in self.distinct_triples(graph):
+            triples += 1
+            subjects.add(s)
+            predicates.add(p)
+            objects.add(o)
+
+            if is_literal(o):
+                literals += 1
+            else:
+                uobjects.add(o)
+
+        profile = {'triples': triples,
+                   'subjects': len(subjects),
+                   'predicates': len(predicates),
+                   'objects': len(objects),
+                   'literals': literals,
+                   'uobjects': len(uobjects),
+                   'nodes': len(subjects | uobjects),
+                   'vocab': len(subjects | predicates | objects),
+                   'outdegree_sum': triples}
+
+        return profile
+
+    def sketch_profile(self, graph):
+
+        sketch = sk.ProfileSketch(self.precision, self.k)
+        batch = []
+
+        for triple in stream_triples(self.path(graph)):
+            batch.append(triple)
+
+            if len(batch) == self.batch_size:
+                sketch.add_batch(batch, is_literal)
+                batch = []
+
+        if batch:
+            sketch.add_batch(batch, is_literal)
+
+        self.signatures[graph] = sketch.signature()
+        self.triple_signatures[graph] = sketch.triple_signature()
+
+        if self.signature_dir is not None:
+            os.makedirs(self.signature_dir, exist_ok= True)
+            sketch.signature().save(self.signature_path(graph))
+            sketch.triple_signature().save(self.signature_path(graph, 'triples'))
+
+        profile = sketch.profile()
+        print(f"{graph}: distinct counts estimated with relative standard error {profile['error']:.2%}")
+
+        return profile
+
+    def signature_path(self, graph, kind= 'vocab'):
+        name = re.sub(r'[^A-Za-z0-9_.-]', '_', str(graph))
+
+        return os.path.join(self.signature_dir, name + ('.npz' if kind == 'vocab' else f'.{kind}.npz'))
+
+    def load_signature(self, graph, kind, signatures):
+
+        #Kept from the sketch profile, read from disk, or made by a sketch profile now
+        if graph not in signatures:
+            if self.signature_dir is not None and os.path.exists(self.signature_path(graph, kind)):
+                signatures[graph] = sk.VocabSignature.load(self.signature_path(graph, kind))
+            else:
+                self.sketch_profile(graph)
+
+        return signatures[graph]
+
+    def signature(self, graph):
+        return self.load_signature(graph, 'vocab', self.signatures)
+
+    def triple_signature(self, graph):
+        return self.load_signature(graph, 'triples', self.triple_signatures)
+
+    def vocab_union_estimate(self, graph1, graph2):
+        return sk.vocab_union_estimate(self.signature(graph1).hll, self.signature(graph2).hll)
+
+    def vocab_diff(self, graph1, graph2):
+
+        if self.approximate:
+            return sk.vocab_diff_estimate(self.signature(graph1), self.signature(graph2))
+
+        return que.Backend.vocab_diff(self, graph1, graph2)
+
+    def vocabulary(self, graph):
+
+        if self.last_vocab[0] == graph:
+            return self.last_vocab[1]
+
+        voc_set = set()
+
+        for triple in stream_triples(self.path(graph)):
+            voc_set.update(triple)
+
+        self.last_vocab = (graph, voc_set)
+
+        return voc_set
+
+    def triple_keys(self, graph):
+
+        if self.last_keys[0] == graph:
+            return self.last_keys[1]
+
+        keys = {triple_key(triple) for triple in stream_triples(self.path(graph))}
+        self.last_keys = (graph, keys)
+
+        return keys
+
+    def diff(self, graph1, graph2):
+
+        previous = self.triple_keys(graph1)
+        current = self.triple_keys(graph2)
+
+        removals = len(previous - current)
+        additions = len(current - previous)
+
+        return {'previous': len(previous),
+                'next': len(current),
+                'additions': additions,
+                'removals': removals,
+                'union': len(previous) + additions}
+
+    def top_entities(self, graph, entity, limit= 10):
+
+        position = {'s': 0, 'p': 1, 'o': 2}[entity]
+
+        counts = Counter(triple[position] for triple in self.distinct_triples(graph))
+
+        return counts.most_common(limit)
+
+    def top_entities_all(self, graph, limit= 10):
+
+        #Subjects, predicates and objects are counted in the same pass over the file
+        if self.approximate:
+            return self.sketch_top_entities(graph, limit)
+
+        counts = {'s': Counter(), 'p': Counter(), 'o': Counter()}
+
+        for s, p, o in self.distinct_triples(graph):
+            counts['s'][s] += 1
+            counts['p'][p] += 1
+            counts['o'][o] += 1
+
+        return {entity: counter.most_common(limit) for entity, counter in counts.items()}
+
+    def sketch_top_entities(self, graph, limit= 10):
+
+        #Like sketch_profile, duplicate lines are counted as often as they occur
+        hitters = {entity: sk.HeavyHitters(self.capacity) for entity in 'spo'}
+        batch = []
+
+        for triple in stream_triples(self.path(graph)):
+            batch.append(triple)
+
+            if len(batch) == self.batch_size:
+                for position, entity in enumerate('spo'):
+                    hitters[entity].add_batch(triple[position] for triple in batch)
+                batch = []
+
+        for position, entity in enumerate('spo'):
+            hitters[entity].add_batch(triple[position] for triple in batch)
+
+        print(f"{graph}: top counts overestimated by at most {hitters['s'].error():.0f} with probability 98%")
+
+        return {entity: hitters[entity].top(limit) for entity in 'spo'}
@@ -0,0 +1,222 @@
+'''
+This file contains predicate-partitioned execution of the whole-graph metrics. The
+predicates of a graph are listed first, then every metric runs per group of predicates in
+parallel, so each query stays small enough for Virtuoso's limits and can be cached on its
+own. Counts are summed. A term can occur under many predicates, so distinct terms are
+merged as sets, or as HyperLogLog/MinHash sketches with approximate=True.
+'''
+
+#! Imports
+from collections import OrderedDict
+
+import executor as ex
+import queries as que
+import sketches as sk
+
+#-----------------------------------------------------------------------------
+
+#! Distinct terms of a partition
+
+class Distinct:
+    '''
+    Distinct terms, kept as a set or, approximately, as a HyperLogLog for the count and a
+    MinHash for comparisons with other versions
+    '''
+
+    def __init__(self, approximate= False, precision= 14, k= 1024):
+        self.approximate = approximate
+        self.precision = precision
+        self.k = k
+
+        if approximate:
+            self.hll = sk.HyperLogLog(precision)
+            self.minhash = sk.MinHash(k)
+        else:
+            self.terms = set()
+
+    def add(self, terms):
+
+        if self.approximate:
+            hashes = sk.term_hashes(terms)
+            self.hll.add_hashes(hashes)
+            self.minhash.add_hashes(hashes)
+        else:
+            self.terms.update(terms)
+
+    def union(self, *others):
+
+        merged = Distinct(self.approximate, self.precision, self.k)
+
+        for distinct in (self,) + others:
+            if self.approximate:
+                merged.hll = merged.hll.merge(distinct.hll)
+                merged.minhash = merged.minhash.merge(distinct.minhash)
+            else:
+                merged.terms |= distinct.terms
+
+        return merged
+
+    def signature(self):
+        return sk.VocabSignature(self.hll, self.minhash)
+
+    def count(self):
+
+        if self.approximate:
+            return round(self.signature().count())
+
+        return len(self.terms)
+
+def predicate_groups(predicates, group_size):
+    predicates = sorted(predicates)
+
+    return [tuple(predicates[i:i + group_size]) for i in range(0, len(predicates), group_size)]
+
+#-----------------------------------------------------------------------------
+
+#! Backend
+
+class PartitionedBackend(que.Backend):
+    '''
+    Runs profile and diff of a graph as one query per predicate group on a pool of
+    SparqlBackends. `factory` is an endpoint URL or a callable as for executor.BackendPool.
+    The merged terms of the most recent graphs are kept for the vocabulary comparisons.
+    '''
+
+    def __init__(self, factory, workers= 4, group_size= 50, approximate= False, precision= 14, k= 1024,
+                 cache= None, keep= 2):
+        self.pool = ex.BackendPool(factory)
+        self.workers = workers
+        self.group_size = group_size
+        self.approximate = approximate
+        self.precision = precision
+        self.k = k
+        self.cache = cache
+        self.keep = keep
+        self.predicate_lists = {}
+        self.recent = OrderedDict()
+
+    def distinct(self):
+        return Distinct(self.approximate, self.precision, self.k)
+
+    def query_text(self, metric, graph, graph2= None):
+
+        if self.approximate:
+            return f'PartitionedBackend approximate precision={self.precision} k={self.k}'
+
+        return 'PartitionedBackend exact'
+
+    def predicates(self, graph):
+
+        if graph not in self.predicate_lists:
+            rows = que.stream_rows(self.pool.get().wrapper, que.q_ipr_check(graph, None, 'g'))
+            self.predicate_lists[graph] = [row['graph_properties'] for row in rows]
+
+        return self.predicate_lists[graph]
+
+    def partition_terms(self, wrapper, graph, group):
+
+        query = que.q_partition_counts(graph, group)
+        counts = que.cached_value(self.cache, graph, 'partition_counts',
+                                  lambda: que.run_query(wrapper, query)['results']['bindings'][0], query= query)
+
+        subjects = self.distinct()
+        subjects.add([row['s'] for row in que.stream_rows(wrapper, que.q_partition_subjects(graph, group))])
+
+        #Literals come back in N-Triples form, everything else is an IRI or blank node
+        objects = [row['o'] for row in que.stream_rows(wrapper, que.q_partition_objects(graph, group))]
+        all_objects = self.distinct()
+        all_objects.add(objects)
+        uobjects = self.distinct()
+        uobjects.add([o for o in objects if not o.startswith('"')])
+
+        return {'triples': int(float(counts['triples']['value'])),
+                'literals': int(float(counts['literals']['value'])),
+                'subjects': subjects,
+                'objects': all_objects,
+                'uobjects': uobjects}
+
+    def terms(self, graph):
+
+        #Merged partitions of a graph, from the recent graphs or from one parallel pass
+        if graph in self.recent:
+            self.recent.move_to_end(graph)
+            return self.recent[graph]
+
+        groups = predicate_groups(self.predicates(graph), self.group_size)
+        tasks = {group: lambda b, g= group: self.partition_terms(b.wrapper, graph, g) for group in groups}
+        parts = list(ex.run_parallel(self.pool, tasks, self.workers).values())
+
+        predicates = self.distinct()
+        predicates.add(self.predicates(graph))
+
+        merged = {'triples': sum(part['triples'] for part in parts),
+                  'literals': sum(part['literals'] for part in parts),
+                  'predicates': predicates}
+
+        for name in ['subjects', 'objects', 'uobjects']:
+            merged[name] = self.distinct().union(*[part[name] for part in parts])
+
+        merged['vocab'] = merged['subjects'].union(predicates, merged['objects'])
+
+        self.recent[graph] = merged
+
+        while len(self.recent) > self.keep:
+            self.recent.popitem(last= False)
+
+        return merged
+
+    def profile(self, graph):
+
+        terms = self.terms(graph)
+
+        profile = {'triples': terms['triples'],
+                   'subjects': terms['subjects'].count(),
+                   'predicates': len(self.predicates(graph)),
+                   'objects': terms['objects'].count(),
+                   'literals': terms['literals'],
+                   'uobjects': terms['uobjects'].count(),
+                   'nodes': terms['subjects'].union(terms['uobjects']).count(),
+                   'vocab': terms['vocab'].count(),
+                   'outdegree_sum': terms['triples']}
+
+        if self.approximate:
+            profile['error'] = terms['vocab'].hll.error()
+
+        return profile
+
+    def vocabulary(self, graph):
+
+        if self.approximate:
+            raise ValueError('Approximate partitions keep no vocabulary, use vocab_diff')
+
+        return self.terms(graph)['vocab'].terms
+
+    def vocab_diff(self, graph1, graph2):
+
+        if self.approximate:
+            return sk.vocab_diff_estimate(self.terms(graph1)['vocab'].signature(), self.terms(graph2)['vocab'].signature())
+
+        return que.Backend.vocab_diff(self, graph1, graph2)
+
+    def diff(self, graph1, graph2):
+
+        #Triples with different predicates never match, so the diff counts are sums
+        predicates = set(self.predicates(graph1)) | set(self.predicates(graph2))
+
+        def partition_diff(wrapper, group):
+            query = que.q_diff(graph1, graph2, group)
+            res = que.cached_value(self.cache, graph1, 'partition_diff',
+                                   lambda: que.run_query(wrapper, query)['results']['bindings'][0], graph2= graph2, query= query)
+
+            return {name: int(float(res[name]['value'])) for name in ['previous', 'next', 'additions', 'removals']}
+
+        tasks = {group: lambda b, g= group: partition_diff(b.wrapper, g) for group in predicate_groups(predicates, self.group_size)}
+        parts = ex.run_parallel(self.pool, tasks, self.workers).values()
+
+        diff = {name: sum(part[name] for part in parts) for name in ['previous', 'next', 'additions', 'removals']}
+        diff['union'] = diff['previous'] + diff['additions']
+
+        return diff
+
+    def top_entities(self, graph, entity, limit= 10):
+        return self.pool.get().top_entities(graph, entity, limit)
@@ -0,0 +1,182 @@
+'''
+This file contains the cross-version presence matrices of classes and properties. Each
+ontology and each graph is asked for its class and property lists a single time, even
+when consecutive versions share the same ontology. ICR, IPR, IMI, the external ratios and
+the ontology growth of every version are then computed from the matrices, without further
+queries.
+'''
+
+#! Imports
+import numpy as np
+import pandas as pd
+
+import queries as que
+
+#-----------------------------------------------------------------------------
+
+#ICR and IPR only count classes and properties of the DBpedia ontology namespace
+dbo = 'http://dbpedia.org/ontology/'
+
+class PresenceMatrix:
+    '''
+    Sparse boolean terms x columns matrix in compressed sparse column form: the term IDs
+    present in column j are indices[indptr[j]:indptr[j + 1]], sorted
+    '''
+
+    def __init__(self, columns):
+        self.indptr = np.zeros(len(columns) + 1, dtype= np.int64)
+        np.cumsum([len(column) for column in columns], out= self.indptr[1:])
+        self.indices = np.concatenate(columns) if columns else np.empty(0, dtype= np.int64)
+
+    def column(self, j):
+        return self.indices[self.indptr[j]:self.indptr[j + 1]]
+
+    def counts(self):
+        return np.diff(self.indptr)
+
+class VersionPresence:
+    '''
+    Classes and properties of every graph version (one column per version) and of every
+    distinct ontology (one column per ontology), over one interned IRI table. Versions
+    without an ontology have empty columns and NaN metrics.
+    '''
+
+    def __init__(self, wrapper, graph_list, ont_list, cache= None, iri_file= None):
+        self.graph_list = graph_list
+        self.iri_file = iri_file
+        self.iris = que.load_iris(iri_file) if iri_file is not None else []
+        self.ids = {iri: id for id, iri in enumerate(self.iris)}
+
+        has_ont = [not (ont == 'None' or que.isNaN(ont)) for ont in ont_list]
+        self.ontologies = list(dict.fromkeys(ont for ont, present in zip(ont_list, has_ont) if present))
+        self.ont_index = np.array([self.ontologies.index(ont) if present else -1
+                                   for ont, present in zip(ont_list, has_ont)], dtype= np.int64)
+
+        #One request per ontology
+        ont_classes, ont_properties, property_rows, subclass_axioms = [], [], [], []
+
+        for ont in self.ontologies:
+            rows = self.fetch(wrapper, cache, ont, 'ont_terms', que.q_ont_terms(ont))
+            ont_classes.append(self.intern(term for term, kind in rows if kind == 'class'))
+            ont_properties.append(self.intern(term for term, kind in rows if kind == 'property'))
+            property_rows.append(sum(kind == 'property' for term, kind in rows))
+            subclass_axioms.append(sum(kind == 'subclass' for term, kind in rows))
+
+        #One request per graph that has an ontology to be compared with
+        graph_classes, graph_properties = [], []
+
+        for graph, present in zip(graph_list, has_ont):
+            rows = self.fetch(wrapper, cache, graph, 'graph_terms', que.q_graph_terms(graph)) if present else []
+            graph_classes.append(self.intern(term for term, kind in rows if kind == 'class'))
+            graph_properties.append(self.intern(term for term, kind in rows if kind == 'property'))
+
+        self.graph_classes = PresenceMatrix(graph_classes)
+        self.graph_properties = PresenceMatrix(graph_properties)
+        self.ont_classes = PresenceMatrix(ont_classes)
+        self.ont_properties = PresenceMatrix(ont_properties)
+        self.property_rows = np.array(property_rows, dtype= float)
+        self.subclass_axioms = np.array(subclass_axioms, dtype= float)
+
+        if iri_file is not None:
+            que.save_iris(iri_file, self.iris)
+
+    def fetch(self, wrapper, cache, graph, metric, query):
+
+        def compute():
+            return [[row['term'], row['kind']] for row in que.stream_rows(wrapper, query)]
+
+        return que.cached_value(cache, graph, metric, compute, query= query)
+
+    def intern(self, terms):
+        terms = list(terms)
+
+        for term in terms:
+            if term not in self.ids:
+                self.ids[term] = len(self.iris)
+                self.iris.append(term)
+
+        return np.unique(np.fromiter((self.ids[term] for term in terms), dtype= np.int64))
+
+    def version_columns(self, kind):
+
+        #(graph matrix, ontology matrix) of 'class' or 'property'
+        if kind == 'class':
+            return self.graph_classes, self.ont_classes
+
+        return self.graph_properties, self.ont_properties
+
+    def set_sizes(self, kind):
+
+        #Per version: |graph|, |ontology|, |graph & ontology| and |graph & dbo namespace|
+        graph, ont = self.version_columns(kind)
+        in_dbo = np.array([iri.startswith(dbo) for iri in self.iris], dtype= bool)
+
+        sizes = {name: np.full(len(self.graph_list), np.nan) for name in ['graph', 'ont', 'both', 'dbo']}
+
+        for v, o in enumerate(self.ont_index):
+            if o < 0:
+                continue
+
+            used = graph.column(v)
+            defined = ont.column(o)
+
+            sizes['graph'][v] = len(used)
+            sizes['ont'][v] = len(defined)
+            sizes['both'][v] = len(np.intersect1d(used, defined, assume_unique= True))
+            sizes['dbo'][v] = np.count_nonzero(in_dbo[used])
+
+        return sizes
+
+    def metrics(self):
+
+        #Everything per version as a DataFrame; ratios with a zero denominator are NaN
+        classes = self.set_sizes('class')
+        properties = self.set_sizes('property')
+
+        ont = np.where(self.ont_index >= 0, self.ont_index, 0)
+        missing = self.ont_index < 0
+        property_rows = np.where(missing, np.nan, self.property_rows[ont] if len(self.ontologies) else np.nan)
+        subclass_axioms = np.where(missing, np.nan, self.subclass_axioms[ont] if len(self.ontologies) else np.nan)
+
+        with np.errstate(divide= 'ignore', invalid= 'ignore'):
+            ratio = lambda enum, denom: np.where(denom > 0, enum / denom, np.nan)
+
+            return pd.DataFrame({'File': self.graph_list,
+                                 'Version': range(len(self.graph_list)),
+                                 'ICR': ratio(classes['dbo'], classes['ont']),
+                                 'IPR': ratio(properties['dbo'], property_rows),
+                                 'IMI': ratio(classes['ont'], subclass_axioms),
+                                 'ExternalClassRatio': ratio(classes['graph'] - classes['both'], classes['graph']),
+                                 'ExternalPropertyRatio': ratio(properties['graph'] - properties['both'], properties['graph']),
+                                 'OntClasses': classes['ont'],
+                                 'InstClasses': classes['both'],
+                                 'OntProperties': properties['ont'],
+                                 'InstProperties': properties['both']})
+
+    def presence_table(self, kind, version_list):
+
+        #The compact icr.csv / ipr.csv of queries.ipcr_presence, from the matrices
+        graph, ont = self.version_columns(kind)
+        versions = [(graph.column(v), ont.column(o)) if o >= 0 else None for v, o in enumerate(self.ont_index)]
+
+        return que.presence_flags(versions, len(self.iris), version_list)
+
+#-----------------------------------------------------------------------------
+
+#! Drivers
+
+def quality_presence(wrapper, graph_list, version_list, ont_list, cache= None, iri_file= 'iris.txt'):
+
+    #quality.csv, icr.csv, ipr.csv and ontology_metrics.csv from one fetch per ontology and graph
+    presence = VersionPresence(wrapper, graph_list, ont_list, cache, iri_file)
+    metrics = presence.metrics()
+
+    que.write_table('quality.csv', {name: list(metrics[name].astype(object).where(metrics[name].notna(), None))
+                                    for name in ['File', 'Version', 'ICR', 'IPR', 'IMI']})
+
+    presence.presence_table('class', version_list).to_csv('icr.csv', index= False, header= True, sep = ';')
+    presence.presence_table('property', version_list).to_csv('ipr.csv', index= False, header= True, sep = ';')
+
+    metrics.to_csv('ontology_metrics.csv', index= False)
+
+    return metrics
@@ -3,11 +3,23 @@ This file contains all the queries and functions that will be sent to our Virtuo
 '''
 
 #! Imports
-from SPARQLWrapper import SPARQLWrapper, CSV, JSON
+from SPARQLWrapper import SPARQLWrapper, CSV, JSON, TSV
+from SPARQLWrapper.SPARQLExceptions import EndPointInternalError
 import csv
+import http.client
+import io
+import logging
+import os
+import re
+import time
+import urllib.error
 import numpy as np
 import pandas as pd
 
+import tracing
+from cache import MetricCache
+from checkpoint import RunManifest
+
 def isNaN(input):
     if type(input) is float:
         return input != input
@@ -16,25 +28,102 @@ def isNaN(input):
 
 #-----------------------------------------------------------------------------
 
+#! Timeouts and retries around every request to the endpoint. Set the values here for a
+#! whole run, e.g. query_policy['timeout'] = 600. A timeout is in seconds on the client
+#! side, a failed request is retried `retries` times, waiting backoff * 2**attempt seconds
+
+query_policy = {'timeout': None, 'retries': 3, 'backoff': 1.0, 'max_backoff': 60.0}
+
+def retryable(error):
+
+    #Timeouts, dropped connections and server errors. Virtuoso reports its own query
+    #timeouts as 500, which SPARQLWrapper raises as EndPointInternalError
+    if isinstance(error, urllib.error.HTTPError):
+        return error.code >= 500 or error.code == 429
+
+    return isinstance(error, (EndPointInternalError, urllib.error.URLError, TimeoutError, ConnectionError,
+                              http.client.HTTPException))
+
+def timed_out(error):
+
+    #Query timeouts of the server (500 from Virtuoso, 504 from a proxy) and of the client
+    if isinstance(error, urllib.error.HTTPError):
+        return error.code in (500, 504)
+    if isinstance(error, urllib.error.URLError):
+        return isinstance(error.reason, TimeoutError)
+
+    return isinstance(error, (EndPointInternalError, TimeoutError))
+
+#Retries are reported here and in the trace, not on stdout
+log = logging.getLogger(__name__)
+
+def with_retries(wrapper, query, request, retry_timeouts= True):
+
+    #request(wrapper) sends the query that is set; it is repeated until it succeeds, fails
+    #with an error that is not retryable, or the retries are used up. With
+    #retry_timeouts=False a timeout is raised at once, for callers that have a cheaper
+    #way to get the result than waiting for the same timeout again
+    wrapper.setQuery(query)
+
+    if query_policy['timeout'] is not None:
+        wrapper.setTimeout(query_policy['timeout'])
+
+    for attempt in range(query_policy['retries'] + 1):
+        try:
+            return request(wrapper)
+        except Exception as error:
+            if not retryable(error) or attempt == query_policy['retries']:
+                raise
+            if not retry_timeouts and timed_out(error):
+                raise
+
+            delay = min(query_policy['backoff'] * 2**attempt, query_policy['max_backoff'])
+            log.warning(f"Query failed ({type(error).__name__}), retry {attempt + 1}/{query_policy['retries']} in {delay:.1f}s")
+            tracing.retry(type(error).__name__, attempt + 1, delay)
+            time.sleep(delay)
+
+def run_query(wrapper, query, retry_timeouts= True):
+
+    #Converted result of the query, in the wrapper's return format
+    if not tracing.enabled:
+        return with_retries(wrapper, query, lambda w: w.query().convert(), retry_timeouts)
+
+    request = tracing.Request(query)
+
+    def traced(w):
+        result = w.query()
+        result.response = request.opened(result.response)
+
+        return result.convert()
+
+    try:
+        res = with_retries(wrapper, query, traced, retry_timeouts)
+    except Exception as error:
+        request.finish(error= type(error).__name__)
+        raise
+
+    request.finish(len(res['results']['bindings']) if isinstance(res, dict) and 'results' in res else None)
+
+    return res
+
+#-----------------------------------------------------------------------------
+
 #! Must be run first to get the graph lists
 
 def graph_retr(wrapper):
     
     # Set the SPARQL query to retrieve graph URIs starting with "http://example.com/"
-    wrapper.setQuery('''
+    query = '''
         SELECT DISTINCT ?g
         WHERE {
             GRAPH ?g {
                 ?s ?p ?o .
             }
         }
-    ''')
-
-    # Execute the query and convert the result to JSON
-    result = wrapper.query().convert()
+    '''
 
-    # Extract the list of graph URIs from the JSON result
-    graph_uris = [binding['g']['value'] for binding in result['results']['bindings']]
+    # Extract the list of graph URIs from the streamed result
+    graph_uris = [row['g'] for row in stream_rows(wrapper, query)]
 
     wiki_list = []
     db_list = []  
@@ -56,8 +145,7 @@ def graph_retr(wrapper):
 #! Now we want to combine all the queries so we get the results
 def query_retriever(wrapper, query, name):
     
-    wrapper.setQuery(query)
-    res = wrapper.query().convert()
+    res = run_query(wrapper, query)
 
     res = res['results']['bindings'][0][f'{name}']['value']
 
@@ -67,59 +155,590 @@ def query_retriever(wrapper, query, name):
 
 #-------------------------------------------------------------------------
 
-#! Create a csv file with basic information about all graphs
+#! Streaming result readers for large results. Rows are parsed while the response
+#! arrives and are handed out one by one, so no document of all bindings is built
 
-def data_info(wrapper, graph_list):
-    info_dict ={'File':[],
-                'Subjects': [], 
-                'Predicates':[],
-                'Objects': [],
-                'Triples': [] }
+tsv_escapes = {'t': '\t', 'n': '\n', 'r': '\r', '"': '"', "'": "'", '\\': '\\'}
 
-    for graph in graph_list:
-        
-        #Get number of distinct subjects, predicates and objects
-        wrapper.setQuery(f'''
-            SELECT
-                (COUNT(DISTINCT ?s) as ?numSubjects)
-                (COUNT(DISTINCT ?p) as ?numPredicates)
-                (COUNT(DISTINCT ?o) as ?numObjects)
-            FROM NAMED <{graph}>
-            WHERE {{
-            GRAPH <{graph}> {{
-                ?s ?p ?o .
+def tsv_value(term):
+
+    #TSV results hold terms in Turtle syntax, reduce them to the plain value JSON gives
+    if term.startswith('<') and term.endswith('>'):
+        return term[1:-1]
+
+    if term.startswith('"'):
+        end = term.rindex('"')
+        return re.sub(r'\\(.)', lambda m: tsv_escapes.get(m.group(1), m.group(0)), term[1:end])
+
+    return term
+
+def csv_rows(response):
+
+    reader = csv.reader(io.TextIOWrapper(response, encoding= 'utf-8', newline= ''))
+    header = next(reader, [])
+
+    for row in reader:
+        yield dict(zip(header, row))
+
+def tsv_rows(response):
+
+    lines = io.TextIOWrapper(response, encoding= 'utf-8', newline= '\n')
+    header = [var.lstrip('?') for var in next(lines, '').rstrip('\r\n').split('\t')]
+
+    for line in lines:
+        line = line.rstrip('\r\n')
+
+        if line:
+            yield dict(zip(header, (tsv_value(term) for term in line.split('\t'))))
+
+def stream_rows(wrapper, query, format= CSV):
+
+    #Yields every result row as a dictionary from variable name to value. The wrapper
+    #keeps its own return format for the functions that still use convert(). Only opening
+    #the response is retried, rows that have been handed out can not be taken back
+    return_format = wrapper.returnFormat
+    wrapper.setReturnFormat(format)
+    request = tracing.Request(query) if tracing.enabled else None
+
+    try:
+        response = with_retries(wrapper, query, lambda w: w.query().response)
+    except Exception as error:
+        if request is not None:
+            request.finish(error= type(error).__name__)
+        raise
+    finally:
+        wrapper.setReturnFormat(return_format)
+
+    if request is not None:
+        response = request.opened(response)
+
+    rows = tsv_rows(response) if format == TSV else csv_rows(response)
+
+    if request is not None:
+        return tracing.count_rows(rows, request)
+
+    return rows
+
+#-------------------------------------------------------------------------
+
+#! Backends: the drivers below accept a SPARQLWrapper or any Backend, so the same
+#! metrics can run against Virtuoso or straight from dump files (see ntriples.py)
+
+class Backend:
+    '''
+    Interface every metric source implements. Graphs are whatever identifiers the
+    backend understands (graph IRIs for Virtuoso, file paths for dumps).
+    '''
+
+    def profile(self, graph):
+        #Dictionary with the keys produced by graph_profile
+        raise NotImplementedError
+
+    def vocabulary(self, graph):
+        #Set of every distinct term in subject, predicate or object position
+        raise NotImplementedError
+
+    def vocab_diff(self, graph1, graph2):
+        #Vocabulary counts 'removed', 'added' and 'union' of graph2 against graph1
+        old_set = self.vocabulary(graph1)
+        new_set = self.vocabulary(graph2)
+
+        removed = len(old_set - new_set)
+        added = len(new_set - old_set)
+
+        #Both vocabularies are already here, so the union needs no extra vocab_union query
+        return {'removed': removed, 'added': added, 'union': len(old_set) + added}
+
+    def diff(self, graph1, graph2):
+        #Triple counts 'previous', 'next', 'additions', 'removals' and 'union' of graph2 against graph1
+        raise NotImplementedError
+
+    def change_ratios(self, graph1, graph2):
+        #[ChangeRatio, AddCR, RemCR, Growth] of graph2 relative to graph1
+        return diff_ratios(self.diff(graph1, graph2))
+
+    def top_entities(self, graph, entity, limit= 10):
+        #List of (name, count) for the most frequent terms in position s, p or o
+        raise NotImplementedError
+
+    def top_entities_all(self, graph, limit= 10):
+        #top_entities for 's', 'p' and 'o' at once. Local backends count all three in one pass
+        return {entity: self.top_entities(graph, entity, limit) for entity in 'spo'}
+
+    def clustering(self, graph):
+        #Clustering coefficient. q_cluster / q_cluster2 never finish on real dumps, so
+        #only backends with a local graph (snapshot.SnapshotBackend) compute it
+        return 0
+
+    def query_text(self, metric, graph, graph2= None):
+        #Identifies how a metric is computed, so cached results change when this does
+        return type(self).__name__
+
+class SparqlBackend(Backend):
+    '''
+    Runs the metrics on the Virtuoso endpoint behind a configured SPARQLWrapper
+    '''
+
+    def __init__(self, wrapper, page_size= None):
+        self.wrapper = wrapper
+
+        #Rows per vocabulary page, only for endpoints that cap result sizes (see query_set)
+        self.page_size = page_size
+
+        #Vocabulary of the last version downloaded. In a version chain it is the old
+        #side of the next pair, so every vocabulary is only paged through once
+        self.last_vocab = (None, None)
+
+    def profile(self, graph):
+        res = run_query(self.wrapper, q_profile(graph))['results']['bindings'][0]
+
+        profile = {name: int(float(res[name]['value'])) for name in profile_keys}
+
+        #Every triple adds one to the out-degree of its subject, so the sum is the triple count
+        profile['outdegree_sum'] = profile['triples']
+
+        return profile
+
+    def vocabulary(self, graph):
+
+        if self.last_vocab[0] == graph:
+            return self.last_vocab[1]
+
+        voc_set = vocab_set(self.wrapper, graph, page_size= self.page_size)
+        self.last_vocab = (graph, voc_set)
+
+        return voc_set
+
+    def diff(self, graph1, graph2):
+
+        try:
+            res = run_query(self.wrapper, q_diff(graph1, graph2), retry_timeouts= False)['results']['bindings'][0]
+        except Exception as error:
+            if not retryable(error):
+                raise
+
+            #The MINUS joins of two large graphs are what times out, and would time out again
+            #on a retry. Triples with different predicates never match, so the counts are
+            #sums over one diff per predicate
+            print(f'Diff of {graph1} and {graph2} failed ({type(error).__name__}), splitting it per predicate')
+            return self.partitioned_diff(graph1, graph2)
+
+        diff = {name: int(float(res[name]['value'])) for name in ['previous', 'next', 'additions', 'removals']}
+
+        #Everything in graph1 plus what graph2 added, without a third MINUS for the union
+        diff['union'] = diff['previous'] + diff['additions']
+
+        return diff
+
+    def partitioned_diff(self, graph1, graph2):
+
+        predicates = [row['p'] for row in stream_rows(self.wrapper, q_pair_predicates(graph1, graph2))]
+        diff = {'previous': 0, 'next': 0, 'additions': 0, 'removals': 0}
+
+        for predicate in predicates:
+            res = run_query(self.wrapper, q_diff(graph1, graph2, predicate))['results']['bindings'][0]
+
+            for name in diff:
+                diff[name] += int(float(res[name]['value']))
+
+        diff['union'] = diff['previous'] + diff['additions']
+
+        return diff
+
+    def top_entities(self, graph, entity, limit= 10):
+        rows = stream_rows(self.wrapper, q_top_entities(graph, entity, limit))
+
+        return [(l[entity], int(l['count'])) for l in rows]
+
+    def query_text(self, metric, graph, graph2= None):
+
+        if metric == 'profile':
+            return q_profile(graph)
+        if metric == 'diff':
+            return q_diff(graph, graph2)
+        if metric == 'vocab_diff':
+            return query_set(graph, limit= self.page_size)
+        if metric.startswith('top_'):
+            entity, limit = metric.split('_')[1:]
+            return q_top_entities(graph, entity, limit)
+        if metric.startswith('topk_'):
+            limit = metric.split('_')[1]
+            return ''.join(q_top_entities(graph, entity, limit) for entity in 'spo')
+
+        return Backend.query_text(self, metric, graph, graph2)
+
+class CachedBackend(Backend):
+    '''
+    Looks every result of another backend up in a cache.MetricCache first, so a rerun
+    only computes the graphs and pairs that are not stored yet
+    '''
+
+    def __init__(self, backend, cache):
+        self.backend = backend
+        self.cache = cache
+
+    def lookup(self, metric, compute, graph, graph2= None):
+        query = self.backend.query_text(metric, graph, graph2)
+
+        return self.cache.cached(graph, metric, compute, graph2= graph2, query= query)
+
+    def profile(self, graph):
+        return self.lookup('profile', lambda: self.backend.profile(graph), graph)
+
+    def vocabulary(self, graph):
+        #Whole vocabularies are too large to store, only the counts derived from them are
+        return self.backend.vocabulary(graph)
+
+    def vocab_diff(self, graph1, graph2):
+        return self.lookup('vocab_diff', lambda: self.backend.vocab_diff(graph1, graph2), graph1, graph2)
+
+    def diff(self, graph1, graph2):
+        return self.lookup('diff', lambda: self.backend.diff(graph1, graph2), graph1, graph2)
+
+    def top_entities(self, graph, entity, limit= 10):
+        top = self.lookup(f'top_{entity}_{limit}', lambda: self.backend.top_entities(graph, entity, limit), graph)
+
+        return [tuple(pair) for pair in top]
+
+    def top_entities_all(self, graph, limit= 10):
+        top = self.lookup(f'topk_{limit}', lambda: self.backend.top_entities_all(graph, limit), graph)
+
+        return {entity: [tuple(pair) for pair in pairs] for entity, pairs in top.items()}
+
+    def clustering(self, graph):
+        return self.lookup('clustering', lambda: self.backend.clustering(graph), graph)
+
+    def query_text(self, metric, graph, graph2= None):
+        return self.backend.query_text(metric, graph, graph2)
+
+class TracedBackend(Backend):
+    '''
+    Records every metric of another backend as a trace span tagged with its graphs (see
+    tracing.py). Other attributes, e.g. the wrapper of a SparqlBackend, are the backend's own
+    '''
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
+
+    def profile(self, graph):
+        with tracing.span('profile', graph):
+            return self.backend.profile(graph)
+
+    def vocabulary(self, graph):
+        with tracing.span('vocabulary', graph):
+            return self.backend.vocabulary(graph)
+
+    def vocab_diff(self, graph1, graph2):
+        with tracing.span('vocab_diff', graph1, graph2):
+            return self.backend.vocab_diff(graph1, graph2)
+
+    def diff(self, graph1, graph2):
+        with tracing.span('diff', graph1, graph2):
+            return self.backend.diff(graph1, graph2)
+
+    def change_ratios(self, graph1, graph2):
+        with tracing.span('change_ratios', graph1, graph2):
+            return self.backend.change_ratios(graph1, graph2)
+
+    def top_entities(self, graph, entity, limit= 10):
+        with tracing.span(f'top_{entity}', graph):
+            return self.backend.top_entities(graph, entity, limit)
+
+    def top_entities_all(self, graph, limit= 10):
+        with tracing.span('top_entities_all', graph):
+            return self.backend.top_entities_all(graph, limit)
+
+    def clustering(self, graph):
+        with tracing.span('clustering', graph):
+            return self.backend.clustering(graph)
+
+    def query_text(self, metric, graph, graph2= None):
+        return self.backend.query_text(metric, graph, graph2)
+
+def wraps(backend, kind):
+
+    #Whether backend or a backend inside it is a `kind`
+    while backend is not None:
+        if isinstance(backend, kind):
+            return True
+        backend = getattr(backend, 'backend', None) if isinstance(backend, (CachedBackend, TracedBackend)) else None
+
+    return False
+
+def as_backend(wrapper, cache= None):
+
+    if not isinstance(wrapper, Backend):
+        wrapper = SparqlBackend(wrapper)
+
+    if cache is not None and not wraps(wrapper, CachedBackend):
+        wrapper = CachedBackend(wrapper, cache)
+
+    #Outermost, so cache hits show up in the trace as well
+    if tracing.enabled and not wraps(wrapper, TracedBackend):
+        wrapper = TracedBackend(wrapper)
+
+    return wrapper
+
+def cached_value(cache, graph, metric, compute, graph2= None, query= None):
+
+    #For results that do not go through a backend, e.g. the quality queries. They are
+    #traced as metrics of their own
+    with tracing.span(metric, graph, graph2):
+        if cache is None:
+            return compute()
+
+        return cache.cached(graph, metric, compute, graph2= graph2, query= query)
+
+#-------------------------------------------------------------------------
+
+#! One combined pass per graph that every single-graph metric is derived from
+
+def q_profile(graph):
+    q_prof = f'''
+        SELECT ?triples ?subjects ?predicates ?objects ?literals ?uobjects ?nodes ?vocab
+        FROM NAMED <{graph}>
+        WHERE {{
+
+        #Counts that only need the plain triple pattern
+            {{
+            SELECT (count(*) as ?triples)
+                   (count(DISTINCT ?s) as ?subjects)
+                   (count(DISTINCT ?p) as ?predicates)
+                   (count(DISTINCT ?o) as ?objects)
+                   (sum(if(isLiteral(?o), 1, 0)) as ?literals)
+            WHERE {{ GRAPH <{graph}> {{?s ?p ?o}} }}
+            }}
+
+        #Distinct non-literal objects
+            {{
+            SELECT (count(DISTINCT ?o) as ?uobjects)
+            WHERE {{ GRAPH <{graph}> {{?s ?p ?o filter(!isLiteral(?o))}} }}
+            }}
+
+        #Distinct non-literal nodes (subjects and resource objects)
+            {{
+            SELECT (count(DISTINCT ?node) as ?nodes)
+            WHERE {{ GRAPH <{graph}> {{
+                {{?node ?p ?o}}
+                UNION
+                {{?s ?p ?node filter(!isLiteral(?node))}}
+                    }}
                 }}
             }}
-        ''')
 
-        results = wrapper.query().convert()
+        #Vocabulary over all three positions
+            {{
+            SELECT (count(DISTINCT ?entity) as ?vocab)
+            WHERE {{ GRAPH <{graph}> {{
+                {{?entity ?p ?o}}
+                UNION
+                {{?s ?entity ?o}}
+                UNION
+                {{?s ?p ?entity}}
+                    }}
+                }}
+            }}
+        }}
+    '''
 
-        for result in results['results']['bindings']:
-            numSubjects = result['numSubjects']['value']
-            numPredicates = result['numPredicates']['value']
-            numObjects = result['numObjects']['value']
-        
-        #Get number of triples
-        wrapper.setQuery(f'''
-            SELECT count(*)
-            FROM NAMED <{graph}>
+    return q_prof
+
+profile_keys = ['triples', 'subjects', 'predicates', 'objects', 'literals', 'uobjects', 'nodes', 'vocab']
+
+#Profiles of this run when no MetricCache is passed, so data_info and
+#structure_and_content still share one profile pass per graph. It is an in-memory
+#MetricCache, keyed by backend and mode (Backend.query_text) as well as by graph;
+#new_run() starts over, e.g. after a dump or the endpoint's data has changed
+run_cache = None
+
+def new_run():
+    global run_cache
+    run_cache = MetricCache(':memory:')
+
+def graph_profile(wrapper, graph, cache= None):
+
+    #One pass per graph
+    if cache is None:
+        if run_cache is None:
+            new_run()
+        cache = run_cache
+
+    return as_backend(wrapper, cache).profile(graph)
+
+def profile_density(profile):
+
+    #Same node count as q_density: subjects + resource objects + literal occurrences
+    V = profile['subjects'] + profile['uobjects'] + profile['literals']
+
+    if V < 2:
+        return 0.0
+
+    return profile['triples'] / (V * (V - 1))
+
+def profile_knowledge_degree(profile):
+
+    if profile['nodes'] == 0:
+        return 0.0
+
+    return profile['outdegree_sum'] / profile['nodes']
+
+def profile_voc_uni(profile):
+
+    if profile['triples'] == 0:
+        return 0.0
+
+    return profile['vocab'] / profile['triples']
+
+#-------------------------------------------------------------------------
+
+#! All change metrics of a version pair come from one diff of their triples
+
+def predicate_pattern(predicate):
+
+    #Predicate term and VALUES clause restricting ?s ?p ?o patterns to one predicate IRI
+    #or a list of them; no restriction for None
+    if predicate is None:
+        return '?p', ''
+    if isinstance(predicate, str):
+        return f'<{predicate}>', ''
+
+    return '?p', ' VALUES ?p {' + ' '.join(f'<{p}>' for p in predicate) + '}'
+
+def q_diff(graph1, graph2, predicate= None):
+
+    #With a predicate (or list of predicates) only the triples with it are compared
+    p, values = predicate_pattern(predicate)
+
+    q_dif = f'''
+        SELECT ?previous ?next ?removals ?additions
+        FROM NAMED <{graph1}>
+        FROM NAMED <{graph2}>
+        WHERE {{
+
+            {{
+            SELECT (count(*) as ?previous)
+            WHERE {{GRAPH <{graph1}> {{?s {p} ?o{values}}} }}
+            }}
+
+            {{
+            SELECT (count(*) as ?next)
+            WHERE {{GRAPH <{graph2}> {{?s {p} ?o{values}}} }}
+            }}
+
+            {{
+            SELECT (count(*) as ?removals)
             WHERE {{
-            GRAPH <{graph}> {{
-                ?s ?p ?o .
+                {{SELECT * WHERE {{GRAPH <{graph1}> {{?s {p} ?o{values}}} }} }}
+                MINUS
+                {{SELECT * WHERE {{GRAPH <{graph2}> {{?s {p} ?o{values}}} }} }}
+                }}
+            }}
+
+            {{
+            SELECT (count(*) as ?additions)
+            WHERE {{
+                {{SELECT * WHERE {{GRAPH <{graph2}> {{?s {p} ?o{values}}} }} }}
+                MINUS
+                {{SELECT * WHERE {{GRAPH <{graph1}> {{?s {p} ?o{values}}} }} }}
                 }}
             }}
-        ''')
+        }}
+    '''
+
+    return q_dif
+
+def q_pair_predicates(graph1, graph2):
+
+    q_pred = f'''
+        SELECT DISTINCT ?p
+        FROM NAMED <{graph1}>
+        FROM NAMED <{graph2}>
+        WHERE {{
+            {{GRAPH <{graph1}> {{?s ?p ?o}} }}
+            UNION
+            {{GRAPH <{graph2}> {{?s ?p ?o}} }}
+        }}
+    '''
+
+    return q_pred
+
+#Partial counts of one graph restricted to a predicate group, see partitions.py
+
+def q_partition_counts(graph, predicates):
+    p, values = predicate_pattern(predicates)
 
-        res = wrapper.query().convert()
+    q_part = f'''
+        SELECT (count(*) as ?triples) (sum(if(isLiteral(?o), 1, 0)) as ?literals)
+        FROM NAMED <{graph}>
+        WHERE {{ GRAPH <{graph}> {{?s {p} ?o{values}}} }}
+    '''
+
+    return q_part
+
+def q_partition_subjects(graph, predicates):
+    p, values = predicate_pattern(predicates)
+
+    q_part = f'''
+        SELECT DISTINCT ?s
+        FROM NAMED <{graph}>
+        WHERE {{ GRAPH <{graph}> {{?s {p} ?o{values}}} }}
+    '''
 
-        triples = res['results']['bindings'][0]['callret-0']['value']
+    return q_part
+
+def q_partition_objects(graph, predicates):
+
+    #Literals are returned in N-Triples form, so they can not collide with IRIs and keep
+    #their language tag and datatype apart
+    p, values = predicate_pattern(predicates)
+
+    q_part = f'''
+        SELECT DISTINCT (if(isLiteral(?obj), concat('"', str(?obj), '"', if(lang(?obj) != '', concat('@', lang(?obj)),
+                         concat('^^<', str(datatype(?obj)), '>'))), ?obj) as ?o)
+        FROM NAMED <{graph}>
+        WHERE {{ GRAPH <{graph}> {{?s {p} ?obj{values}}} }}
+    '''
+
+    return q_part
+
+def diff_ratios(diff):
+
+    #Same definitions as q_change_ratio, q_add_change_ratio, q_rem_change_ratio and q_growth
+    if diff['previous'] == 0:
+        return [0, 0, 0, 0]
+
+    change_ratio = (diff['additions'] + diff['removals']) / diff['union']
+    add_cr = diff['additions'] / diff['previous']
+    rem_cr = diff['removals'] / diff['previous']
+    growth = diff['next'] / diff['previous']
+
+    return [change_ratio, add_cr, rem_cr, growth]
+
+#-------------------------------------------------------------------------
+
+#! Create a csv file with basic information about all graphs
+
+def data_info(wrapper, graph_list, cache= None):
+    info_dict ={'File':[],
+                'Subjects': [], 
+                'Predicates':[],
+                'Objects': [],
+                'Triples': [] }
+
+    for graph in graph_list:
+        
+        #Counts come from the cached profile, so structure_and_content can reuse them
+        profile = graph_profile(as_backend(wrapper, cache), graph)
 
         #Inserting values into the dictionary
         info_dict['File'].append(graph)
-        info_dict['Subjects'].append(numSubjects)
-        info_dict['Predicates'].append(numPredicates)
-        info_dict['Objects'].append(numObjects)
-        info_dict['Triples'].append(triples)
+        info_dict['Subjects'].append(profile['subjects'])
+        info_dict['Predicates'].append(profile['predicates'])
+        info_dict['Objects'].append(profile['objects'])
+        info_dict['Triples'].append(profile['triples'])
 
         print(f'{graph} completed')
     
@@ -501,38 +1120,91 @@ WHERE{{
     
     return rem_cr
 
-def query_set(graph, offset = 0):
+def q_top_entities(graph, entity, limit= 10):
+
+    q_top = f'''select ?{entity} (count(?{entity}) as ?count)
+                from named <{graph}>
+                where {{ GRAPH <{graph}>
+                {{?s ?p ?o}}
+                }}
+                ORDER BY desc (?count) limit {limit}
+                '''
+
+    return q_top
+
+def sparql_string(value):
+
+    #Quote a Python string as a SPARQL string literal
+    escaped = value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n').replace('\r', '\\r')
+
+    return f'"{escaped}"'
+
+def query_set(graph, after= None, limit= None):
+
+    #Without a limit the whole vocabulary is one streamed DISTINCT, with no sort. A limit
+    #pages through it by key instead: every page starts at the last key of the one before,
+    #which avoids OFFSET, but the server still evaluates the whole UNION, DISTINCT and
+    #sort for every page, so paging costs O(pages x graph). Only for endpoints that cap
+    #the rows of a result
+    if limit is None:
+        keyset, order, page = '', '', ''
+    else:
+        keyset = f'FILTER(STR(?entity) >= {sparql_string(after)})' if after is not None else ''
+        order = 'ORDER BY STR(?entity)'
+        page = f'LIMIT {limit}'
+
     q_vocab = f'''
-    SELECT (?entity as ?vocab_set)
-      WHERE{{
-      {{SELECT DISTINCT ?entity
-        WHERE{{GRAPH <{graph}> {{
+    SELECT DISTINCT (?entity as ?vocab_set)
+      WHERE{{GRAPH <{graph}> {{
         {{?entity ?p ?o}}
         UNION
         {{?s ?entity ?o}}
         UNION
         {{?s ?p ?entity}}
             }}
-          }} OFFSET {offset} LIMIT 1048576
+        {keyset}
         }}
-       }}'''
+      {order}
+      {page}'''
     
     return q_vocab
 
-def vocab_set(wrapper, graph):
+def vocab_set(wrapper, graph, page_size= None, report_every= 1000000):
 
-    incr = 0
+    #By default the vocabulary is one streamed request. Set page_size to at most the
+    #ResultSetMaxRows of an endpoint that cuts results off; every page then costs a full
+    #evaluation of the query on the server (see query_set)
     voc_set = set()
+    last = None
+    rows = 0
+    start = time.time()
+
+    while True:
+        page_rows = 0
+        page_last = last
 
-    while incr % 1048576 == 0:
-            q_vocab = query_set(graph, offset= incr)
+        for row in stream_rows(wrapper, query_set(graph, after= last, limit= page_size)):
+            voc_set.add(row['vocab_set'])
+            page_last = row['vocab_set']
+            page_rows += 1
+            rows += 1
 
-            wrapper.setQuery(q_vocab)
-            res = wrapper.query().convert()
+            if report_every and rows % report_every == 0:
+                print(f'{graph}: {rows} rows, {rows / (time.time() - start):.0f} rows/sec')
 
-            for ans in res['results']['bindings']:
-                voc_set.add(ans['vocab_set']['value'])
-                incr +=1
+        #A short page is the last one, which also covers an empty first page
+        if page_size is None or page_rows < page_size:
+            break
+
+        #A full page of one single key would be fetched again and again
+        if page_last == last:
+            print(f'{graph}: more than {page_size} terms share the key {last!r}, stopping')
+            break
+
+        last = page_last
+
+    elapsed = time.time() - start
+    print(f'{graph}: {len(voc_set)} terms from {rows} rows in {elapsed:.1f} s ({rows / max(elapsed, 1e-9):.0f} rows/sec)')
 
     return voc_set
 
@@ -570,26 +1242,23 @@ def vocab_union(wrapper, graph1, graph2):
   
   return denom  
 
-def vocab_dyna(wrapper, graph1, graph2):
-
-    old_set = vocab_set(wrapper, graph1)
-    new_set = vocab_set(wrapper, graph2)
-
-    old_vocab = len(old_set - new_set)
-    new_vocab = len(new_set - old_set)
-
-    enum = old_vocab + new_vocab
+def vocab_ratios(vdiff):
 
-    denom = vocab_union(wrapper, graph1, graph2)
+    enum = vdiff['removed'] + vdiff['added']
+    denom = vdiff['union']
 
     vdyn = enum/denom
-    add_vdyn = new_vocab/denom
-    rem_vdyn = old_vocab/denom
+    add_vdyn = vdiff['added']/denom
+    rem_vdyn = vdiff['removed']/denom
 
     final = [vdyn, add_vdyn, rem_vdyn]
 
     return final
 
+def vocab_dyna(wrapper, graph1, graph2):
+
+    return vocab_ratios(as_backend(wrapper).vocab_diff(graph1, graph2))
+
 def q_icr(graph, ont):
     
     q_icr = f'''
@@ -661,29 +1330,20 @@ def q_icr_check(graph, ont, request):
         '''
         return q_icr
 
-def icr_set(wrapper, graph, ont):
-
-    if ont == 'None' or isNan(ont):
-        return None, None, None, None
+def icr_sets(wrapper, graph, ont):
 
-    graph_set = set()
-    owl_set = set()
+    #Classes used in the graph and classes defined in the ontology
+    graph_set = {ans['graph_classes'] for ans in stream_rows(wrapper, q_icr_check(graph, ont, request= 'g'))}
+    owl_set = {ans['owl_classes'] for ans in stream_rows(wrapper, q_icr_check(graph, ont, request= 'o'))}
 
-    q_icr = q_icr_check(graph, ont, request= 'g')
+    return graph_set, owl_set
 
-    wrapper.setQuery(q_icr)
-    res = wrapper.query().convert()
+def icr_set(wrapper, graph, ont):
 
-    for ans in res['results']['bindings']:
-        graph_set.add(ans['graph_classes']['value'])
-    
-    q_icr = q_icr_check(graph, ont, request= 'o')
+    if ont == 'None' or isNaN(ont):
+        return None, None, None, None
 
-    wrapper.setQuery(q_icr)
-    res = wrapper.query().convert()
-    
-    for ans in res['results']['bindings']:
-        owl_set.add(ans['owl_classes']['value'])
+    graph_set, owl_set = icr_sets(wrapper, graph, ont)
 
     return (graph_set - owl_set), (owl_set - graph_set), len(graph_set), len(owl_set)
 
@@ -761,29 +1421,20 @@ def q_ipr_check(graph, ont, request):
             '''
     return q_ipr
 
-def ipr_set(wrapper, graph, ont):
-
-    if ont == 'None' or isNaN(ont):
-        return None, None, None, None
+def ipr_sets(wrapper, graph, ont):
 
-    graph_set = set()
-    owl_set = set()
+    #Properties used in the graph and properties defined in the ontology
+    graph_set = {ans['graph_properties'] for ans in stream_rows(wrapper, q_ipr_check(graph, ont, request= 'g'))}
+    owl_set = {ans['owl_properties'] for ans in stream_rows(wrapper, q_ipr_check(graph, ont, request= 'o'))}
 
-    q_ipr = q_ipr_check(graph, ont, request= 'g')
+    return graph_set, owl_set
 
-    wrapper.setQuery(q_ipr)
-    res = wrapper.query().convert()
+def ipr_set(wrapper, graph, ont):
 
-    for ans in res['results']['bindings']:
-        graph_set.add(ans['graph_properties']['value'])
-    
-    q_ipr = q_ipr_check(graph, ont, request= 'o')
+    if ont == 'None' or isNaN(ont):
+        return None, None, None, None
 
-    wrapper.setQuery(q_ipr)
-    res = wrapper.query().convert()
-    
-    for ans in res['results']['bindings']:
-        owl_set.add(ans['owl_properties']['value'])
+    graph_set, owl_set = ipr_sets(wrapper, graph, ont)
 
     return (graph_set - owl_set), (owl_set - graph_set), len(graph_set), len(owl_set)
 
@@ -823,23 +1474,216 @@ def q_imi(ont):
     '''
     return q_imi
 
-def structure_and_content(wrapper, graph_list):
+def q_ont_terms(ont):
+
+    #Classes, properties and subClassOf axioms of an ontology as rows (?term, ?kind).
+    #Not DISTINCT, so the rows of a kind count like count(*) in q_ipr and q_imi
+    q_ont = f'''
+    PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
+    PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
+    PREFIX owl: <http://www.w3.org/2002/07/owl#>
+
+    SELECT ?term ?kind
+    FROM NAMED <{ont}>
+    WHERE {{ GRAPH <{ont}> {{
+        {{?term rdf:type owl:Class BIND('class' as ?kind)}}
+        UNION
+        {{?term rdf:type rdfs:Class BIND('class' as ?kind)}}
+        UNION
+        {{?term rdf:type owl:ObjectProperty BIND('property' as ?kind)}}
+        UNION
+        {{?term rdf:type owl:DatatypeProperty BIND('property' as ?kind)}}
+        UNION
+        {{?term rdf:type owl:FunctionalProperty BIND('property' as ?kind)}}
+        UNION
+        {{?term rdfs:subClassOf ?super BIND('subclass' as ?kind)}}
+        }}
+    }}
+    '''
+    return q_ont
+
+def q_graph_terms(graph):
+
+    #Distinct classes and properties used in a graph as rows (?term, ?kind)
+    q_terms = f'''
+    PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
+
+    SELECT DISTINCT ?term ?kind
+    FROM NAMED <{graph}>
+    WHERE {{ GRAPH <{graph}> {{
+        {{?s rdf:type ?term BIND('class' as ?kind)}}
+        UNION
+        {{?s ?term ?o BIND('property' as ?kind)}}
+        }}
+    }}
+    '''
+    return q_terms
+
+#-------------------------------------------------------------------------
+
+#! Several metrics of one graph in a single request. Every metric names the counting
+#! subselects it needs, so counts shared by metrics (the ontology classes of ICR and IMI)
+#! are only computed once, and the metric values are derived from the counts afterwards
+
+def quality_subselects(graph, ont):
+
+    #Each subselect projects one count named like its key
+    return {'graph_classes': f'''
+            SELECT (COUNT(DISTINCT ?class) as ?graph_classes)
+            WHERE {{ GRAPH <{graph}> {{
+                ?s rdf:type ?class .
+                FILTER(isUri(?class) && STRSTARTS(STR(?class), STR(dbo:)))
+                }}
+            }}''',
+            'graph_properties': f'''
+            SELECT (COUNT(DISTINCT ?property) as ?graph_properties)
+            WHERE {{ GRAPH <{graph}> {{
+                ?subject ?property ?object .
+                FILTER(isUri(?property) && STRSTARTS(STR(?property), STR(dbo:)))
+                }}
+            }}''',
+            'ont_classes': f'''
+            SELECT (COUNT(DISTINCT ?s) as ?ont_classes)
+            WHERE {{ GRAPH <{ont}> {{?s ?p ?o
+                {{?s rdf:type owl:Class}}
+                UNION
+                {{?s rdf:type rdfs:Class}}
+                }}
+            }}''',
+            'ont_properties': f'''
+            SELECT (COUNT(*) as ?ont_properties)
+            WHERE {{ GRAPH <{ont}> {{
+                {{?property rdf:type owl:ObjectProperty}}
+                UNION
+                {{?property rdf:type owl:DatatypeProperty}}
+                UNION
+                {{?property rdf:type owl:FunctionalProperty}}
+                }}
+            }}''',
+            'subclass_axioms': f'''
+            SELECT (COUNT(*) as ?subclass_axioms)
+            WHERE {{ GRAPH <{ont}> {{?s rdfs:subClassOf ?o}} }}'''}
+
+def count_ratio(enum, denom):
+
+    #None instead of a division error, as an unbound ratio would give
+    if denom == 0:
+        return None
+
+    return enum / denom
+
+#Subselects every metric needs and how its value follows from their counts.
+#IMI is reported as 1 / (subclass axioms / classes), like quality_values always did
+quality_metrics = {'icr': (['graph_classes', 'ont_classes'], lambda c: count_ratio(c['graph_classes'], c['ont_classes'])),
+                   'ipr': (['graph_properties', 'ont_properties'], lambda c: count_ratio(c['graph_properties'], c['ont_properties'])),
+                   'imi': (['ont_classes', 'subclass_axioms'], lambda c: count_ratio(c['ont_classes'], c['subclass_axioms']))}
+
+def q_batch(subselects, names, graphs):
+
+    #One SELECT joining the single-row subselects `names`, each included once
+    names = list(dict.fromkeys(names))
+    body = '\n'.join('    {' + subselects[name] + '\n    }' for name in names)
+    sources = '\n'.join(f'    FROM NAMED <{graph}>' for graph in dict.fromkeys(graphs))
+
+    q_bat = f'''
+    PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
+    PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
+    PREFIX owl: <http://www.w3.org/2002/07/owl#>
+    PREFIX dbo: <http://dbpedia.org/ontology/>
+
+    SELECT {' '.join('?' + name for name in names)}
+{sources}
+    WHERE {{
+{body}
+    }}
+    '''
+    return q_bat
+
+def q_quality(graph, ont, metrics= ('icr', 'ipr', 'imi')):
+    names = [name for metric in metrics for name in quality_metrics[metric][0]]
+
+    return q_batch(quality_subselects(graph, ont), names, [graph, ont])
+
+def quality_batch(wrapper, graph, ont, metrics= ('icr', 'ipr', 'imi')):
+
+    #Dict of the selected metric values from a single request
+    res = run_query(wrapper, q_quality(graph, ont, metrics))['results']['bindings'][0]
+
+    counts = {name: int(float(binding['value'])) for name, binding in res.items()}
+
+    return {metric: quality_metrics[metric][1](counts) for metric in metrics}
+
+def struct_cont_table():
+
+    return {'File': [],
+            'Version': [],
+            'Density': [],
+            'CC': [],
+            'KD': [],
+            'VocUni': [],
+            'Vdyn': [],
+            'AddVdyn': [],
+            'RemVdyn': [],
+            'ChangeRatio': [],
+            'AddCR': [],
+            'RemCR': [],
+            'Growth': []
+            }
+
+def struct_cont_row(struct_cont_dict, graph, v_num, profile, voc_res= None, change= None, clustering= 0):
+
+    #Get information for the single graph from its profile
+    density = profile_density(profile)
     
-    struct_cont_dict = {'File': [],
-                        'Version': [],
-                        'Density': [],
-                        'CC': [],
-                        'KD': [],
-                        'VocUni': [],
-                        'Vdyn': [],
-                        'AddVdyn': [],
-                        'RemVdyn': [],
-                        'ChangeRatio': [],
-                        'AddCR': [],
-                        'RemCR': [],
-                        'Growth': []
-                        }
+    knowledge_degree = profile_knowledge_degree(profile)
     
+    vocabulary_uniqueness = profile_voc_uni(profile)
+
+    #The first version of a chain has nothing to be compared with
+    if voc_res is None:
+        voc_res = [0, 0, 0]
+    if change is None:
+        change = [0, 0, 0, 0]
+
+    vocabulary_dynamicity, add_voc, rem_voc = voc_res
+    change_ratio, add_cr, rem_cr, growth = change
+    
+    #Insert information into the  dictionary
+    struct_cont_dict['File'].append(graph)
+    struct_cont_dict['Version'].append(v_num)
+    struct_cont_dict['Density'].append(density)
+    struct_cont_dict['CC'].append(clustering)
+    struct_cont_dict['KD'].append(knowledge_degree)
+    struct_cont_dict['VocUni'].append(vocabulary_uniqueness)
+    struct_cont_dict['Vdyn'].append(vocabulary_dynamicity) 
+    struct_cont_dict['AddVdyn'].append(add_voc) 
+    struct_cont_dict['RemVdyn'].append(rem_voc) 
+    struct_cont_dict['ChangeRatio'].append(change_ratio) 
+    struct_cont_dict['AddCR'].append(add_cr) 
+    struct_cont_dict['RemCR'].append(rem_cr) 
+    struct_cont_dict['Growth'].append(growth)            
+
+def write_table(file_name, table):
+
+    with open(file_name, 'w') as sc:
+        writer = csv.writer(sc) #requires import csv
+        writer.writerow(table.keys())
+        writer.writerows(zip(*table.values()))
+
+def structure_and_content(wrapper, graph_list, cache= None, manifest= None, file_name= 'structure_and_content.csv'):
+
+    #With a checkpoint.RunManifest a killed run resumes at its first unfinished
+    #(graph, metric) unit, and rows are appended to the output as they are finished
+    struct_cont_dict = struct_cont_table()
+    
+    backend = as_backend(wrapper, cache)
+
+    if manifest is None:
+        manifest = RunManifest()
+
+    written = manifest.open_output(file_name, struct_cont_dict.keys())
+    rows = 0
+
     for list in graph_list:
         v_num = 0
         
@@ -847,107 +1691,202 @@ def structure_and_content(wrapper, graph_list):
         #REQUIRES AN ORDERED LIST!
         for i in range(len(list)):
             
-            #Get information for each single graph
-            density = query_retriever(wrapper, q_density(list[i]), 'density')
-            
-            #clustering = query_retriever(wrapper, q_cluster(list[i]), 'clustering_coefficient')
-            clustering = 0
-            
-            knowledge_degree = query_retriever(wrapper, q_knowledge_degree(list[i]), 'knowledgedegree')
-            
-            vocabulary_uniqueness = query_retriever(wrapper, q_voc_uni(list[i]), 'unique')
+            #One profile pass per graph
+            profile = manifest.unit(list[i], 'profile', lambda: graph_profile(backend, list[i]))
+
+            clustering = manifest.unit(list[i], 'clustering', lambda: backend.clustering(list[i]))
 
             #Do comparions of the graphs
             if v_num == 0:
-                vocabulary_dynamicity = 0
-                add_voc = 0
-                rem_voc = 0
-                change_ratio = 0
-                add_cr = 0
-                rem_cr = 0
-                growth = 0 
+                voc_res = None
+                change = None
             else:
                 #print(f'Doing comparisons of {list[i-1]} and  {list[i]}')
-                voc_res = vocab_dyna(wrapper, list[i-1], list[i])
-                vocabulary_dynamicity = voc_res[0] 
-                add_voc = voc_res[1]
-                rem_voc = voc_res[2]
-                change_ratio = query_retriever(wrapper, q_change_ratio(list[i-1], list[i]), 'changeratio')
-                add_cr = query_retriever(wrapper, q_add_change_ratio(list[i-1], list[i]), 'addratio')
-                rem_cr = query_retriever(wrapper, q_rem_change_ratio(list[i-1], list[i]), 'removeratio')
-                growth = query_retriever(wrapper, q_growth(list[i-1], list[i]), 'growthratio')
+                voc_res = manifest.unit(list[i-1], 'vocab_dyna', lambda: vocab_dyna(backend, list[i-1], list[i]), list[i])
+                change = manifest.unit(list[i-1], 'change_ratios', lambda: backend.change_ratios(list[i-1], list[i]), list[i])
             
-            #Insert information into the  dictionary
-            struct_cont_dict['File'].append(list[i])
-            struct_cont_dict['Version'].append(v_num)
-            struct_cont_dict['Density'].append(density)
-            struct_cont_dict['CC'].append(clustering)
-            struct_cont_dict['KD'].append(knowledge_degree)
-            struct_cont_dict['VocUni'].append(vocabulary_uniqueness)
-            struct_cont_dict['Vdyn'].append(vocabulary_dynamicity) 
-            struct_cont_dict['AddVdyn'].append(add_voc) 
-            struct_cont_dict['RemVdyn'].append(rem_voc) 
-            struct_cont_dict['ChangeRatio'].append(change_ratio) 
-            struct_cont_dict['AddCR'].append(add_cr) 
-            struct_cont_dict['RemCR'].append(rem_cr) 
-            struct_cont_dict['Growth'].append(growth)            
+            struct_cont_row(struct_cont_dict, list[i], v_num, profile, voc_res, change, clustering)
         
             v_num += 1
             
-            #print(struct_cont_dict)
-    
-            #Consider not writing every time
-            with open('structure_and_content.csv', 'w') as sc:
-                writer = csv.writer(sc) #requires import csv
-                writer.writerow(struct_cont_dict.keys())
-                writer.writerows(zip(*struct_cont_dict.values()))
+            #Rows a resumed run already wrote are only added to the returned table
+            if rows >= written:
+                manifest.append_row(file_name, [column[-1] for column in struct_cont_dict.values()])
+            rows += 1
         
     return struct_cont_dict
 
-def quality(wrapper, graph_list, ont_list):
-    
-    qual_dict = {'File': [],
-                'Version': [],
-                'ICR': [],
-                'IPR': [],
-                'IMI': []}
+def quality_values(wrapper, graph, ont, cache= None):
+
+    if ont == 'None' or isNaN(ont):
+        return None, None, None
+
+    #ICR, IPR and IMI share one request, and the ontology's class count with it
+    values = cached_value(cache, graph, 'quality', lambda: quality_batch(wrapper, graph, ont), graph2= ont,
+                          query= q_quality(graph, ont))
+
+    return values['icr'], values['ipr'], values['imi']
+
+def quality_table():
+
+    return {'File': [],
+            'Version': [],
+            'ICR': [],
+            'IPR': [],
+            'IMI': []}
+
+def quality_row(qual_dict, graph, v_num, icr, ipr, imi):
+
+    #One row of quality.csv, shared by quality and executor.quality_parallel
+    qual_dict['File'].append(graph)
+    qual_dict['Version'].append(v_num)
+    qual_dict['ICR'].append(icr)
+    qual_dict['IPR'].append(ipr)
+    qual_dict['IMI'].append(imi)
+
+def quality(wrapper, graph_list, ont_list, cache= None):
     
-    v_num = 0
+    qual_dict = quality_table()
     
     for i in range(len(graph_list)):
-        if ont_list[i] == 'None' or isNaN(ont_list[i]):
-            icr = None
-            ipr = None
-            imi = None
-        else: 
-            icr = query_retriever(wrapper, q_icr(graph_list[i], ont_list[i]), 'icr')
-            ipr = query_retriever(wrapper, q_ipr(graph_list[i], ont_list[i]), 'ipr')
-            imi = 1/query_retriever(wrapper, q_imi(ont_list[i]), 'imi')
+        icr, ipr, imi = quality_values(wrapper, graph_list[i], ont_list[i], cache)
         
         #Insert information into the  dictionary
-        qual_dict['File'].append(graph_list[i])
-        qual_dict['Version'].append(v_num)
-        qual_dict['ICR'].append(icr)
-        qual_dict['IPR'].append(ipr)
-        qual_dict['IMI'].append(imi)
+        quality_row(qual_dict, graph_list[i], i, icr, ipr, imi)
         
-        v_num +=1
-        
-        #print(qual_dict)
-        
-    with open('quality.csv', 'w') as q:
-        writer = csv.writer(q) #requires import csv
-        writer.writerow(qual_dict.keys())
-        writer.writerows(zip(*qual_dict.values()))  
+    write_table('quality.csv', qual_dict)
         
     return qual_dict      
 
-def ipcr_csv(wrapper, graph_list, version_list, ont_list, name):
+def cached_set_check(cache, wrapper, graph, ont, name):
+
+    #icr_set / ipr_set through the cache. Sets are stored as lists and turned back here
+    if name == 'ipr':
+        check, query = ipr_set, q_ipr_check(graph, ont, 'g') + q_ipr_check(graph, ont, 'o')
+    else:
+        check, query = icr_set, q_icr_check(graph, ont, 'g') + q_icr_check(graph, ont, 'o')
+
+    def compute():
+        graph_ont_diff, ont_graph_diff, graph_len, ont_len = check(wrapper, graph, ont)
+        return [sorted(graph_ont_diff), sorted(ont_graph_diff), graph_len, ont_len]
+
+    graph_ont_diff, ont_graph_diff, graph_len, ont_len = cached_value(cache, graph, f'{name}_set', compute, graph2= ont, query= query)
+
+    return set(graph_ont_diff), set(ont_graph_diff), graph_len, ont_len
+
+def cached_sets(cache, wrapper, graph, ont, name):
+
+    #Full graph and ontology sets of icr_sets / ipr_sets through the cache
+    if name == 'ipr':
+        sets, query = ipr_sets, q_ipr_check(graph, ont, 'g') + q_ipr_check(graph, ont, 'o')
+    else:
+        sets, query = icr_sets, q_icr_check(graph, ont, 'g') + q_icr_check(graph, ont, 'o')
+
+    def compute():
+        graph_set, owl_set = sets(wrapper, graph, ont)
+        return [sorted(graph_set), sorted(owl_set)]
+
+    graph_set, owl_set = cached_value(cache, graph, f'{name}_sets', compute, graph2= ont, query= query)
+
+    return set(graph_set), set(owl_set)
+
+#-------------------------------------------------------------------------
+
+#! Compact class/property presence: every IRI is stored once in a table shared by the
+#! ICR and IPR outputs, and the output has one row per IRI ID with a flag per version:
+#! 1 = used in the graph, 2 = defined in the ontology, 3 = both, empty = no ontology
+
+def load_iris(iri_file):
+
+    if not os.path.exists(iri_file):
+        return []
+
+    with open(iri_file, encoding= 'utf-8') as iris:
+        return iris.read().splitlines()
+
+def save_iris(iri_file, iris):
+
+    with open(iri_file, 'w', encoding= 'utf-8') as file:
+        file.writelines(iri + '\n' for iri in iris)
+
+def presence_flags(versions, iri_count, version_list):
+
+    #Compact table from (graph IDs, ontology IDs) per version, None for a version without
+    #ontology. Only IRIs flagged in some version get a row, the shared table also holds
+    #those of the other metric
+    flags = np.zeros((iri_count, len(versions)), dtype= np.uint8)
+
+    for i, sets in enumerate(versions):
+        if sets is not None:
+            flags[sets[0], i] |= 1
+            flags[sets[1], i] |= 2
+
+    rows = np.flatnonzero(flags.any(axis= 1))
+    presence = pd.DataFrame({'ID': rows})
+
+    for i in range(len(versions)):
+        column = pd.array(flags[rows, i], dtype= 'UInt8')
+
+        if versions[i] is None:
+            column[:] = pd.NA
+
+        presence[str(version_list[i])] = column
+
+    return presence
+
+def ipcr_presence(wrapper, graph_list, version_list, ont_list, name, cache= None, iri_file= 'iris.txt'):
+
+    iris = load_iris(iri_file)
+    ids = {iri: id for id, iri in enumerate(iris)}
+
+    def intern(terms):
+        for term in terms:
+            if term not in ids:
+                ids[term] = len(iris)
+                iris.append(term)
+
+        return np.fromiter((ids[term] for term in terms), dtype= np.int64, count= len(terms))
+
+    versions = []
+
+    for i in range(len(graph_list)):
+        if ont_list[i] == 'None' or isNaN(ont_list[i]):
+            versions.append(None)
+        else:
+            graph_set, owl_set = cached_sets(cache, wrapper, graph_list[i], ont_list[i], name)
+            versions.append((intern(sorted(graph_set)), intern(sorted(owl_set))))
+
+    presence = presence_flags(versions, len(iris), version_list)
+
+    save_iris(iri_file, iris)
+
+    return presence
+
+def presence_sets(presence, version, iri_file= 'iris.txt'):
+
+    #(graph - ontology, ontology - graph) IRIs of one version of a compact file. A version
+    #without an ontology has no flags and gives two empty sets
+    iris = load_iris(iri_file)
+    flags = presence[str(version)].fillna(0)
+
+    return ({iris[id] for id in presence['ID'][flags == 1]},
+            {iris[id] for id in presence['ID'][flags == 2]})
+
+def ipcr_csv(wrapper, graph_list, version_list, ont_list, name, cache= None, compact= False, iri_file= 'iris.txt'):
     #print(name)
     if name != 'ipr' and name != 'icr':
         print("Variable 'name' can only be icr or ipr")
         return
 
+    #By default the table with the difference sets in its cells, as before. compact=True
+    #writes one flag per IRI and version instead (see ipcr_presence), which
+    #visualizer.ont_prepare reads as well but older readers of icr.csv/ipr.csv do not
+    if compact:
+        presence = ipcr_presence(wrapper, graph_list, version_list, ont_list, name, cache, iri_file)
+        presence.to_csv(f'{name}.csv', index= False, header= True, sep = ';')
+
+        return presence
+
     set_dict = {'Graph': [],
                 'Version': [],
                 'Graph - Ont check': [],
@@ -961,10 +1900,8 @@ def ipcr_csv(wrapper, graph_list, version_list, ont_list, name):
     for i in range(len(graph_list)):
         if ont_list[i] == 'None' or isNaN(ont_list[i]):
             graph_ont_diff, ont_graph_diff, graph_len, ont_len = None, None, None, None
-        if name == 'ipr':
-            graph_ont_diff, ont_graph_diff, graph_len, ont_len = ipr_set(wrapper, graph_list[i], ont_list[i])
-        if name == 'icr':
-            graph_ont_diff, ont_graph_diff, graph_len, ont_len = icr_set(wrapper, graph_list[i], ont_list[i])
+        else:
+            graph_ont_diff, ont_graph_diff, graph_len, ont_len = cached_set_check(cache, wrapper, graph_list[i], ont_list[i], name)
 
         set_dict['Graph'].append(graph_list[i])
         set_dict['Version'].append(version_list[i])
@@ -984,7 +1921,7 @@ def ipcr_csv(wrapper, graph_list, version_list, ont_list, name):
     df = pd.DataFrame(set_dict)
     df.to_csv(f'{name}.csv', index= False, header= True, sep = ';')
 
-def top_entities(entity, wrapper, graph_list, file_name):
+def top_entities(entity, wrapper, graph_list, file_name, cache= None):
 
     common_dict = {'File':[], 
                     'Version':[],
@@ -993,6 +1930,8 @@ def top_entities(entity, wrapper, graph_list, file_name):
                     'Count':[]
                     } 
 
+    backend = as_backend(wrapper, cache)
+
     for names in graph_list:
         v_num = 0
 
@@ -1001,24 +1940,13 @@ def top_entities(entity, wrapper, graph_list, file_name):
 
             top = 1
 
-            query = f'''select ?{entity} (count(?{entity}) as ?count)
-                        from named <{graph}>
-                        where {{ GRAPH <{graph}>
-                        {{?s ?p ?o}}
-                        }}
-                        ORDER BY desc (?count) limit 10
-                        '''
-            
-            wrapper.setQuery(query)
-            res = wrapper.query().convert()
-
-            for l in res['results']['bindings']:
+            for name, count in backend.top_entities(graph, entity, limit= 10):
                 common_dict['File'].append(graph)
                 common_dict['Version'].append(v_num)
                 common_dict['Rank'].append(top)
                 top +=1
-                common_dict['Name'].append(l[entity]['value'])
-                common_dict['Count'].append(l['count']['value'])
+                common_dict['Name'].append(name)
+                common_dict['Count'].append(count)
             
 
             v_num += 1
@@ -1031,6 +1959,29 @@ def top_entities(entity, wrapper, graph_list, file_name):
     
     return common_dict
 
+def top_entities_all(wrapper, graph_list, file_names= ('top_subjects.csv', 'top_predicate.csv', 'top_objects.csv'),
+                     cache= None, limit= 10):
+
+    #Same tables as top_entities for 's', 'p' and 'o', from one pass per graph
+    backend = as_backend(wrapper, cache)
+    tables = {entity: {'File': [], 'Version': [], 'Rank': [], 'Name': [], 'Count': []} for entity in 'spo'}
+
+    for names in graph_list:
+        for v_num in range(len(names)):
+            top = backend.top_entities_all(names[v_num], limit)
+
+            for entity in 'spo':
+                for rank, (name, count) in enumerate(top[entity], start= 1):
+                    tables[entity]['File'].append(names[v_num])
+                    tables[entity]['Version'].append(v_num)
+                    tables[entity]['Rank'].append(rank)
+                    tables[entity]['Name'].append(name)
+                    tables[entity]['Count'].append(count)
+
+    for entity, file_name in zip('spo', file_names):
+        write_table(file_name, tables[entity])
+
+    return tables
 
 if __name__ == '__main__':
     endpoint = 'http://localhost:8890/sparql'
@@ -0,0 +1,369 @@
+'''
+This file contains fixed-size sketches for approximate metrics on very large versions.
+Terms are hashed with a stable 64 bit hash, so sketches from different runs and different
+versions can be merged and compared.
+'''
+
+#! Imports
+import hashlib
+import math
+from collections import Counter
+
+import numpy as np
+
+#-----------------------------------------------------------------------------
+
+#! Hashing
+
+def term_hash(term):
+    return int.from_bytes(hashlib.blake2b(term.encode('utf-8'), digest_size= 8).digest(), 'little')
+
+def term_hashes(terms):
+    return np.fromiter((term_hash(term) for term in terms), dtype= np.uint64)
+
+def triple_hashes(subjects, predicates, objects):
+
+    #One 64 bit hash per triple from the hashes of its terms, mixed with the splitmix64
+    #finalizer so that triples sharing terms still get unrelated hashes
+    with np.errstate(over= 'ignore'):
+        h = subjects * np.uint64(0x9E3779B97F4A7C15) ^ predicates * np.uint64(0xC2B2AE3D27D4EB4F) ^ objects
+        h = (h ^ (h >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        h = (h ^ (h >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+
+        return h ^ (h >> np.uint64(31))
+
+def bit_length(values):
+
+    #Exact number of significant bits of every uint64, without going through floats
+    values = values.copy()
+    length = np.zeros(len(values), dtype= np.int64)
+
+    for shift in (32, 16, 8, 4, 2, 1):
+        high = values >= np.uint64(1 << shift)
+        length[high] += shift
+        values[high] >>= np.uint64(shift)
+
+    return length + (values > 0)
+
+#-----------------------------------------------------------------------------
+
+#! HyperLogLog for distinct counts
+
+class HyperLogLog:
+    '''
+    Distinct-count sketch with 2**precision one byte registers. The relative standard
+    error of count() is about 1.04 / sqrt(2**precision), 0.8% for the default 14.
+    Sketches with the same precision merge into the sketch of the union.
+    '''
+
+    def __init__(self, precision= 14, registers= None):
+        self.precision = precision
+        self.m = 1 << precision
+        self.registers = registers if registers is not None else np.zeros(self.m, dtype= np.uint8)
+
+    def add_hashes(self, hashes):
+
+        #The first `precision` bits pick the register, the rank of the rest is stored
+        index = (hashes >> np.uint64(64 - self.precision)).astype(np.int64)
+        rest = hashes & np.uint64((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - bit_length(rest) + 1
+
+        np.maximum.at(self.registers, index, rank.astype(np.uint8))
+
+    def add(self, terms):
+        self.add_hashes(term_hashes(terms))
+
+    def merge(self, other):
+
+        if other.precision != self.precision:
+            raise ValueError('Only sketches with the same precision can be merged')
+
+        return HyperLogLog(self.precision, np.maximum(self.registers, other.registers))
+
+    def count(self):
+
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        estimate = alpha * self.m**2 / np.sum(np.power(2.0, -self.registers.astype(np.float64)))
+
+        #Linear counting is more accurate while many registers are still empty
+        zeros = int(np.count_nonzero(self.registers == 0))
+
+        if estimate <= 2.5 * self.m and zeros > 0:
+            estimate = self.m * math.log(self.m / zeros)
+
+        return float(estimate)
+
+    def error(self):
+        #Relative standard error of count()
+        return 1.04 / math.sqrt(self.m)
+
+    def to_bytes(self):
+        return bytes([self.precision]) + self.registers.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data):
+        return cls(data[0], np.frombuffer(data[1:], dtype= np.uint8).copy())
+
+#-----------------------------------------------------------------------------
+
+#! Bottom-k MinHash for similarity of vocabularies
+
+class MinHash:
+    '''
+    Keeps the k smallest term hashes of a set. The bottom-k of a union is the bottom-k of
+    the merged values, and the share of it found in both sets estimates their Jaccard
+    similarity with standard error about sqrt(J * (1 - J) / k). Sets smaller than k are
+    kept completely, so everything computed from them is exact.
+    '''
+
+    def __init__(self, k= 1024, values= None):
+        self.k = k
+        self.values = values if values is not None else np.empty(0, dtype= np.uint64)
+
+    def full(self):
+        return len(self.values) >= self.k
+
+    def add_hashes(self, hashes):
+
+        #Most hashes of a large set can be dropped before sorting
+        if self.full():
+            hashes = hashes[hashes < self.values[-1]]
+
+        self.values = np.unique(np.concatenate([self.values, hashes]))[:self.k]
+
+    def merge(self, other):
+        return MinHash(min(self.k, other.k), np.union1d(self.values, other.values)[:min(self.k, other.k)])
+
+    def jaccard(self, other):
+
+        union = self.merge(other).values
+
+        if len(union) == 0:
+            return 1.0
+
+        both = np.isin(union, self.values, assume_unique= True) & np.isin(union, other.values, assume_unique= True)
+
+        return int(both.sum()) / len(union)
+
+class VocabSignature:
+    '''
+    Fixed-size summary of one version's vocabulary: a HyperLogLog for its size and a
+    MinHash for its overlap with other versions. Stored once per version, any two
+    versions can then be compared without touching their triples.
+    '''
+
+    def __init__(self, hll, minhash):
+        self.hll = hll
+        self.minhash = minhash
+
+    def count(self):
+
+        if not self.minhash.full():
+            return float(len(self.minhash.values))
+
+        return self.hll.count()
+
+    def union_count(self, other):
+
+        if not self.minhash.full() and not other.minhash.full():
+            return float(len(np.union1d(self.minhash.values, other.minhash.values)))
+
+        return self.hll.merge(other.hll).count()
+
+    def save(self, path):
+        np.savez(path, precision= self.hll.precision, registers= self.hll.registers,
+                 k= self.minhash.k, minhash= self.minhash.values)
+
+    @classmethod
+    def load(cls, path):
+
+        data = np.load(path)
+
+        return cls(HyperLogLog(int(data['precision']), data['registers']), MinHash(int(data['k']), data['minhash']))
+
+def vocab_diff_estimate(old, new):
+
+    #Estimated counts in the form of Backend.vocab_diff, so queries.vocab_ratios applies.
+    #|old & new| = J * |old | new|, everything else follows from the sizes. The estimates
+    #are clamped to what sets of these sizes allow: the union is at least the larger set
+    #and at most both together, the intersection at most the smaller set. The union is
+    #then taken as |old| + |new| - |old & new|, so the ratios stay within [0, 1]
+    old_count = old.count()
+    new_count = new.count()
+
+    union = min(max(old.union_count(new), old_count, new_count), old_count + new_count)
+    common = min(max(old.minhash.jaccard(new.minhash) * union, 0.0), old_count, new_count)
+
+    return {'removed': old_count - common,
+            'added': new_count - common,
+            'union': old_count + new_count - common}
+
+def diff_estimate(old, new):
+
+    #Estimated counts in the form of Backend.diff from the triple signatures of two
+    #versions (ProfileSketch.triple_signature), so queries.diff_ratios applies
+    tdiff = vocab_diff_estimate(old, new)
+
+    return {'previous': old.count(),
+            'next': new.count(),
+            'additions': tdiff['added'],
+            'removals': tdiff['removed'],
+            'union': tdiff['union']}
+
+#-----------------------------------------------------------------------------
+
+#! Heavy hitters for top-k terms in bounded memory
+
+class CountMin:
+    '''
+    depth x width counters, width rounded up to a power of two. An estimate never
+    undercounts, and overcounts by more than e / width * total only with probability
+    exp(-depth).
+    '''
+
+    def __init__(self, width= 2**16, depth= 4, seed= 0):
+        self.width = 1 << max(width - 1, 1).bit_length()
+        self.depth = depth
+        self.bits = np.uint64(64 - (self.width - 1).bit_length())
+        self.table = np.zeros((depth, self.width), dtype= np.int64)
+        self.total = 0
+
+        #One odd multiplier per row, multiply-shift hashing of the term hash picks the column
+        rng = np.random.default_rng(seed)
+        self.multipliers = rng.integers(0, 2**63, size= depth, dtype= np.uint64) * np.uint64(2) + np.uint64(1)
+
+    def columns(self, hashes, row):
+        return (hashes * self.multipliers[row]) >> self.bits
+
+    def add_hashes(self, hashes, counts):
+
+        for row in range(self.depth):
+            self.table[row] += np.bincount(self.columns(hashes, row).astype(np.int64), weights= counts,
+                                           minlength= self.width).astype(np.int64)
+
+        self.total += int(np.sum(counts))
+
+    def estimate(self, hashes):
+        return np.min([self.table[row][self.columns(hashes, row).astype(np.int64)] for row in range(self.depth)], axis= 0)
+
+    def error(self):
+        #Bound on the overcount of estimate(), holding with probability 1 - exp(-depth)
+        return math.e / self.width * self.total
+
+class HeavyHitters:
+    '''
+    Top-k terms of a stream in bounded memory. Candidates are kept as a Misra-Gries summary
+    of at most `capacity` terms (the deterministic counterpart of Space-Saving): every term
+    occurring more than total / (capacity + 1) times is guaranteed to be among them. Their
+    counts are then read from a CountMin sketch of the same stream.
+    '''
+
+    def __init__(self, capacity= 10000, width= 2**16, depth= 4):
+        self.capacity = capacity
+        self.candidates = {}
+        self.sketch = CountMin(width, depth)
+
+    def add_batch(self, terms):
+
+        counts = Counter(terms)
+        self.sketch.add_hashes(term_hashes(counts.keys()), np.fromiter(counts.values(), dtype= np.float64))
+
+        for term, count in counts.items():
+            self.candidates[term] = self.candidates.get(term, 0) + count
+
+        #Misra-Gries merge: subtract the (capacity + 1)-th largest count, keep what stays positive
+        if len(self.candidates) > self.capacity:
+            threshold = sorted(self.candidates.values(), reverse= True)[self.capacity]
+            self.candidates = {term: count - threshold for term, count in self.candidates.items() if count > threshold}
+
+    def top(self, limit= 10):
+
+        terms = list(self.candidates)
+
+        if not terms:
+            return []
+
+        estimates = self.sketch.estimate(term_hashes(terms))
+        order = np.argsort(-estimates, kind= 'stable')[:limit]
+
+        return [(terms[i], int(estimates[i])) for i in order]
+
+    def error(self):
+        return self.sketch.error()
+
+#-----------------------------------------------------------------------------
+
+#! Approximate graph profile
+
+class ProfileSketch:
+    '''
+    HyperLogLog sketches of the subjects, predicates, objects and resource objects of
+    one graph, filled while streaming its triples. Nodes and vocabulary are unions of
+    these, so they need no sketches of their own. MinHashes of the vocabulary and of the
+    triples make the signatures for comparisons with other versions.
+    '''
+
+    def __init__(self, precision= 14, k= 1024):
+        self.vocab_minhash = MinHash(k)
+        self.triple_hll = HyperLogLog(precision)
+        self.triple_minhash = MinHash(k)
+        self.subjects = HyperLogLog(precision)
+        self.predicates = HyperLogLog(precision)
+        self.objects = HyperLogLog(precision)
+        self.uobjects = HyperLogLog(precision)
+        self.triples = 0
+        self.literals = 0
+
+    def add_batch(self, batch, is_literal):
+
+        #batch is a list of (s, p, o); hashing a batch at once keeps numpy busy
+        subjects = term_hashes(s for s, p, o in batch)
+        predicates = term_hashes(p for s, p, o in batch)
+        objects = term_hashes(o for s, p, o in batch)
+        literal = np.fromiter((is_literal(o) for s, p, o in batch), dtype= bool, count= len(batch))
+
+        self.subjects.add_hashes(subjects)
+        self.predicates.add_hashes(predicates)
+        self.objects.add_hashes(objects)
+        self.uobjects.add_hashes(objects[~literal])
+        self.vocab_minhash.add_hashes(np.concatenate([subjects, predicates, objects]))
+
+        triples = triple_hashes(subjects, predicates, objects)
+        self.triple_hll.add_hashes(triples)
+        self.triple_minhash.add_hashes(triples)
+
+        self.triples += len(batch)
+        self.literals += int(literal.sum())
+
+    def vocabulary(self):
+        return self.subjects.merge(self.predicates).merge(self.objects)
+
+    def signature(self):
+        return VocabSignature(self.vocabulary(), self.vocab_minhash)
+
+    def triple_signature(self):
+        #The same kind of summary for the set of triples, for diffs between any two versions
+        return VocabSignature(self.triple_hll, self.triple_minhash)
+
+    def profile(self):
+
+        #Triples and literals are counted exactly per line, so the dump is assumed to be
+        #free of duplicate lines. The distinct counts are estimates with relative
+        #standard error 'error'
+        profile = {'triples': self.triples,
+                   'subjects': round(self.subjects.count()),
+                   'predicates': round(self.predicates.count()),
+                   'objects': round(self.objects.count()),
+                   'literals': self.literals,
+                   'uobjects': round(self.uobjects.count()),
+                   'nodes': round(self.subjects.merge(self.uobjects).count()),
+                   'vocab': round(self.vocabulary().count()),
+                   'outdegree_sum': self.triples,
+                   'error': self.subjects.error()}
+
+        return profile
+
+def vocab_union_estimate(vocab1, vocab2):
+
+    #The vocab_union denominator from two stored vocabulary sketches, without a rescan
+    return vocab1.merge(vocab2).count()
@@ -0,0 +1,718 @@
+'''
+This file contains the compact snapshot format for graph versions: a term dictionary that
+maps every IRI and literal to an integer ID, and the triples as a sorted N x 3 ID array.
+Saved snapshots are directories of .npy files (see Snapshot.save) that are opened
+memory-mapped, so a metric only reads the arrays it needs and processes opening the same
+snapshot share the pages through the OS page cache.
+'''
+
+#! Imports
+import fcntl
+import json
+import os
+import re
+import threading
+import uuid
+from array import array
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+import clustering as cl
+import ntriples as nt
+import queries as que
+
+#-----------------------------------------------------------------------------
+
+#! Term dictionary
+
+def id_dtype(n_terms):
+
+    #Four bytes per ID are enough for anything below four billion distinct terms
+    if n_terms < 2**32:
+        return np.uint32
+
+    return np.uint64
+
+class TermDictionary:
+    '''
+    Maps terms (in the form produced by ntriples.parse_line) to dense integer IDs.
+    Snapshots built with the same dictionary can be compared ID for ID. IDs are only ever
+    appended, so one dictionary serves a whole version chain; `id` identifies it, also
+    once it is persisted and reopened in another process.
+    '''
+
+    def __init__(self, terms= None, id= None, persisted= 0):
+        self.id = id or uuid.uuid4().hex
+        self.terms = []
+        self.ids = {}
+        self.literal = bytearray()
+
+        for term in terms or []:
+            self.encode(term)
+
+        #Number of leading terms known to be the same as in the persisted dictionary
+        self.persisted = persisted
+
+    def __len__(self):
+        return len(self.terms)
+
+    def encode(self, term):
+
+        id = self.ids.get(term)
+
+        if id is None:
+            id = len(self.terms)
+            self.ids[term] = id
+            self.terms.append(term)
+            self.literal.append(nt.is_literal(term))
+
+        return id
+
+    def decode(self, ids):
+        return [self.terms[id] for id in ids]
+
+    def literal_mask(self):
+        #Boolean array indexed by ID
+        return np.frombuffer(self.literal, dtype= np.uint8).astype(bool)
+
+    def persist(self, directory):
+
+        #Appends the terms the directory does not have yet to the layout MappedTerms
+        #reads: UTF-8 bytes of the terms, their offsets and the literal flags. The count in
+        #dictionary.json is updated last, so a run killed while appending leaves the
+        #dictionary as it was, and readers never see terms past that count. Writers of one
+        #directory take turns through a lock file
+        os.makedirs(directory, exist_ok= True)
+
+        with open(os.path.join(directory, 'dictionary.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            self.append_terms(directory)
+
+    def sync(self, directory):
+
+        #Brings this dictionary up to date with the one persisted in directory, and
+        #returns its dictionary.json (None when there is none yet). A dictionary that was
+        #never persisted adopts the directory's id, so backends opened on one chain before
+        #either wrote to it share IDs. Terms another process or backend appended since are
+        #added here; ours up to that count must be the same terms in the same order, or
+        #the two copies have diverged
+        info = read_dictionary_info(directory)
+
+        if info is None:
+            return None
+
+        if info['id'] != self.id and self.persisted > 0:
+            raise ValueError(f'{directory} holds another dictionary, IDs would not match')
+
+        if info['terms'] < self.persisted:
+            raise ValueError(f"{directory} has {info['terms']} terms, fewer than the {self.persisted} this dictionary read or wrote")
+
+        if info['terms'] > self.persisted:
+            theirs = MappedTerms(directory).decode(range(self.persisted, info['terms']))
+            ours = self.terms[self.persisted:info['terms']]
+
+            if theirs[:len(ours)] != ours:
+                raise ValueError(f'{directory} was extended with other terms under the same IDs; '
+                                 f'this dictionary has diverged from it and can not be persisted there')
+
+            for term in theirs[len(ours):]:
+                self.encode(term)
+
+        self.id = info['id']
+        self.persisted = info['terms']
+
+        return info
+
+    def append_terms(self, directory):
+
+        info = self.sync(directory) or {'format': dictionary_format, 'id': self.id, 'terms': 0, 'bytes': 0}
+
+        if info['terms'] == len(self) and info['terms'] > 0:
+            return
+
+        encoded = [term.encode('utf-8') for term in self.terms[info['terms']:]]
+        offsets = np.cumsum([len(term) for term in encoded], dtype= np.uint64) + np.uint64(info['bytes'])
+
+        #A new dictionary starts its offsets with 0
+        if info['terms'] == 0:
+            offsets = np.concatenate(([np.uint64(0)], offsets))
+
+        #Committed lengths of the three files, anything after them is a torn append
+        lengths = {'data.bin': info['bytes'],
+                   'offsets.bin': 8 * (info['terms'] + 1) if info['terms'] > 0 else 0,
+                   'literal.bin': info['terms']}
+        appended = {'data.bin': b''.join(encoded),
+                    'offsets.bin': offsets.tobytes(),
+                    'literal.bin': bytes(self.literal[info['terms']:])}
+
+        for name, data in appended.items():
+            with open(os.path.join(directory, name), 'ab') as f:
+                f.truncate(lengths[name])
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+
+        info = dict(info, terms= len(self), bytes= int(offsets[-1]) if len(offsets) else info['bytes'])
+
+        with open(os.path.join(directory, 'dictionary.json.tmp'), 'w') as f:
+            json.dump(info, f)
+
+        os.replace(os.path.join(directory, 'dictionary.json.tmp'), os.path.join(directory, 'dictionary.json'))
+        self.persisted = len(self)
+
+#Version of the layout written by TermDictionary.persist
+dictionary_format = 1
+
+def read_dictionary_info(directory):
+
+    path = os.path.join(directory, 'dictionary.json')
+
+    if not os.path.exists(path):
+        return None
+
+    with open(path) as f:
+        info = json.load(f)
+
+    if info['format'] != dictionary_format:
+        raise ValueError(f"{directory} has dictionary format {info['format']}, this code reads {dictionary_format}")
+
+    return info
+
+class MappedTerms:
+    '''
+    Read-only term dictionary persisted with TermDictionary.persist. Nothing is read when
+    it is opened, decode() only touches the pages of the terms it is asked for. It holds
+    the terms that were persisted when it was opened.
+    '''
+
+    def __init__(self, directory):
+        self.directory = directory
+        info = read_dictionary_info(directory)
+
+        self.id = info['id']
+        self.offsets = np.memmap(os.path.join(directory, 'offsets.bin'), dtype= np.uint64, mode= 'r', shape= (info['terms'] + 1,))
+        self.data = mapped_file(os.path.join(directory, 'data.bin'), np.uint8, info['bytes'])
+        self.literal = mapped_file(os.path.join(directory, 'literal.bin'), np.bool_, info['terms'])
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def decode(self, ids):
+        return [self.data[self.offsets[id]:self.offsets[id + 1]].tobytes().decode('utf-8') for id in ids]
+
+    def literal_mask(self):
+        return self.literal
+
+    def dictionary(self):
+        #The full TermDictionary, for encoding further versions with the same IDs
+        return TermDictionary(self.decode(range(len(self))), id= self.id, persisted= len(self))
+
+def mapped_file(path, dtype, length):
+
+    #np.memmap can not map zero bytes
+    if length == 0:
+        return np.empty(0, dtype= dtype)
+
+    return np.memmap(path, dtype= dtype, mode= 'r', shape= (length,))
+
+def save_array(path, values):
+
+    #Written next to the target and renamed over it, so a process that has the old file
+    #mapped keeps reading the old file instead of a truncated one
+    with open(path + '.tmp', 'wb') as f:
+        np.save(f, values)
+
+    os.replace(path + '.tmp', path)
+
+#-----------------------------------------------------------------------------
+
+#! Sorted ID triples
+
+def sort_triples(triples):
+
+    #Lexicographic SPO order without duplicate rows
+    if len(triples) == 0:
+        return triples.reshape(0, 3)
+
+    order = np.lexsort((triples[:, 2], triples[:, 1], triples[:, 0]))
+    triples = triples[order]
+
+    keep = np.ones(len(triples), dtype= bool)
+    keep[1:] = np.any(triples[1:] != triples[:-1], axis= 1)
+
+    return triples[keep]
+
+def runs(column):
+
+    #Distinct values of a sorted column and how often each occurs
+    if len(column) == 0:
+        return np.empty(0, dtype= column.dtype), np.empty(0, dtype= np.int64)
+
+    starts = np.flatnonzero(np.concatenate(([True], column[1:] != column[:-1])))
+    counts = np.diff(np.append(starts, len(column)))
+
+    return np.asarray(column[starts]), counts
+
+#Arrays a snapshot derives from its SPO array, and from which arrays. POS and OSP hold
+#the same s, p, o rows as SPO, sorted by predicate and by object
+derived_arrays = {
+    'pos': lambda snap: {'pos': snap.triples[np.lexsort((snap.triples[:, 0], snap.triples[:, 2], snap.triples[:, 1]))]},
+    'osp': lambda snap: {'osp': snap.triples[np.lexsort((snap.triples[:, 1], snap.triples[:, 0], snap.triples[:, 2]))]},
+    'vocab': lambda snap: {'vocab': np.unique(snap.triples)},
+    'subjects': lambda snap: dict(zip(['subjects', 'out_degree'], runs(snap.triples[:, 0]))),
+    'predicates': lambda snap: dict(zip(['predicates', 'predicate_counts'], runs(snap.array('pos')[:, 1]))),
+    'objects': lambda snap: dict(zip(['objects', 'in_degree'], runs(snap.array('osp')[:, 2]))),
+    'out_degree_histogram': lambda snap: {'out_degree_histogram': np.bincount(snap.array('out_degree'))},
+    'in_degree_histogram': lambda snap: {'in_degree_histogram': np.bincount(snap.array('in_degree'))}}
+
+derived_from = {'out_degree': 'subjects', 'predicate_counts': 'predicates', 'in_degree': 'objects'}
+
+#Version of the directory layout written by Snapshot.save
+snapshot_format = 1
+
+class Snapshot:
+    '''
+    One graph version: a TermDictionary and a sorted, duplicate free N x 3 ID array.
+    The POS/OSP orders, the vocabulary, the degree tables (distinct subjects, predicates
+    and objects with their counts) and the degree histograms are derived on first use,
+    or read memory-mapped from a saved snapshot.
+    '''
+
+    def __init__(self, terms, triples= None, directory= None, header= None):
+        self.terms = terms
+        self.directory = directory
+        self.header = header or {}
+        self.arrays = {}
+
+        if triples is not None:
+            self.arrays['spo'] = triples
+
+    @property
+    def triples(self):
+        return self.array('spo')
+
+    def __len__(self):
+
+        #A saved snapshot has the count in its header, so spo.npy is not mapped for it
+        if 'triples' in self.header:
+            return self.header['triples']
+
+        return len(self.triples)
+
+    def array(self, name):
+
+        if name not in self.arrays:
+            if self.directory is not None:
+                self.arrays[name] = np.load(os.path.join(self.directory, name + '.npy'), mmap_mode= 'r')
+            else:
+                self.arrays.update(derived_arrays[derived_from.get(name, name)](self))
+
+        return self.arrays[name]
+
+    def vocabulary_ids(self):
+        #Sorted distinct IDs in any position
+        return self.array('vocab')
+
+    def save(self, directory, terms_directory= None):
+
+        #One .npy file per array and a header.json with the format version, the counts
+        #and the profile. The dictionary goes to terms_directory, shared by the snapshots
+        #of a version chain, or into the snapshot's own directory
+        os.makedirs(directory, exist_ok= True)
+
+        if terms_directory is None:
+            terms_directory = os.path.join(directory, 'terms')
+
+        self.terms.persist(terms_directory)
+
+        for name in ['spo'] + list(derived_arrays) + list(derived_from):
+            save_array(os.path.join(directory, name + '.npy'), self.array(name))
+
+        header = {'format': snapshot_format,
+                  'triples': len(self.triples),
+                  'terms': len(self.terms),
+                  'dtype': str(self.triples.dtype),
+                  'dictionary': os.path.relpath(terms_directory, directory),
+                  'dictionary_id': self.terms.id,
+                  'profile': profile_snapshot(self)}
+
+        with open(os.path.join(directory, 'header.json.tmp'), 'w') as f:
+            json.dump(header, f)
+
+        os.replace(os.path.join(directory, 'header.json.tmp'), os.path.join(directory, 'header.json'))
+
+    @classmethod
+    def load(cls, directory, terms= None, mmap= True):
+
+        #Opening only reads the header. A shared dictionary can be passed in instead of
+        #mapping the one the header points to
+        with open(os.path.join(directory, 'header.json')) as f:
+            header = json.load(f)
+
+        if header['format'] != snapshot_format:
+            raise ValueError(f"{directory} has snapshot format {header['format']}, this code reads {snapshot_format}")
+
+        if terms is None:
+            terms = MappedTerms(os.path.join(directory, header['dictionary']))
+
+        if terms.id != header['dictionary_id']:
+            raise ValueError(f'{directory} was encoded with another dictionary')
+
+        if len(terms) < header['terms']:
+            raise ValueError(f'{directory} needs a dictionary of at least {header["terms"]} terms, got {len(terms)}')
+
+        snap = cls(terms, directory= directory, header= header)
+
+        if not mmap:
+            snap.arrays = {name: np.load(os.path.join(directory, name + '.npy'))
+                           for name in ['spo'] + list(derived_arrays) + list(derived_from)}
+
+        return snap
+
+def build_snapshot(path, terms= None, workers= 1, chunk_size= nt.chunk_size):
+
+    #Pass the dictionary of an earlier version to get comparable IDs
+    if terms is None:
+        terms = TermDictionary()
+
+    if workers > 1:
+        return build_snapshot_parallel(path, terms, workers, chunk_size)
+
+    #IDs are collected in a flat machine-integer buffer, not as Python objects
+    ids = array('Q')
+
+    for s, p, o in nt.stream_triples(path):
+        ids.append(terms.encode(s))
+        ids.append(terms.encode(p))
+        ids.append(terms.encode(o))
+
+    triples = np.frombuffer(ids, dtype= np.uint64).reshape(-1, 3).astype(id_dtype(len(terms)))
+
+    return Snapshot(terms, sort_triples(triples))
+
+def build_snapshot_parallel(path, terms, workers= 4, chunk_size= nt.chunk_size):
+
+    #Chunks are parsed in worker processes and merged in file order, so every term gets
+    #the same ID as in the serial build. The parent only looks up each chunk's distinct
+    #terms, not every term of every line
+    parts = []
+    skipped = 0
+
+    for chunk_terms, chunk_ids, chunk_skipped in nt.encode_parallel(path, workers, chunk_size):
+        remap = np.fromiter((terms.encode(term) for term in chunk_terms), dtype= np.uint64, count= len(chunk_terms))
+        parts.append(remap[chunk_ids])
+        skipped += chunk_skipped
+
+    if skipped:
+        print(f'{path}: skipped {skipped} unparsable lines')
+
+    triples = np.concatenate(parts) if parts else np.empty((0, 3), dtype= np.uint64)
+
+    return Snapshot(terms, sort_triples(triples.astype(id_dtype(len(terms)))))
+
+#-----------------------------------------------------------------------------
+
+#! Set-difference metrics on sorted ID arrays
+
+def vocab_diff_snapshots(old, new):
+
+    #Same counts as Backend.vocab_diff, but on ID arrays of a shared dictionary
+    if old.terms.id != new.terms.id:
+        raise ValueError('Both snapshots must be built with the same TermDictionary')
+
+    old_ids = old.vocabulary_ids()
+    new_ids = new.vocabulary_ids()
+
+    removed = len(np.setdiff1d(old_ids, new_ids, assume_unique= True))
+    added = len(np.setdiff1d(new_ids, old_ids, assume_unique= True))
+
+    return {'removed': removed, 'added': added, 'union': len(old_ids) + added}
+
+def vocab_dyna_snapshot(old, new):
+    return que.vocab_ratios(vocab_diff_snapshots(old, new))
+
+def profile_snapshot(snap):
+
+    #The same counts as queries.q_profile, from the degree tables. A saved snapshot has
+    #them in its header
+    if 'profile' in snap.header:
+        return dict(snap.header['profile'])
+
+    objects = snap.array('objects')
+    literal = np.asarray(snap.terms.literal_mask())[objects]
+
+    subjects = snap.array('subjects')
+    uobjects = objects[~literal]
+
+    profile = {'triples': len(snap.triples),
+               'subjects': len(subjects),
+               'predicates': len(snap.array('predicates')),
+               'objects': len(objects),
+               'literals': int(snap.array('in_degree')[literal].sum()),
+               'uobjects': len(uobjects),
+               'nodes': len(np.union1d(subjects, uobjects)),
+               'vocab': len(snap.vocabulary_ids()),
+               'outdegree_sum': len(snap.triples)}
+
+    return profile
+
+#-----------------------------------------------------------------------------
+
+#! Diff of two sorted triple arrays
+
+def triple_keys(old, new):
+
+    #s, p and o of both arrays packed into uint64 words, as few as the ID widths allow:
+    #one word when the three fit in 64 bits, else s and (p, o), else s, p and o. The
+    #words sort like the rows, so SPO-sorted arrays give sorted keys
+    widths = [max(int(old[:, c].max(initial= 0)), int(new[:, c].max(initial= 0))).bit_length() for c in range(3)]
+
+    if sum(widths) <= 64:
+        groups = [[0, 1, 2]]
+    elif widths[1] + widths[2] <= 64:
+        groups = [[0], [1, 2]]
+    else:
+        groups = [[0], [1], [2]]
+
+    def pack(triples, columns):
+        word = np.zeros(len(triples), dtype= np.uint64)
+        for c in columns:
+            word = (word << np.uint64(widths[c])) | triples[:, c].astype(np.uint64)
+        return word
+
+    return [pack(old, columns) for columns in groups], [pack(new, columns) for columns in groups]
+
+def merge_common(old_keys, new_keys):
+
+    #(kept, in_old): which rows of old are in new and which rows of new are in old. Both
+    #key lists are sorted, so a stable sort of their concatenation is a merge of two runs
+    #(timsort for uint64 keys) and every common row sits right after its twin from old
+    n = len(old_keys[0])
+    merged = [np.concatenate((o, w)) for o, w in zip(old_keys, new_keys)]
+
+    if len(merged) == 1:
+        order = np.argsort(merged[0], kind= 'stable')
+    else:
+        order = np.lexsort(merged[::-1])
+
+    merged = [word[order] for word in merged]
+    same = np.ones(len(order) - 1 if len(order) else 0, dtype= bool)
+    for word in merged:
+        same &= word[1:] == word[:-1]
+
+    twins = np.flatnonzero(same)
+
+    kept = np.zeros(n, dtype= bool)
+    in_old = np.zeros(len(new_keys[0]), dtype= bool)
+    kept[order[twins]] = True
+    in_old[order[twins + 1] - n] = True
+
+    return kept, in_old
+
+def diff_snapshots(old, new, rows= False):
+
+    #One merge of the sorted triples of both versions. With rows=True the added and
+    #removed triples are returned as ID arrays next to the counts
+    if old.terms.id != new.terms.id:
+        raise ValueError('Both snapshots must be built with the same TermDictionary')
+
+    kept, in_old = merge_common(*triple_keys(old.triples, new.triples))
+
+    common = int(in_old.sum())
+
+    diff = {'previous': len(old.triples),
+            'next': len(new.triples),
+            'additions': len(new.triples) - common,
+            'removals': len(old.triples) - common,
+            'union': len(old.triples) + len(new.triples) - common}
+
+    if rows:
+
+        #A shared dictionary may have outgrown uint32 between the two versions
+        dtype = np.promote_types(old.triples.dtype, new.triples.dtype)
+
+        diff['added'] = new.triples[~in_old].astype(dtype, copy= False)
+        diff['removed'] = old.triples[~kept].astype(dtype, copy= False)
+
+    return diff
+
+def change_ratios_snapshot(old, new):
+
+    #ChangeRatio, AddCR, RemCR and Growth from the single diff above
+    return que.diff_ratios(diff_snapshots(old, new))
+
+#-----------------------------------------------------------------------------
+
+#! Backend that walks a version chain on snapshots
+
+#Distinct terms and their counts per position, as named in derived_arrays
+degree_tables = {'s': ('subjects', 'out_degree'), 'p': ('predicates', 'predicate_counts'), 'o': ('objects', 'in_degree')}
+
+class SnapshotBackend(que.Backend):
+    '''
+    Encodes every dump once with a shared TermDictionary and keeps the most recent
+    snapshots in memory, so in a version chain each new version is parsed a single time
+    and only diffed against the one before it. With a directory the snapshots are also
+    saved there, one subdirectory per graph next to the shared dictionary in terms/, and
+    later runs open them memory-mapped without reading the dictionary. Use one directory
+    per dataset chain (e.g. the DBpedia and the Wikidata versions): a new version only
+    appends its new terms, so every term keeps its ID across the chain and the diffs,
+    vocabulary dynamicity and entity trends compare IDs, not strings. With workers > 1
+    dumps are parsed in that many processes.
+    '''
+
+    def __init__(self, paths= None, terms= None, directory= None, keep= 2, cc_samples= None, workers= 1):
+        self.paths = dict(paths) if paths is not None else {}
+        self.directory = directory
+        self.keep = keep
+        self.workers = workers
+
+        #None counts triangles exactly, a number estimates CC from that many sampled wedges
+        self.cc_samples = cc_samples
+
+        #Threads of an executor.BackendPool share the backend: dumps are encoded one at a
+        #time, and every thread keeps the recent snapshots of the chain it walks
+        self.lock = threading.RLock()
+        self.local = threading.local()
+
+        if terms is None and directory is not None and read_dictionary_info(os.path.join(directory, 'terms')) is not None:
+            terms = MappedTerms(os.path.join(directory, 'terms'))
+
+        self.terms = terms if terms is not None else TermDictionary()
+
+    @property
+    def recent(self):
+
+        if not hasattr(self.local, 'recent'):
+            self.local.recent = OrderedDict()
+
+        return self.local.recent
+
+    def path(self, graph):
+        return self.paths.get(graph, graph)
+
+    def query_text(self, metric, graph, graph2= None):
+
+        #Only the clustering coefficient depends on the settings
+        if metric == 'clustering':
+            return f'SnapshotBackend cc_samples={self.cc_samples}'
+
+        return 'SnapshotBackend'
+
+    def snapshot_path(self, graph):
+        return os.path.join(self.directory, re.sub(r'[^A-Za-z0-9_.-]', '_', str(graph)))
+
+    def encoder(self):
+
+        #A mapped dictionary can only decode. It is read into a TermDictionary with the
+        #same IDs the first time a dump has to be encoded
+        if isinstance(self.terms, MappedTerms):
+            self.terms = self.terms.dictionary()
+
+            for snap in self.recent.values():
+                snap.terms = self.terms
+
+        return self.synced_terms()
+
+    def synced_terms(self):
+
+        #Another backend on the same directory may have created the dictionary or appended
+        #to it since this one read it
+        if self.directory is None:
+            return self.terms
+
+        directory = os.path.join(self.directory, 'terms')
+
+        if isinstance(self.terms, MappedTerms):
+            info = read_dictionary_info(directory)
+
+            if info['terms'] > len(self.terms):
+                self.terms = MappedTerms(directory)
+        else:
+            self.terms.sync(directory)
+
+        return self.terms
+
+    def snapshot(self, graph):
+
+        if graph in self.recent:
+            self.recent.move_to_end(graph)
+            return self.recent[graph]
+
+        with self.lock:
+            if self.directory is not None and os.path.exists(os.path.join(self.snapshot_path(graph), 'header.json')):
+                snap = Snapshot.load(self.snapshot_path(graph), terms= self.synced_terms())
+            else:
+                snap = build_snapshot(self.path(graph), terms= self.encoder(), workers= self.workers)
+
+                if self.directory is not None:
+                    snap.save(self.snapshot_path(graph), terms_directory= os.path.join(self.directory, 'terms'))
+
+        self.recent[graph] = snap
+
+        while len(self.recent) > self.keep:
+            self.recent.popitem(last= False)
+
+        return snap
+
+    def profile(self, graph):
+        return profile_snapshot(self.snapshot(graph))
+
+    def vocabulary(self, graph):
+        return set(self.terms.decode(self.snapshot(graph).vocabulary_ids()))
+
+    def vocab_diff(self, graph1, graph2):
+        return vocab_diff_snapshots(self.snapshot(graph1), self.snapshot(graph2))
+
+    def diff(self, graph1, graph2):
+        return diff_snapshots(self.snapshot(graph1), self.snapshot(graph2))
+
+    def top_ids(self, snap, entity, limit):
+
+        #From the degree tables of the snapshot. Their values are sorted, so the stable
+        #sort gives equal counts in ID order
+        values, counts = [snap.array(name) for name in degree_tables[entity]]
+        top = np.argsort(-counts, kind= 'stable')[:limit]
+
+        return values[top], counts[top]
+
+    def top_counts(self, snap, entity, limit):
+
+        ids, counts = self.top_ids(snap, entity, limit)
+
+        return list(zip(self.terms.decode(ids), counts.tolist()))
+
+    def top_entities(self, graph, entity, limit= 10):
+        return self.top_counts(self.snapshot(graph), entity, limit)
+
+    def top_entities_all(self, graph, limit= 10):
+
+        snap = self.snapshot(graph)
+
+        return {entity: self.top_counts(snap, entity, limit) for entity in 'spo'}
+
+    def entity_trends(self, graphs, entity, limit= 10):
+
+        #Counts of the top terms of the last version in every version of the chain, as a
+        #DataFrame with one row per term and one column per graph. Terms are found by ID
+        #in each version's degree table; a version without the term has count 0
+        ids, counts = self.top_ids(self.snapshot(graphs[-1]), entity, limit)
+        trends = {}
+
+        for graph in graphs:
+            values, counts = [self.snapshot(graph).array(name) for name in degree_tables[entity]]
+            trend = np.zeros(len(ids), dtype= np.int64)
+
+            if len(values):
+                position = np.minimum(np.searchsorted(values, ids), len(values) - 1)
+                found = values[position] == ids
+                trend[found] = counts[position[found]]
+
+            trends[graph] = trend
+
+        return pd.DataFrame(trends, index= self.terms.decode(ids))
+
+    def clustering(self, graph):
+        return cl.clustering_coefficient(self.snapshot(graph), samples= self.cc_samples)['cc']
@@ -0,0 +1,112 @@
+'''
+Minimal SPARQL endpoint for the tests. Every request is answered by a function of the
+query text, which returns the result rows (a list of dictionaries from variable to value)
+or an HTTP status code to fail with. Rows are sent as CSV, TSV or JSON, whichever was
+asked; values of TSV rows are sent as they are, so they must be terms in Turtle syntax.
+dataset_answer evaluates the queries with rdflib over a dataset of named graphs.
+'''
+
+#! Imports
+import csv
+import io
+import json
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+#-----------------------------------------------------------------------------
+
+class StubEndpoint:
+
+    def __init__(self, answer):
+        self.answer = answer
+        self.queries = []
+        self.lock = threading.Lock()
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                self.respond(urllib.parse.urlparse(self.path).query)
+
+            def do_POST(self):
+                self.respond(self.rfile.read(int(self.headers.get('Content-Length', 0))).decode())
+
+            def respond(self, params):
+                params = urllib.parse.parse_qs(params)
+                query = params['query'][0]
+
+                with stub.lock:
+                    stub.queries.append(query)
+
+                rows = stub.answer(query)
+
+                if isinstance(rows, int):
+                    self.send_error(rows)
+                    return
+
+                if 'csv' in self.headers.get('Accept', '') or params.get('format') == ['csv']:
+                    body, content_type = csv_body(rows), 'text/csv'
+                elif 'tab-separated' in self.headers.get('Accept', '') or params.get('format') == ['tsv']:
+                    body, content_type = tsv_body(rows), 'text/tab-separated-values'
+                else:
+                    body, content_type = json_body(rows), 'application/sparql-results+json'
+
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_port}/sparql'
+
+    def __enter__(self):
+        threading.Thread(target= self.server.serve_forever, daemon= True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+def variables(rows):
+    return list(rows[0]) if rows else []
+
+def csv_body(rows):
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(variables(rows))
+
+    for row in rows:
+        writer.writerow([row[name] for name in variables(rows)])
+
+    return out.getvalue().encode()
+
+def tsv_body(rows):
+    lines = ['\t'.join('?' + name for name in variables(rows))]
+    lines += ['\t'.join(str(row[name]) for name in variables(rows)) for row in rows]
+
+    return ('\n'.join(lines) + '\n').encode()
+
+def json_body(rows):
+    bindings = [{name: {'type': 'literal', 'value': str(value)} for name, value in row.items()} for row in rows]
+
+    return json.dumps({'head': {'vars': variables(rows)}, 'results': {'bindings': bindings}}).encode()
+
+def dataset_answer(data):
+
+    #Graphs named in FROM NAMED are taken from data, never fetched from the web. The
+    #rdflib query parser is not thread safe, so queries are answered one at a time
+    import rdflib.plugins.sparql
+    rdflib.plugins.sparql.SPARQL_LOAD_GRAPHS = False
+    lock = threading.Lock()
+
+    def answer(query):
+        with lock:
+            return [{str(name): str(value) for name, value in row.asdict().items()} for row in data.query(query)]
+
+    return answer
@@ -0,0 +1,26 @@
+import math
+import os
+import time
+
+import numpy as np
+
+import benchmark as bm
+
+def test_measurement_reports_its_own_peak():
+    wall, rss, error = bm.timed(lambda: np.ones(50 * 2**20, dtype= np.uint8).sum())
+
+    assert error == ''
+    assert 40 < rss < 70
+
+def test_dead_child_is_an_error_row():
+    wall, rss, error = bm.timed(lambda: os._exit(3))
+
+    assert math.isnan(wall) and math.isnan(rss)
+    assert error == 'Process exited with code 3'
+
+def test_slow_child_is_stopped():
+    start = time.monotonic()
+    wall, rss, error = bm.timed(lambda: time.sleep(60), timeout= 0.5)
+
+    assert time.monotonic() - start < 10
+    assert error == 'Timed out after 0.5s'
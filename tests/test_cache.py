@@ -0,0 +1,122 @@
+import cache as ca
+import ntriples as nt
+import queries as que
+import snapshot as sn
+
+class CountingWrapper:
+    '''
+    Answers every profile query with the same counts and records the queries
+    '''
+
+    def __init__(self):
+        self.endpoint = 'http://localhost/sparql'
+        self.queries = []
+
+    def setQuery(self, query):
+        self.queries.append(query)
+
+    def query(self):
+        return self
+
+    def convert(self):
+        counts = ['triples', 'subjects', 'predicates', 'objects', 'literals', 'uobjects', 'nodes', 'vocab']
+
+        return {'results': {'bindings': [{name: {'value': '1'} for name in counts}]}}
+
+def test_one_profile_per_graph_in_a_run(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    graphs = ['http://a', 'http://b']
+
+    que.new_run()
+    wrapper = CountingWrapper()
+
+    que.data_info(wrapper, graphs)
+    for graph in graphs:
+        que.graph_profile(wrapper, graph)
+
+    assert wrapper.queries == [que.q_profile(graph) for graph in graphs]
+
+    #A new run profiles again
+    que.new_run()
+    que.data_info(wrapper, graphs)
+
+    assert len(wrapper.queries) == 4
+
+def filled_cache():
+    cache = ca.MetricCache(':memory:')
+
+    for graph in ['g1', 'g2', 'g3']:
+        cache.put(graph, 'profile', {'triples': 1})
+    cache.put('g1', 'change_ratios', [0, 0, 0, 1], graph2= 'g2')
+    cache.put('g2', 'change_ratios', [0, 0, 0, 1], graph2= 'g3')
+    cache.put('g2', 'vocab_dyna', [0, 0, 0], graph2= 'g3')
+
+    return cache
+
+def stored(cache):
+    return sorted(cache.connection.execute('SELECT graph, graph2, metric FROM metrics').fetchall())
+
+def test_invalidate_by_graph():
+    cache = filled_cache()
+
+    #Pairs with the graph in either position go too
+    assert cache.invalidate(graph= 'g2') == 4
+    assert stored(cache) == [('g1', '', 'profile'), ('g3', '', 'profile')]
+
+def test_invalidate_by_graph2():
+    cache = filled_cache()
+
+    assert cache.invalidate(graph2= 'g3') == 2
+    assert stored(cache) == [('g1', '', 'profile'), ('g1', 'g2', 'change_ratios'),
+                             ('g2', '', 'profile'), ('g3', '', 'profile')]
+
+def test_invalidate_by_metric():
+    cache = filled_cache()
+
+    assert cache.invalidate(metric= 'change_ratios') == 2
+    assert cache.invalidate(graph= 'g1', metric= 'profile') == 1
+    assert stored(cache) == [('g2', '', 'profile'), ('g2', 'g3', 'vocab_dyna'), ('g3', '', 'profile')]
+
+    assert cache.invalidate() == 3
+    assert stored(cache) == []
+
+def test_edited_query_misses_the_cache(monkeypatch):
+    cache = ca.MetricCache(':memory:')
+    wrapper = CountingWrapper()
+
+    que.graph_profile(wrapper, 'http://g', cache)
+    que.graph_profile(wrapper, 'http://g', cache)
+    assert len(wrapper.queries) == 1
+
+    #The same metric from an edited query is computed again
+    q_profile = que.q_profile
+    monkeypatch.setattr(que, 'q_profile', lambda graph: q_profile(graph) + ' #edited')
+
+    que.graph_profile(wrapper, 'http://g', cache)
+    assert wrapper.queries[1] == q_profile('http://g') + ' #edited'
+
+def test_backend_modes_do_not_share_cached_results(tmp_path):
+    dump = tmp_path / 'v.nt'
+    dump.write_text('<http://a> <http://p> <http://b> .\n<http://a> <http://p> "x" .\n')
+    cache = ca.MetricCache(str(tmp_path / 'cache.sqlite'))
+
+    exact = que.as_backend(nt.NTriplesBackend(), cache).profile(str(dump))
+    approximate = que.as_backend(nt.NTriplesBackend(approximate= True), cache).profile(str(dump))
+    exact_again = que.as_backend(nt.NTriplesBackend(), cache).profile(str(dump))
+
+    assert 'error' not in exact
+    assert 'error' in approximate
+    assert exact_again == exact
+
+def test_query_text_includes_parameters():
+    assert nt.NTriplesBackend(approximate= True, k= 256).query_text('profile', 'g') != \
+           nt.NTriplesBackend(approximate= True, k= 1024).query_text('profile', 'g')
+    assert sn.SnapshotBackend(cc_samples= 1000).query_text('clustering', 'g') != \
+           sn.SnapshotBackend().query_text('clustering', 'g')
+
+def test_graph_profile_is_not_shared_between_backends(tmp_path):
+    dump = tmp_path / 'v.nt'
+    dump.write_text('<http://a> <http://p> <http://b> .\n')
+
+    assert 'error' in que.graph_profile(nt.NTriplesBackend(approximate= True), str(dump))
+    assert 'error' not in que.graph_profile(nt.NTriplesBackend(), str(dump))
@@ -0,0 +1,64 @@
+import pytest
+
+import checkpoint as cp
+import ntriples as nt
+import queries as que
+
+class Killed(Exception):
+    pass
+
+def kill_after(manifest, rows, torn):
+
+    #Stops the run once `rows` rows are in the output. A torn kill hits after row rows + 1
+    #is written but before the manifest records it
+    record = manifest.record
+
+    def killing(graph, metric, value, graph2= None):
+        if metric == 'output' and value['rows'] > rows:
+            raise Killed
+        record(graph, metric, value, graph2)
+
+    def append_row(file_name, row):
+        if manifest.get(file_name, 'output')['rows'] == rows and not torn:
+            raise Killed
+        cp.RunManifest.append_row(manifest, file_name, row)
+
+    manifest.record = killing
+    manifest.append_row = append_row
+
+@pytest.mark.parametrize('torn', [False, True])
+@pytest.mark.parametrize('rows', [0, 2, 4])
+def test_resumed_run_writes_the_same_file(tmp_path, monkeypatch, rows, torn):
+    monkeypatch.chdir(tmp_path)
+    chains = []
+
+    for name in ['a', 'b']:
+        lines = [f'<http://{name}/s{i % 7}> <http://p{i % 3}> <http://{name}/o{i}> .' for i in range(40)]
+        (tmp_path / name).mkdir()
+        chains.append([])
+
+        for v in range(3):
+            path = f'{name}/v{v}.nt'
+            (tmp_path / path).write_text('\n'.join(lines[5*v:5*v + 20]) + '\n')
+            chains[-1].append(path)
+
+    que.new_run()
+    que.structure_and_content(nt.NTriplesBackend(), chains, file_name= 'whole.csv')
+
+    que.new_run()
+    manifest = cp.RunManifest('run.jsonl')
+    kill_after(manifest, rows, torn)
+
+    with pytest.raises(Killed):
+        que.structure_and_content(nt.NTriplesBackend(), chains, manifest= manifest, file_name= 'resumed.csv')
+
+    #The kill may also tear the last line of the manifest
+    with open('run.jsonl', 'a') as torn_line:
+        torn_line.write('{"graph": "a/v0.nt", "gra')
+
+    que.new_run()
+    table = que.structure_and_content(nt.NTriplesBackend(), chains, manifest= cp.RunManifest('run.jsonl'),
+                                      file_name= 'resumed.csv')
+
+    assert (tmp_path / 'resumed.csv').read_bytes() == (tmp_path / 'whole.csv').read_bytes()
+    assert len(table['File']) == 6
@@ -0,0 +1,75 @@
+from itertools import combinations
+
+import numpy as np
+import pytest
+
+import clustering as cl
+
+def random_edges(seed):
+
+    #Directed multigraph with self loops, as subject-object pairs of triples come
+    rng = np.random.default_rng(seed)
+    nodes = int(rng.integers(4, 40))
+    edges = int(rng.integers(1, 4 * nodes))
+
+    return rng.integers(0, nodes, edges), rng.integers(0, nodes, edges)
+
+def brute_force(u, v):
+
+    #Triangles and wedges of the undirected simple graph, from its adjacency sets
+    neighbours = {}
+
+    for a, b in zip(u.tolist(), v.tolist()):
+        if a != b:
+            neighbours.setdefault(a, set()).add(b)
+            neighbours.setdefault(b, set()).add(a)
+
+    triangles = sum(1 for a, b, c in combinations(sorted(neighbours), 3)
+                    if b in neighbours[a] and c in neighbours[a] and c in neighbours[b])
+    wedges = sum(len(adjacent) * (len(adjacent) - 1) // 2 for adjacent in neighbours.values())
+
+    return triangles, wedges
+
+def ordered(u, v):
+    keep = u != v
+
+    return cl.degree_ordered(u[keep], v[keep])
+
+@pytest.mark.parametrize('seed', range(30))
+def test_triangles_match_brute_force(seed):
+    u, v = random_edges(seed)
+    triangles, _ = brute_force(u, v)
+    n, keys = ordered(u, v)
+
+    #Small budgets split the pairs into many batches
+    for budget in [1, 7, 10_000_000]:
+        assert cl.count_triangles(n, keys, budget= budget) == triangles
+
+def test_complete_graph():
+    u, v = np.array([a for a, b in combinations(range(6), 2)]), np.array([b for a, b in combinations(range(6), 2)])
+    n, keys = ordered(u, v)
+
+    assert cl.count_triangles(n, keys) == 20
+
+@pytest.mark.parametrize('confidence', [0.9, 0.99])
+def test_sampled_transitivity_within_hoeffding_bound(confidence):
+
+    #The bound may be missed with probability 1 - confidence; the seeds are fixed, and
+    #over all of them it may not be missed more often than that
+    missed = 0
+    runs = 0
+
+    for seed in range(40):
+        u, v = random_edges(seed)
+        triangles, wedges = brute_force(u, v)
+
+        if wedges == 0:
+            continue
+
+        n, keys = ordered(u, v)
+        estimate, error = cl.sample_transitivity(n, keys, 500, confidence= confidence, seed= seed)
+
+        runs += 1
+        missed += abs(estimate - 3 * triangles / wedges) > error
+
+    assert missed <= (1 - confidence) * runs
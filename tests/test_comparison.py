@@ -0,0 +1,28 @@
+import pytest
+
+import benchmark as bm
+import comparison as cp
+import ntriples as nt
+import queries as que
+import snapshot as sn
+
+@pytest.mark.parametrize('make', [sn.SnapshotBackend, nt.NTriplesBackend])
+def test_matrix_matches_pairwise_ratios(tmp_path, make):
+    graphs = bm.synthetic_chain(str(tmp_path / 'chain'), triples= 400, versions= 3, churn= 0.2)
+    matrices = cp.comparison_matrix(make(), graphs, file_name= str(tmp_path / 'matrix'))
+
+    #Every ordered pair, the reverse direction included, against a fresh backend
+    backend = nt.NTriplesBackend()
+
+    for old in range(3):
+        for new in range(3):
+            if old == new:
+                continue
+
+            expected = backend.change_ratios(graphs[old], graphs[new]) + que.vocab_dyna(backend, graphs[old], graphs[new])
+            found = [matrices[name].iloc[old, new] for name in cp.ratio_names]
+
+            assert found == pytest.approx(expected)
+
+    assert list(matrices['Growth'].values.diagonal()) == [1.0, 1.0, 1.0]
+    assert (tmp_path / 'matrix_Vdyn.csv').exists()
@@ -0,0 +1,89 @@
+import os
+import re
+import threading
+import time
+
+import executor as ex
+import queries as que
+import snapshot as sn
+from stub_server import StubEndpoint
+
+def test_results_keep_input_order_when_answers_arrive_out_of_order():
+    finished = []
+
+    #The first queries are answered last
+    def answer(query):
+        i = int(re.search(r'#(\d+)', query).group(1))
+        time.sleep(0.05 * (6 - i))
+        finished.append(i)
+        return [{'n': i * 10}]
+
+    with StubEndpoint(answer) as stub:
+        tasks = {f'graph{i}': lambda b, i= i: que.query_retriever(b.wrapper, f'SELECT ?n WHERE {{}} #{i}', 'n')
+                 for i in range(6)}
+
+        results = ex.run_parallel(ex.BackendPool(stub.url), tasks, workers= 6)
+
+    assert finished != sorted(finished)
+    assert list(results) == list(tasks)
+    assert results == {f'graph{i}': i * 10.0 for i in range(6)}
+
+def test_every_thread_gets_its_own_backend():
+    with StubEndpoint(lambda query: [{'n': 1}]) as stub:
+        pool = ex.BackendPool(stub.url)
+        barrier = threading.Barrier(3)
+
+        def task(backend):
+            barrier.wait()
+            return id(backend.wrapper)
+
+        results = ex.run_parallel(pool, {i: task for i in range(3)}, workers= 3)
+
+    assert len(set(results.values())) == 3
+
+def test_parallel_driver_on_a_snapshot_chain(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    chains = []
+
+    for name in ['dbpedia', 'wiki']:
+        lines = [f'<http://{name}/s{i % 7}> <http://p{i % 3}> <http://{name}/o{i}> .' for i in range(40)]
+        chains.append([])
+
+        for v in range(3):
+            path = tmp_path / f'{name}{v}.nt'
+            path.write_text('\n'.join(lines[5*v:5*v + 20]) + '\n')
+            chains[-1].append(str(path))
+
+    expected = que.structure_and_content(sn.SnapshotBackend(), chains)
+    os.rename('structure_and_content.csv', 'serial.csv')
+
+    #Every dump is encoded once, into the one dictionary of the directory
+    built = []
+    build = sn.build_snapshot
+    monkeypatch.setattr(sn, 'build_snapshot', lambda path, **kwargs: built.append(path) or build(path, **kwargs))
+
+    result = ex.structure_and_content_parallel(lambda: sn.SnapshotBackend(directory= 'chain'), chains, workers= 3,
+                                               file_name= 'parallel.csv')
+
+    assert result == expected
+    assert sorted(built) == sorted(path for chain in chains for path in chain)
+    assert open('parallel.csv').read() == open('serial.csv').read()
+
+def test_vocabularies_of_a_chain_are_downloaded_once(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    graphs = ['http://g1', 'http://g2', 'http://g3']
+    vocabularies = {graph: [{'vocab_set': f'http://t{i}'} for i in range(n, n + 5)] for n, graph in enumerate(graphs)}
+    profile = {name: 10 for name in que.profile_keys}
+    diff = {'previous': 10, 'next': 10, 'removals': 1, 'additions': 1}
+
+    def answer(query):
+        if 'vocab_set' in query:
+            return vocabularies[re.search(r'GRAPH <([^>]+)>', query).group(1)]
+        return [diff] if 'MINUS' in query else [profile]
+
+    with StubEndpoint(answer) as stub:
+        result = ex.structure_and_content_parallel(stub.url, [graphs], workers= 4)
+
+    downloads = [query for query in stub.queries if 'vocab_set' in query]
+    assert len(downloads) == len(graphs)
+    assert result['Vdyn'] == [0, 2 / 6, 2 / 6]
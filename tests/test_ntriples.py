@@ -0,0 +1,66 @@
+from collections import Counter
+
+import ntriples as nt
+import queries as que
+import snapshot as sn
+
+def write(path, lines):
+    path.write_text(''.join(f'{line} .\n' for line in lines))
+    return str(path)
+
+def chain(tmp_path):
+    old = write(tmp_path / 'old.nt', ['<http://a> <http://p> <http://b>',
+                                      '<http://a> <http://p> <http://b>',
+                                      '<http://a> <http://q> "lit"',
+                                      '<http://b> <http://p> <http://c>',
+                                      '<http://c> <http://q> "lit"@en'])
+    new = write(tmp_path / 'new.nt', ['<http://a> <http://p> <http://b>',
+                                      '<http://b> <http://p> <http://c>',
+                                      '<http://d> <http://p> <http://a>'])
+    return old, new
+
+def test_exact_profile(tmp_path):
+    old, new = chain(tmp_path)
+
+    #The repeated line is one triple; "lit" and "lit"@en are two literals
+    assert nt.NTriplesBackend().profile(old) == {'triples': 4, 'subjects': 3, 'predicates': 2, 'objects': 4,
+                                                 'literals': 2, 'uobjects': 2, 'nodes': 3, 'vocab': 7,
+                                                 'outdegree_sum': 4}
+
+def test_exact_diff(tmp_path):
+    old, new = chain(tmp_path)
+
+    assert nt.NTriplesBackend().diff(old, new) == {'previous': 4, 'next': 3, 'additions': 1, 'removals': 2, 'union': 5}
+
+def test_triple_keys_keep_term_boundaries():
+    assert nt.triple_key(('http://a b', 'http://p', 'x')) != nt.triple_key(('http://a', 'b http://p', 'x'))
+
+def test_chain_walk_reads_every_version_once(tmp_path, monkeypatch):
+    lines = [f'<http://s{i % 7}> <http://p{i % 3}> <http://o{i}>' for i in range(40)]
+    graphs = [write(tmp_path / f'v{v}.nt', lines[5 * v:5 * v + 20]) for v in range(4)]
+    scans = Counter()
+    stream_triples = nt.stream_triples
+
+    def counted(path):
+        scans[path] += 1
+        return stream_triples(path)
+
+    monkeypatch.setattr(nt, 'stream_triples', counted)
+
+    #The old side of every pair is the new side of the pair before
+    backend = nt.NTriplesBackend()
+    for old, new in zip(graphs, graphs[1:]):
+        que.vocab_dyna(backend, old, new)
+        backend.change_ratios(old, new)
+
+    #One scan for the vocabulary and one for the triple keys
+    assert scans == {graph: 2 for graph in graphs}
+
+    scans.clear()
+    backend = sn.SnapshotBackend(keep= 2)
+    for old, new in zip(graphs, graphs[1:]):
+        que.vocab_dyna(backend, old, new)
+        backend.change_ratios(old, new)
+        backend.profile(new)
+
+    assert scans == {graph: 1 for graph in graphs}
@@ -0,0 +1,66 @@
+import pytest
+
+import ntriples as nt
+import partitions as pa
+from stub_server import StubEndpoint, dataset_answer
+
+rdflib = pytest.importorskip('rdflib')
+
+@pytest.fixture
+def chain(tmp_path):
+
+    #Two versions as dump files and as named graphs of the endpoint, a fifth of the
+    #triples changed between them
+    lines = [f'<http://example.com/s{i % 37}> <http://example.com/p{i % 12}> '
+             + (f'"value {i % 29}"' if i % 4 == 0 else f'<http://example.com/o{i % 53}>') + ' .\n'
+             for i in range(360)]
+    graphs = {}
+
+    for v in range(2):
+        path = tmp_path / f'v{v}.nt'
+        path.write_text(''.join(lines[60*v:60*v + 300]))
+        graphs[f'http://example.com/v{v}'] = str(path)
+
+    data = rdflib.Dataset()
+
+    for graph, path in graphs.items():
+        data.graph(rdflib.URIRef(graph)).parse(path, format= 'nt')
+
+    with StubEndpoint(dataset_answer(data)) as stub:
+        yield stub, graphs
+
+@pytest.mark.parametrize('group_size', [1, 5, 100])
+def test_partitions_match_whole_graph(chain, group_size):
+    stub, graphs = chain
+    whole = nt.NTriplesBackend(graphs)
+    partitioned = pa.PartitionedBackend(stub.url, workers= 3, group_size= group_size)
+    v0, v1 = graphs
+
+    for graph in graphs:
+        assert partitioned.profile(graph) == whole.profile(graph)
+
+    assert partitioned.diff(v0, v1) == whole.diff(v0, v1)
+    assert partitioned.vocab_diff(v0, v1) == whole.vocab_diff(v0, v1)
+
+def test_approximate_partitions_match_whole_graph(chain):
+    stub, graphs = chain
+    whole = nt.NTriplesBackend(graphs)
+    partitioned = pa.PartitionedBackend(stub.url, workers= 3, group_size= 5, approximate= True)
+    v0, v1 = graphs
+
+    #Merged sketches of the partitions estimate the distinct counts of the whole graph
+    for graph in graphs:
+        estimate, exact = partitioned.profile(graph), whole.profile(graph)
+
+        for name in ['triples', 'predicates', 'literals', 'outdegree_sum']:
+            assert estimate[name] == exact[name]
+        for name in ['subjects', 'objects', 'uobjects', 'nodes', 'vocab']:
+            assert estimate[name] == pytest.approx(exact[name], rel= 3 * estimate['error'])
+
+    #Diff counts are sums of exact partition counts in both modes
+    assert partitioned.diff(v0, v1) == whole.diff(v0, v1)
+
+    estimate, exact = partitioned.vocab_diff(v0, v1), whole.vocab_diff(v0, v1)
+    assert estimate.keys() == exact.keys()
+    for name in exact:
+        assert estimate[name] == pytest.approx(exact[name], rel= 0.1, abs= 5)
@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+
+import cache as ca
+import queries as que
+import visualizer as vi
+
+def test_presence_flags():
+    versions = [(np.array([0, 1]), np.array([1, 2])), None, (np.array([4]), np.array([], dtype= np.int64))]
+
+    presence = que.presence_flags(versions, 6, ['2016', '2019', '2022'])
+
+    assert list(presence.columns) == ['ID', '2016', '2019', '2022']
+    assert presence['ID'].tolist() == [0, 1, 2, 4]
+    assert presence['2016'].tolist() == [1, 3, 2, 0]
+    assert presence['2019'].isna().all()
+    assert presence['2022'].tolist() == [0, 0, 0, 1]
+    assert presence['2016'].dtype == pd.UInt8Dtype()
+
+def chain_cache():
+
+    #Class sets of three versions, the middle one without an ontology, as they would
+    #come back from the endpoint
+    cache = ca.MetricCache(':memory:')
+    ont = {'http://A', 'http://B', 'http://C'}
+    used = {'g0': {'http://A', 'http://B', 'http://X'}, 'g2': {'http://A', 'http://Y'}}
+
+    for graph, classes in used.items():
+        query = que.q_icr_check(graph, 'o', 'g') + que.q_icr_check(graph, 'o', 'o')
+        cache.put(graph, 'icr_sets', [sorted(classes), sorted(ont)], graph2= 'o', query= query)
+        cache.put(graph, 'icr_set', [sorted(classes - ont), sorted(ont - classes), len(classes), len(ont)],
+                  graph2= 'o', query= query)
+
+    return cache
+
+def test_version_without_ontology(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    graphs, versions, onts = ['g0', 'g1', 'g2'], [0, 1, 2], ['o', 'None', 'o']
+    cache = chain_cache()
+
+    presence = que.ipcr_presence(None, graphs, versions, onts, 'icr', cache)
+
+    assert presence['1'].isna().all()
+    assert que.presence_sets(presence, 1) == (set(), set())
+    assert que.presence_sets(presence, 0) == ({'http://X'}, {'http://C'})
+    assert que.presence_sets(presence, 2) == ({'http://Y'}, {'http://B', 'http://C'})
+
+    #Both formats read back to the same numbers
+    que.ipcr_csv(None, graphs, versions, onts, 'icr', cache, compact= True)
+    compact = vi.ont_prepare('icr.csv').reset_index(drop= True)
+
+    que.ipcr_csv(None, graphs, versions, onts, 'icr', cache)
+    table = pd.read_csv('icr.csv', delimiter= ';')
+    assert 'ID' not in table.columns
+    default = vi.ont_prepare('icr.csv').reset_index(drop= True)
+
+    columns = ['Version', 'ex_set', 'graph_set', 'ont_set', 'external', 'inst_ont', 'ont_diff']
+    pd.testing.assert_frame_equal(compact[columns], default[columns], check_dtype= False)
+    assert compact['ont_set'].isna().tolist() == [False, True, False]
@@ -0,0 +1,62 @@
+import pytest
+
+import executor as ex
+import queries as que
+from stub_server import StubEndpoint, dataset_answer
+
+rdflib = pytest.importorskip('rdflib')
+
+DBO = 'http://dbpedia.org/ontology/'
+
+def dataset():
+
+    #Two versions of a graph and their ontology, evaluated by rdflib behind the stub
+    rdf, rdfs, owl = rdflib.RDF, rdflib.RDFS, rdflib.OWL
+    iri = rdflib.URIRef
+    data = rdflib.Dataset()
+
+    ont = data.graph(iri('http://o'))
+    for name in 'ABCD':
+        ont.add((iri(DBO + name), rdf.type, owl.Class))
+    ont.add((iri(DBO + 'E'), rdf.type, rdfs.Class))
+    ont.add((iri(DBO + 'B'), rdfs.subClassOf, iri(DBO + 'A')))
+    ont.add((iri(DBO + 'C'), rdfs.subClassOf, iri(DBO + 'A')))
+    ont.add((iri(DBO + 'p'), rdf.type, owl.ObjectProperty))
+    ont.add((iri(DBO + 'q'), rdf.type, owl.DatatypeProperty))
+    ont.add((iri(DBO + 'r'), rdf.type, owl.FunctionalProperty))
+
+    g1 = data.graph(iri('http://g1'))
+    g1.add((iri('http://x1'), rdf.type, iri(DBO + 'A')))
+    g1.add((iri('http://x2'), rdf.type, iri(DBO + 'B')))
+    g1.add((iri('http://x2'), rdf.type, iri('http://other/Z')))
+    g1.add((iri('http://x1'), iri(DBO + 'p'), iri('http://x2')))
+
+    g2 = data.graph(iri('http://g2'))
+    g2.add((iri('http://x1'), rdf.type, iri(DBO + 'C')))
+    g2.add((iri('http://x1'), iri(DBO + 'p'), iri('http://x2')))
+    g2.add((iri('http://x1'), iri(DBO + 'q'), rdflib.Literal(1)))
+    g2.add((iri('http://x1'), iri('http://other/s'), rdflib.Literal(2)))
+
+    return data
+
+@pytest.fixture
+def endpoint():
+    with StubEndpoint(dataset_answer(dataset())) as stub:
+        yield stub
+
+@pytest.mark.parametrize('graph', ['http://g1', 'http://g2'])
+def test_batch_matches_single_queries(endpoint, graph):
+    wrapper = ex.sparql_factory(endpoint.url)().wrapper
+
+    icr = que.query_retriever(wrapper, que.q_icr(graph, 'http://o'), 'icr')
+    ipr = que.query_retriever(wrapper, que.q_ipr(graph, 'http://o'), 'ipr')
+    imi = 1 / que.query_retriever(wrapper, que.q_imi('http://o'), 'imi')
+    sent = len(endpoint.queries)
+
+    batch = que.quality_batch(wrapper, graph, 'http://o')
+
+    assert len(endpoint.queries) == sent + 1
+    assert batch == pytest.approx({'icr': icr, 'ipr': ipr, 'imi': imi})
+
+    #Only the selected metrics, with their subselects
+    assert que.quality_batch(wrapper, graph, 'http://o', ['ipr']) == pytest.approx({'ipr': ipr})
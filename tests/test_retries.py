@@ -0,0 +1,87 @@
+import pytest
+from SPARQLWrapper.SPARQLExceptions import EndPointInternalError, QueryBadFormed
+
+import executor as ex
+import queries as que
+import tracing
+from stub_server import StubEndpoint
+
+@pytest.fixture
+def delays(monkeypatch):
+    monkeypatch.setitem(que.query_policy, 'retries', 3)
+    monkeypatch.setitem(que.query_policy, 'backoff', 0.5)
+    monkeypatch.setitem(que.query_policy, 'max_backoff', 1.5)
+
+    waited = []
+    monkeypatch.setattr(que.time, 'sleep', waited.append)
+
+    return waited
+
+def test_failed_requests_are_retried_with_backoff(delays):
+    answers = iter([500, 500, [{'n': 7}]])
+
+    with StubEndpoint(lambda query: next(answers)) as stub:
+        backend = ex.sparql_factory(stub.url)()
+        assert que.query_retriever(backend.wrapper, 'SELECT ?n WHERE {}', 'n') == 7.0
+
+    assert delays == [0.5, 1.0]
+
+def test_retries_give_up(delays):
+    with StubEndpoint(lambda query: 500) as stub:
+        backend = ex.sparql_factory(stub.url)()
+
+        with pytest.raises(EndPointInternalError):
+            que.query_retriever(backend.wrapper, 'SELECT ?n WHERE {}', 'n')
+
+    assert len(stub.queries) == 4
+    assert delays == [0.5, 1.0, 1.5]
+
+def test_bad_queries_are_not_retried(delays):
+    with StubEndpoint(lambda query: 400) as stub:
+        backend = ex.sparql_factory(stub.url)()
+
+        with pytest.raises(QueryBadFormed):
+            backend.diff('http://g1', 'http://g2')
+
+    assert len(stub.queries) == 1
+    assert delays == []
+
+def test_failed_diff_is_split_per_predicate(delays):
+    counts = {'http://p1': {'previous': 3, 'next': 4, 'removals': 1, 'additions': 2},
+              'http://p2': {'previous': 5, 'next': 5, 'removals': 0, 'additions': 0}}
+
+    #Only the diff of the whole graphs times out
+    def answer(query):
+        if 'SELECT DISTINCT ?p' in query:
+            return [{'p': predicate} for predicate in counts]
+        for predicate, row in counts.items():
+            if f'<{predicate}>' in query:
+                return [row]
+        return 500
+
+    with StubEndpoint(answer) as stub:
+        backend = ex.sparql_factory(stub.url)()
+        diff = backend.diff('http://g1', 'http://g2')
+
+    #The timed out diff is not retried
+    assert diff == {'previous': 8, 'next': 9, 'removals': 1, 'additions': 2, 'union': 10}
+    assert len(stub.queries) == 1 + 1 + 2
+    assert delays == []
+
+def test_retries_are_logged_and_traced(delays, capsys, caplog):
+    answers = iter([503, [{'n': 7}]])
+    tracing.start(None)
+
+    try:
+        with StubEndpoint(lambda query: next(answers)) as stub:
+            backend = ex.sparql_factory(stub.url)()
+
+            with tracing.span('count'):
+                que.query_retriever(backend.wrapper, 'SELECT ?n WHERE {}', 'n')
+    finally:
+        table = tracing.stop()
+
+    assert 'retry 1/3' not in capsys.readouterr().out
+    assert 'retry 1/3 in 0.5s' in caplog.text
+    assert [event['attempt'] for event in tracing.events if event['event'] == 'retry'] == [1]
+    assert table.loc['count', 'retries'] == 1
@@ -0,0 +1,51 @@
+import os
+
+import numpy as np
+
+import ntriples as nt
+import queries as que
+import sketches as sk
+
+def signature(terms, k= 64):
+    hashes = sk.term_hashes(terms)
+    hll = sk.HyperLogLog(10)
+    hll.add_hashes(hashes)
+    minhash = sk.MinHash(k)
+    minhash.add_hashes(hashes)
+
+    return sk.VocabSignature(hll, minhash)
+
+def test_vocab_ratios_stay_within_bounds():
+
+    #Small sketches of barely and fully overlapping sets, where the estimates are noisiest
+    for shift in [0, 1, 10, 900, 1000, 5000]:
+        old = signature(f'term {i}' for i in range(1000))
+        new = signature(f'term {i}' for i in range(shift, shift + 3000))
+
+        vdiff = sk.vocab_diff_estimate(old, new)
+        assert all(0 <= ratio <= 1 for ratio in que.vocab_ratios(vdiff))
+        assert vdiff['union'] >= max(old.count(), new.count())
+
+def test_vocab_ratios_of_subsets_stay_within_bounds():
+    subsets = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'subsets')
+    backend = nt.NTriplesBackend(approximate= True)
+    ratios = que.vocab_ratios(backend.vocab_diff(os.path.join(subsets, '35.nt'), os.path.join(subsets, 'dims.nt')))
+
+    assert all(0 <= ratio <= 1 for ratio in ratios)
+
+def test_countmin_width_not_power_of_two():
+    sketch = sk.CountMin(width= 1000, depth= 3)
+    assert sketch.table.shape == (3, 1024)
+
+    hashes = sk.term_hashes(f'term {i}' for i in range(5000))
+    sketch.add_hashes(hashes, np.ones(len(hashes)))
+
+    #Count-Min never undercounts
+    assert (sketch.estimate(hashes) >= 1).all()
+    assert sketch.total == 5000
+
+def test_heavy_hitters_width_not_power_of_two():
+    hitters = sk.HeavyHitters(capacity= 50, width= 1000, depth= 4)
+    hitters.add_batch(['a'] * 500 + ['b'] * 300 + [f'rare {i}' for i in range(2000)])
+
+    assert [term for term, count in hitters.top(2)] == ['a', 'b']
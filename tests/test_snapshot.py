@@ -0,0 +1,169 @@
+import numpy as np
+import pytest
+
+import ntriples as nt
+import snapshot as sn
+
+def write(path, lines):
+    path.write_text(''.join(f'{line} .\n' for line in lines))
+    return str(path)
+
+def test_id_width():
+    assert sn.id_dtype(0) == np.uint32
+    assert sn.id_dtype(2**32 - 1) == np.uint32
+    assert sn.id_dtype(2**32) == np.uint64
+
+class HugeDictionary(sn.TermDictionary):
+
+    #Reports four billion more terms than it has, as a dictionary past the uint32 limit
+    def __len__(self):
+        return super().__len__() + 2**32
+
+def test_dictionary_outgrowing_uint32(tmp_path):
+    (tmp_path / 'v0.nt').write_text('<http://a> <http://p> <http://b> .\n<http://a> <http://p> <http://c> .\n')
+    (tmp_path / 'v1.nt').write_text('<http://a> <http://p> <http://b> .\n<http://d> <http://p> <http://b> .\n')
+
+    terms = sn.TermDictionary()
+    old = sn.build_snapshot(str(tmp_path / 'v0.nt'), terms)
+    terms.__class__ = HugeDictionary
+    new = sn.build_snapshot(str(tmp_path / 'v1.nt'), terms)
+
+    assert old.triples.dtype == np.uint32
+    assert new.triples.dtype == np.uint64
+
+    #The narrow and the wide version still compare: http://c left, http://d came
+    assert sn.vocab_dyna_snapshot(old, new) == pytest.approx([2 / 5, 1 / 5, 1 / 5])
+
+    #and the rows come back wide
+    diff = sn.diff_snapshots(old, new, rows= True)
+
+    assert (diff['additions'], diff['removals']) == (1, 1)
+    assert diff['added'].dtype == diff['removed'].dtype == np.uint64
+    assert terms.decode(diff['added'][0]) == ['http://d', 'http://p', 'http://b']
+    assert terms.decode(diff['removed'][0]) == ['http://a', 'http://p', 'http://c']
+
+def random_versions(tmp_path, seed):
+    rng = np.random.default_rng(seed)
+    lines = [f'<http://s{s}> <http://p{p}> <http://o{o}>' for s, p, o in rng.integers(0, 30, (400, 3))]
+    return write(tmp_path / 'old.nt', lines[:300]), write(tmp_path / 'new.nt', lines[100:])
+
+def test_diff_matches_ntriples(tmp_path):
+    old, new = random_versions(tmp_path, 0)
+    backend = sn.SnapshotBackend()
+
+    diff = sn.diff_snapshots(backend.snapshot(old), backend.snapshot(new), rows= True)
+    expected = nt.NTriplesBackend().diff(old, new)
+
+    assert {key: diff[key] for key in expected} == expected
+    assert len(diff['added']) == expected['additions']
+    assert len(diff['removed']) == expected['removals']
+
+@pytest.mark.parametrize('widths', [[2, 2, 2], [60, 30, 2], [40, 40, 40]])
+def test_merge_with_wide_keys(widths):
+    rng = np.random.default_rng(1)
+    rows = sn.sort_triples(rng.integers(0, 4, (200, 3)).astype(np.uint64))
+
+    #Widen the IDs so the keys take one, two and three words
+    rows = rows << np.array(widths, dtype= np.uint64) - np.uint64(2)
+    old, new = rows[::2], rows[len(rows) // 3:]
+
+    kept, in_old = sn.merge_common(*sn.triple_keys(old, new))
+
+    old_set, new_set = set(map(tuple, old)), set(map(tuple, new))
+    assert kept.tolist() == [tuple(row) in new_set for row in old]
+    assert in_old.tolist() == [tuple(row) in old_set for row in new]
+
+def test_unparsable_lines_are_counted_once(tmp_path, capsys):
+    lines = [f'<http://s{i}> <http://p> <http://o{i}> .' if i % 10 else 'not a triple' for i in range(200)]
+    path = tmp_path / 'broken.nt'
+    path.write_text('\n'.join(lines) + '\n')
+
+    serial = sn.build_snapshot(str(path))
+    serial_output = capsys.readouterr().out
+
+    parallel = sn.build_snapshot_parallel(str(path), sn.TermDictionary(), workers= 2, chunk_size= 500)
+    parallel_output = capsys.readouterr().out
+
+    assert serial_output == parallel_output == f'{path}: skipped 20 unparsable lines\n'
+    assert len(serial.triples) == len(parallel.triples) == 180
+
+def test_save_load_round_trip(tmp_path):
+    old, new = random_versions(tmp_path, 2)
+    terms = sn.TermDictionary()
+    built = [sn.build_snapshot(old, terms= terms), sn.build_snapshot(new, terms= terms)]
+
+    for i, snap in enumerate(built):
+        snap.save(str(tmp_path / f'v{i}'), terms_directory= str(tmp_path / 'terms'))
+
+    loaded = [sn.Snapshot.load(str(tmp_path / f'v{i}')) for i in range(2)]
+
+    #Opening reads the header only, the count comes from there
+    assert [len(snap) for snap in loaded] == [len(snap.triples) for snap in built]
+    assert all(snap.arrays == {} for snap in loaded)
+
+    assert isinstance(loaded[0].triples, np.memmap)
+    assert sn.diff_snapshots(*loaded) == sn.diff_snapshots(*built)
+    assert sn.vocab_diff_snapshots(*loaded) == sn.vocab_diff_snapshots(*built)
+    assert sn.profile_snapshot(loaded[1]) == sn.profile_snapshot(sn.Snapshot(terms, built[1].triples))
+    assert loaded[1].terms.decode(loaded[1].vocabulary_ids()) == terms.decode(built[1].vocabulary_ids())
+
+    in_memory = sn.Snapshot.load(str(tmp_path / 'v1'), mmap= False)
+    assert not isinstance(in_memory.triples, np.memmap)
+    assert (in_memory.array('pos') == built[1].array('pos')).all()
+
+def test_diverged_writers_do_not_share_ids(tmp_path):
+    a = write(tmp_path / 'a.nt', ['<http://A> <http://p> <http://B>'])
+    b = write(tmp_path / 'b.nt', ['<http://X1> <http://p> <http://X2>'])
+    c = write(tmp_path / 'c.nt', ['<http://Y1> <http://p> <http://Y2>'])
+    directory = str(tmp_path / 'chain')
+
+    sn.SnapshotBackend(directory= directory).profile(a)
+
+    #Two backends extend the same persisted dictionary with different terms at once
+    first = sn.SnapshotBackend(directory= directory)
+    second = sn.SnapshotBackend(directory= directory)
+    terms = second.encoder()
+    snap = sn.build_snapshot(c, terms= terms)
+    first.profile(b)
+
+    with pytest.raises(ValueError):
+        snap.save(str(tmp_path / 'c'), terms_directory= directory + '/terms')
+
+    #What is on disk is still the dictionary of a and b
+    terms = sn.MappedTerms(directory + '/terms')
+    assert terms.decode(range(len(terms))) == ['http://A', 'http://p', 'http://B', 'http://X1', 'http://X2']
+
+def test_writers_with_the_same_terms_agree(tmp_path):
+    a = write(tmp_path / 'a.nt', ['<http://A> <http://p> <http://B>'])
+    b = write(tmp_path / 'b.nt', ['<http://X1> <http://p> <http://X2>'])
+    directory = str(tmp_path / 'chain')
+
+    sn.SnapshotBackend(directory= directory).profile(a)
+
+    first = sn.SnapshotBackend(directory= directory)
+    second = sn.SnapshotBackend(directory= directory)
+    first.snapshot(b)
+    second.encoder().encode('http://X1')
+    second.encoder().encode('http://p')
+    second.encoder().encode('http://X2')
+    second.terms.persist(directory + '/terms')
+
+    assert len(sn.MappedTerms(directory + '/terms')) == 5
+
+def test_backends_opened_before_the_directory_share_its_dictionary(tmp_path):
+    a = write(tmp_path / 'a.nt', ['<http://A> <http://p> <http://B>', '<http://A> <http://p> <http://C>'])
+    b = write(tmp_path / 'b.nt', ['<http://A> <http://p> <http://B>', '<http://X> <http://q> <http://B>'])
+    directory = str(tmp_path / 'chain')
+
+    #Neither has a dictionary on disk to read when it is opened
+    first = sn.SnapshotBackend(directory= directory)
+    second = sn.SnapshotBackend(directory= directory)
+
+    first.profile(a)
+    second.profile(b)
+
+    assert first.terms.id == second.terms.id == sn.MappedTerms(directory + '/terms').id
+
+    expected = {'previous': 2, 'next': 2, 'additions': 1, 'removals': 1, 'union': 3}
+    assert first.diff(a, b) == second.diff(a, b) == expected
+    assert first.vocabulary(b) == second.vocabulary(b) == {'http://A', 'http://p', 'http://B', 'http://X', 'http://q'}
@@ -0,0 +1,42 @@
+import pytest
+from SPARQLWrapper import TSV
+
+import executor as ex
+import queries as que
+from stub_server import StubEndpoint
+
+XSD = 'http://www.w3.org/2001/XMLSchema#'
+
+#Terms as an endpoint writes them in TSV, and the plain value JSON bindings carry
+TERMS = [('<http://example.com/a>', 'http://example.com/a'),
+         ('"plain"', 'plain'),
+         ('"chat"@fr', 'chat'),
+         (f'"5"^^<{XSD}integer>', '5'),
+         (r'"tab\there \"quoted\" back\\slash"', 'tab\there "quoted" back\\slash'),
+         (r'"two\nlines"', 'two\nlines'),
+         (r'"say \"hi\"@x"@en', 'say "hi"@x'),
+         ('_:b0', '_:b0'),
+         ('42', '42')]
+
+@pytest.mark.parametrize('term, value', TERMS)
+def test_tsv_value(term, value):
+    assert que.tsv_value(term) == value
+
+def test_streamed_tsv_rows():
+    rows = [{'s': '<http://example.com/s>', 'o': term} for term, _ in TERMS]
+
+    with StubEndpoint(lambda query: rows) as stub:
+        wrapper = ex.sparql_factory(stub.url)().wrapper
+        streamed = list(que.stream_rows(wrapper, 'SELECT ?s ?o WHERE {}', format= TSV))
+
+    assert streamed == [{'s': 'http://example.com/s', 'o': value} for _, value in TERMS]
+
+def test_streamed_csv_rows_keep_the_wrapper_format():
+    rows = [{'s': f'http://example.com/s{i}', 'o': f'value, {i}'} for i in range(3)]
+
+    with StubEndpoint(lambda query: rows) as stub:
+        wrapper = ex.sparql_factory(stub.url)().wrapper
+        return_format = wrapper.returnFormat
+
+        assert list(que.stream_rows(wrapper, 'SELECT ?s ?o WHERE {}')) == rows
+        assert wrapper.returnFormat == return_format
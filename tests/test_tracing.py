@@ -0,0 +1,100 @@
+import multiprocessing
+import time
+
+import pytest
+
+import executor as ex
+import queries as que
+import tracing
+from stub_server import StubEndpoint, csv_body, json_body
+
+ROWS = [{'s': f'http://s{i}', 'n': i} for i in range(25)]
+
+@pytest.fixture
+def trace(tmp_path):
+    tracing.start(str(tmp_path / 'trace.jsonl'))
+
+    yield tmp_path / 'trace.jsonl'
+
+    if tracing.enabled:
+        tracing.stop()
+
+def slow_answer(query):
+
+    #Headers are sent after 0.2s, the time the server spends on the query
+    time.sleep(0.2)
+
+    return ROWS
+
+def query_events():
+    return [event for event in tracing.events if event['event'] == 'query']
+
+def test_streamed_request(trace):
+    with StubEndpoint(slow_answer) as stub:
+        backend = ex.sparql_factory(stub.url)()
+
+        with tracing.span('rows', 'http://g'):
+            assert len(list(que.stream_rows(backend.wrapper, 'SELECT ?s ?n WHERE {}'))) == 25
+
+    event, = query_events()
+
+    assert event['rows'] == 25
+    assert event['bytes'] == len(csv_body(ROWS))
+    assert 0.2 <= event['server_s'] <= event['wall_s']
+    assert (event['metric'], event['graph'], event['error']) == ('rows', 'http://g', None)
+
+def test_converted_request(trace):
+    with StubEndpoint(slow_answer) as stub:
+        backend = ex.sparql_factory(stub.url)()
+        que.run_query(backend.wrapper, 'SELECT ?s ?n WHERE {}')
+
+    event, = query_events()
+
+    assert event['rows'] == 25
+    assert event['bytes'] == len(json_body(ROWS))
+    assert 0.2 <= event['server_s'] <= event['wall_s']
+
+def test_failed_request(trace, monkeypatch):
+    monkeypatch.setitem(que.query_policy, 'retries', 0)
+
+    with StubEndpoint(lambda query: 400) as stub:
+        backend = ex.sparql_factory(stub.url)()
+
+        with pytest.raises(Exception):
+            que.run_query(backend.wrapper, 'SELECT ?s WHERE {}')
+
+    event, = query_events()
+
+    assert event['error'] == 'QueryBadFormed'
+    assert (event['bytes'], event['rows'], event['server_s']) == (0, 0, None)
+
+def spans(name, n):
+    for i in range(n):
+        with tracing.span(name, f'http://g{i}'):
+            pass
+
+def test_forked_processes_append_whole_lines(trace):
+    context = multiprocessing.get_context('fork')
+    children = [context.Process(target= spans, args= (f'child{c}', 200)) for c in range(3)]
+
+    for child in children:
+        child.start()
+
+    spans('parent', 200)
+
+    for child in children:
+        child.join()
+
+    #Every line parses, and the summary has the spans of every process
+    table = tracing.stop()
+    assert len(tracing.read_events(trace)) == len(trace.read_text().splitlines()) == 800
+    assert table['spans'].to_dict() == {'child0': 200, 'child1': 200, 'child2': 200, 'parent': 200}
+
+def test_torn_line_is_skipped(trace):
+    spans('metric', 2)
+    tracing.stop()
+
+    with open(trace, 'a') as torn:
+        torn.write('{"event": "metr')
+
+    assert len(tracing.read_events(trace)) == 2
@@ -0,0 +1,243 @@
+'''
+This file contains the instrumentation of a run. Metric spans and endpoint requests are
+written as JSON lines to a trace file, tagged with the metric and graph they belong to,
+and summarised per metric at the end of the run. Tracing is off until start() is called.
+
+    tracing.start('trace.jsonl')
+    que.structure_and_content(sparql, graph_list)
+    tracing.stop()
+'''
+
+#! Imports
+import contextvars
+import io
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+
+#-----------------------------------------------------------------------------
+
+enabled = False
+
+trace_path = None
+trace_fd = None
+events = []
+lock = threading.Lock()
+
+#Open spans of the current thread or task, innermost last
+spans = contextvars.ContextVar('spans', default= ())
+
+def start(path= 'trace.jsonl'):
+
+    #With path=None events are only kept in memory. The file is opened for appending and
+    #every event is one write, so processes forked after start() (e.g. the measurements
+    #of benchmark.py) add whole lines to it; their events are not in the memory of this one
+    global enabled, trace_path, trace_fd
+    enabled = True
+    trace_path = path
+    trace_fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_APPEND) if path is not None else None
+    events.clear()
+
+def emit(event):
+
+    with lock:
+        events.append(event)
+
+        if trace_fd is not None:
+            os.write(trace_fd, (json.dumps(event) + '\n').encode())
+
+def tags():
+
+    #Metric and graphs of the innermost open span
+    open_spans = spans.get()
+
+    if not open_spans:
+        return {'metric': None, 'graph': None, 'graph2': None}
+
+    return {name: open_spans[-1][name] for name in ['metric', 'graph', 'graph2']}
+
+#-----------------------------------------------------------------------------
+
+#! Metric spans
+
+@contextmanager
+def span(metric, graph= None, graph2= None):
+
+    #Wall time of a metric, split into time spent waiting on the endpoint and time spent
+    #in Python. Requests count for every span they are nested in
+    if not enabled:
+        yield
+        return
+
+    current = {'metric': metric, 'graph': graph, 'graph2': graph2, 'query_s': 0.0, 'queries': 0}
+    token = spans.set(spans.get() + (current,))
+    start = time.perf_counter()
+
+    try:
+        yield
+    finally:
+        spans.reset(token)
+        wall = time.perf_counter() - start
+
+        emit({'event': 'metric', 'metric': metric, 'graph': graph, 'graph2': graph2, 'time': time.time(),
+              'wall_s': wall, 'query_s': current['query_s'], 'python_s': wall - current['query_s'],
+              'queries': current['queries']})
+
+#-----------------------------------------------------------------------------
+
+#! Endpoint requests
+
+class CountingReader(io.RawIOBase):
+    '''
+    Reads through an HTTP response and counts the bytes received
+    '''
+
+    def __init__(self, response):
+        self.response = response
+        self.bytes = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        n = self.response.readinto(buffer)
+        self.bytes += n or 0
+
+        return n
+
+class CountedResponse(io.BufferedReader):
+    '''
+    Buffered counting reader that still answers info(), geturl() and getcode() of the
+    response, which SPARQLWrapper's convert() asks for
+    '''
+
+    def __init__(self, response):
+        self.original = response
+        self.counter = CountingReader(response)
+        super().__init__(self.counter)
+
+    def __getattr__(self, name):
+        return getattr(self.original, name)
+
+class Request:
+    '''
+    One request to the endpoint. Server time is the time until the response headers
+    arrive; the rest of the wall time is download and parsing. Failed requests are
+    recorded with the name of their error, retries count towards the wall time
+    '''
+
+    def __init__(self, query):
+        self.query = ' '.join(query.split())[:120]
+        self.tags = tags()
+        self.start = time.perf_counter()
+        self.server_s = None
+        self.response = None
+        self.rows = 0
+        self.finished = False
+
+    def opened(self, response):
+
+        #Returns the response to read from instead of the original one
+        self.server_s = time.perf_counter() - self.start
+        self.response = CountedResponse(response)
+
+        return self.response
+
+    def finish(self, rows= None, error= None):
+
+        if self.finished:
+            return
+        self.finished = True
+
+        wall = time.perf_counter() - self.start
+
+        if rows is not None:
+            self.rows = rows
+
+        for open_span in spans.get():
+            open_span['query_s'] += wall
+            open_span['queries'] += 1
+
+        emit(dict(self.tags, event= 'query', query= self.query, time= time.time(), wall_s= wall,
+                  server_s= self.server_s, bytes= self.response.counter.bytes if self.response is not None else 0,
+                  rows= self.rows, error= error))
+
+def retry(error, attempt, delay):
+
+    #A failed request that is sent again after delay seconds
+    if enabled:
+        emit(dict(tags(), event= 'retry', error= error, attempt= attempt, delay_s= delay, time= time.time()))
+
+def count_rows(rows, request):
+
+    #Passes streamed rows through and finishes the request when they are used up
+    n = 0
+    error = None
+
+    try:
+        for row in rows:
+            n += 1
+            yield row
+    except Exception as e:
+        error = type(e).__name__
+        raise
+    finally:
+        request.finish(n, error)
+
+#-----------------------------------------------------------------------------
+
+#! Summary
+
+def read_events(path):
+
+    #A process killed while writing (a timed out measurement) may leave a torn line
+    events = []
+
+    with open(path) as trace:
+        for line in trace:
+            try:
+                events.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+
+    return events
+
+def summary(path= None):
+
+    #Per metric: spans with their wall, endpoint and Python time, and the requests made
+    #inside them. Requests outside any span are listed under '(none)'. Events are read
+    #from the trace file at path, or taken from memory
+    table = pd.DataFrame(read_events(path) if path is not None else events, columns= ['event', 'metric', 'wall_s', 'query_s', 'python_s',
+                                           'server_s', 'bytes', 'rows', 'error'])
+    table['metric'] = table['metric'].fillna('(none)')
+
+    metrics = table[table['event'] == 'metric'].groupby('metric').agg(
+        spans= ('wall_s', 'size'), wall_s= ('wall_s', 'sum'), query_s= ('query_s', 'sum'), python_s= ('python_s', 'sum'))
+    queries = table[table['event'] == 'query'].groupby('metric').agg(
+        queries= ('wall_s', 'size'), errors= ('error', 'count'), server_s= ('server_s', 'sum'),
+        bytes= ('bytes', 'sum'), rows= ('rows', 'sum'))
+    retries = table[table['event'] == 'retry'].groupby('metric').size().rename('retries')
+
+    return metrics.join(queries, how= 'outer').join(retries).fillna({'retries': 0}).sort_values('wall_s', ascending= False)
+
+def stop(summary_file= None):
+
+    #Ends the run and prints the summary table, optionally also written as CSV
+    global enabled, trace_fd
+    enabled = False
+
+    if trace_fd is not None:
+        os.close(trace_fd)
+        trace_fd = None
+
+    table = summary(trace_path)
+    print(table.to_string())
+
+    if summary_file is not None:
+        table.to_csv(summary_file)
+
+    return table
@@ -83,10 +83,35 @@ def quality_plots(file_path, name):
 #Then we want to plot the growth of the ontology and the ratio of external ontologies used
 #Therefore, we need to take in the data and clean it first
 
+def version_label(label):
+
+    #Version columns of the compact form are read back as strings
+    try:
+        return int(label)
+    except ValueError:
+        return label
+
 def ont_prepare(path):
     
     df = pd.read_csv(path, delimiter=';')
 
+    #Compact form (queries.ipcr_presence): a row per IRI and a flag column per version,
+    #1 = in the graph, 2 = in the ontology, 3 = both, empty without an ontology
+    if 'ID' in df.columns:
+        flags = df.drop(columns= 'ID').to_numpy(dtype= float)
+        missing = np.isnan(flags).all(axis= 0)
+
+        def count(mask):
+            counts = mask.sum(axis= 0).astype(float)
+            counts[missing] = np.nan
+            return counts
+
+        df = pd.DataFrame({'Version': [version_label(c) for c in df.columns if c != 'ID'],
+                           'len(Graph - Ont check)': count(flags == 1),
+                           'Graph set lenght': count(flags % 2 == 1),
+                           'Ont set lenght': count(flags >= 2),
+                           'Graph - Ont check': None, 'Ont - Graph check': None, 'len(Ont - Graph check)': None})
+
     df['external'] = df['len(Graph - Ont check)']/df['Graph set lenght']
     df = df.drop(['Graph - Ont check', 'Ont - Graph check', 'len(Ont - Graph check)'], axis = 1)
     df = df.rename(columns = {'len(Graph - Ont check)' : 'ex_set', 'Graph set lenght' : 'graph_set', 'Ont set lenght' : 'ont_set' })
@@ -209,4 +234,22 @@ def top_trends(file_path, file_path2, company, type, loc= 'upper left', defined=
     plt.grid(axis='both', color='0.85')
 
     plt.xticks(np.arange(0, len(df['Version'].unique())+1, 1))
-    
\ No newline at end of file
+    
+#-------------------------------------------------------------------------------------------------------
+
+#! Heatmap of an all-pairs comparison matrix (comparison.comparison_matrix), old version as row
+
+def comparison_heatmap(file_path, title, output_file_name= None, legend_mapping= legend_mapping,
+                       save_image= False, show_plot= False):
+
+    df = pd.read_csv(file_path, index_col= 0)
+    parameter = file_path.rsplit('_', 1)[-1].removesuffix('.csv')
+
+    sns.heatmap(df, cmap= 'viridis', square= True, annot= len(df) <= 12, fmt= '.2f',
+                cbar_kws= {'label': legend_mapping.get(parameter, parameter)})
+
+    plt.xlabel('New version')
+    plt.ylabel('Old version')
+    plt.title(title)
+    if save_image: plt.savefig(output_file_name, dpi=300, bbox_inches='tight')
+    if show_plot: plt.show()